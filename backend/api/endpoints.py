@@ -1,13 +1,55 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
 import asyncio
-from services.chroma import test_upsert, test_get, search_documents
+import logging
+import time
+from services.timing import TRACING_ENABLED, record_stages, server_timing_header, stage, trace, recent_traces
+from services.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, render_metrics
+from services.chroma import (
+    test_upsert, test_get, search_documents, rebuild_quantized_index, delete_page_subtree,
+    rebuild_cluster_index, get_cluster_summary, get_cluster_members,
+    rebuild_page_vector_index, get_related_chunks, get_related_to_page, get_related_pages
+)
+from services.page_index import get_page_index
+from services.jobs import get_job_registry
+from services.webhooks import NOTION_WEBHOOK_SECRET, get_page_sync_queue, handle_webhook, run_page_syncs
+from services.embedding import close_embedding_pool
+from services.clustering import CLUSTER_COUNT
 from seed_database import seed_database, clear_database
-from services.notion import process_page, process_page_and_insert_to_chromadb
+from services.notion import (
+    process_page, process_page_and_insert_to_chromadb, process_workspace_and_insert_to_chromadb, refresh_page_title,
+    sync_page_to_chromadb, close_http_client
+)
+import services.chroma as chroma
+
+logger = logging.getLogger(__name__)
+
+def warm_up():
+    """Loads the query embedding model, so the first search doesn't pay for it."""
+    try:
+        chroma.embedding_function(["warm up"])
+    except Exception as e:
+        logger.warning(f"Could not load the query embedding model at startup: {e}")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process once it has started, so each worker loads
+    # its own model and opens its own connections
+    await asyncio.get_running_loop().run_in_executor(None, warm_up)
+    # Re-ingests pages that webhook events queued (in any worker)
+    page_syncs = asyncio.create_task(run_page_syncs(sync_page_to_chromadb)) if NOTION_WEBHOOK_SECRET else None
+    yield
+    if page_syncs is not None:
+        page_syncs.cancel()
+    await close_http_client()
+    close_embedding_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -18,9 +60,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Scraped periodically; tracing them would push ingest traces out of the buffer
+UNTRACED_PATHS = {"/metrics", "/traces"}
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """
+    Traces each request, records its latency, and reports the stages timed
+    while handling it in a Server-Timing header.
+    """
+    if request.url.path in UNTRACED_PATHS:
+        return await call_next(request)
+    start = time.perf_counter()
+    with record_stages() as timings, trace(f"{request.method} {request.url.path}") as request_span:
+        response = await call_next(request)
+        if request_span is not None:
+            request_span.attributes["status"] = response.status_code
+    # Label by route template rather than raw path to keep the number of series bounded
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code)
+    )
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
 class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = 5
+    diversity: Optional[float] = 0.0
+    max_per_page: Optional[int] = None
+    quantization: Optional[str] = None
+    within_page_id: Optional[str] = None
 
 class ProcessPageRequest(BaseModel):
     page_id: str
@@ -34,21 +108,95 @@ def get_root():
     return test_get()
 
 @app.get("/documents")
-def search_documents_endpoint(query: str, top_k: Optional[int] = 5):
+def search_documents_endpoint(
+    query: str,
+    top_k: Optional[int] = 5,
+    diversity: Optional[float] = 0.0,
+    max_per_page: Optional[int] = None,
+    quantization: Optional[str] = None,
+    within_page_id: Optional[str] = None
+):
     """
     Search for documents in ChromaDB based on a user query.
     
     Args:
         query: Search query string from URL parameters
         top_k: Optional number of results to return (default: 5)
+        diversity: Optional 0.0-1.0 trade-off between relevance and variety (default: 0.0)
+        max_per_page: Optional maximum number of results from the same Notion page
+        quantization: Optional "int8" or "binary" to search the quantized index
+        within_page_id: Optional Notion page ID to search only that page and its subpages
     
     Returns:
         JSON response with matching documents and metadata
     """
-    print("hit")
-    results = search_documents(query, top_k)
-    print(results)
-    return results
+    results = search_documents(
+        query, top_k, diversity=diversity, max_per_page=max_per_page, quantization=quantization,
+        within_page_id=within_page_id
+    )
+    with stage("serialize"):
+        return JSONResponse(content=jsonable_encoder(results))
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus metrics for this process: Notion requests, crawling, chunking,
+    embedding, Chroma latency and cache lookups
+    """
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/traces")
+def traces_endpoint(limit: int = 20):
+    """
+    Most recent request and ingest traces (requires TRACING_ENABLED=true)
+    """
+    return {"tracing_enabled": TRACING_ENABLED, "traces": recent_traces(limit)}
+
+@app.get("/jobs")
+def list_jobs_endpoint(limit: int = 20):
+    """
+    Most recent ingest jobs of every API worker, with their status
+    (waiting, running, succeeded, failed, rejected or abandoned)
+    """
+    return {"success": True, "jobs": get_job_registry().recent(limit)}
+
+@app.get("/jobs/{job_id}")
+def get_job_endpoint(job_id: str):
+    """
+    Status of one ingest job (job_id is returned by the ingest endpoints)
+    """
+    job = get_job_registry().get(job_id)
+    if job is None:
+        return {"success": False, "message": f"Job {job_id} not found", "job_id": job_id}
+    return {"success": True, "job": job}
+
+@app.post("/webhooks/notion")
+async def notion_webhook_endpoint(request: Request):
+    """
+    Receives Notion webhook events (signed with NOTION_WEBHOOK_SECRET). Each
+    changed page is queued and re-ingested on its own once its edits settle,
+    so a burst of edits costs one sync. The subscription's one-time
+    verification request is logged, so its token can be configured.
+    """
+    result, status_code = handle_webhook(await request.body(), request.headers.get("X-Notion-Signature", ""))
+    return JSONResponse(status_code=status_code, content=result)
+
+@app.get("/page-syncs")
+def list_page_syncs_endpoint(limit: int = 100):
+    """
+    Pages queued by webhook events that have not been synced yet, oldest first
+    """
+    return {"success": True, "pages": get_page_sync_queue().pending(limit)}
+
+@app.post("/pages/{page_id}/sync")
+async def sync_page_endpoint(page_id: str):
+    """
+    Re-ingest a single page now, without its subpages, embedding only changed chunks.
+    
+    Args:
+        page_id: The Notion page ID
+    """
+    return await sync_page_to_chromadb(page_id)
 
 @app.post("/seed")
 def seed_database_endpoint():
@@ -57,6 +205,51 @@ def seed_database_endpoint():
     """
     return seed_database()
 
+@app.post("/quantized-index")
+def rebuild_quantized_index_endpoint(mode: str = "int8"):
+    """
+    Build the quantized embedding index used by /documents?quantization=...
+    
+    Args:
+        mode: "int8" or "binary" (default: "int8")
+    """
+    return rebuild_quantized_index(mode)
+
+@app.post("/clusters")
+def rebuild_cluster_index_endpoint(cluster_count: int = CLUSTER_COUNT):
+    """
+    Cluster the stored embeddings for the graph view. Later inserts and
+    deletes update the clusters incrementally.
+    
+    Args:
+        cluster_count: Number of clusters (default: CLUSTER_COUNT)
+    """
+    return rebuild_cluster_index(cluster_count)
+
+@app.get("/clusters")
+def get_clusters_endpoint(representatives: int = 3, neighbors: int = 3):
+    """
+    Clustered summary of the collection: one node per cluster with its size,
+    most central chunks and nearest clusters.
+    
+    Args:
+        representatives: Number of central chunks per cluster (default: 3)
+        neighbors: Number of nearest clusters per cluster (default: 3)
+    """
+    return get_cluster_summary(representatives, neighbors)
+
+@app.get("/clusters/{cluster_id}")
+def get_cluster_members_endpoint(cluster_id: int, limit: int = 50, offset: int = 0):
+    """
+    Chunks of one cluster, most central first, for expanding it in the graph view.
+    
+    Args:
+        cluster_id: Cluster ID from GET /clusters
+        limit: Maximum number of chunks to return (default: 50)
+        offset: Number of chunks to skip (default: 0)
+    """
+    return get_cluster_members(cluster_id, limit, offset)
+
 @app.delete("/clear")
 def clear_database_endpoint():
     """
@@ -64,6 +257,82 @@ def clear_database_endpoint():
     """
     return clear_database()
 
+@app.get("/pages/{page_id}")
+def get_page_endpoint(page_id: str):
+    """
+    Look up a page in the page index, with its ancestors and subtree size.
+    
+    Args:
+        page_id: The Notion page ID
+    """
+    page_index = get_page_index()
+    page = page_index.get(page_id)
+    if page is None:
+        return {"success": False, "message": f"Page {page_id} is not in the page index", "page_id": page_id}
+    subtree = page_index.descendants(page_id, include_self=False)
+    return {
+        "success": True,
+        "page": page,
+        "ancestors": page_index.ancestors(page_id, include_self=False),
+        "descendants_count": len(subtree)
+    }
+
+@app.delete("/pages/{page_id}")
+def delete_page_endpoint(page_id: str):
+    """
+    Delete the chunks of a page and every page below it.
+    
+    Args:
+        page_id: The Notion page ID at the root of the subtree
+    """
+    return delete_page_subtree(page_id)
+
+@app.get("/pages/{page_id}/related")
+def get_related_to_page_endpoint(page_id: str, top_k: int = 5, level: str = "chunks"):
+    """
+    Notes related to a page, from other pages, using the page's stored embeddings.
+    
+    Args:
+        page_id: The Notion page ID
+        top_k: Number of results to return (default: 5)
+        level: "chunks" for related chunks or "pages" for related pages (default: "chunks")
+    """
+    if level == "pages":
+        return get_related_pages(page_id, top_k)
+    if level != "chunks":
+        return {"success": False, "message": f"Unknown level '{level}', expected 'chunks' or 'pages'", "results": []}
+    return get_related_to_page(page_id, top_k)
+
+@app.post("/page-vectors")
+def rebuild_page_vector_index_endpoint():
+    """
+    Precompute every page's mean chunk embedding, used by /pages/{page_id}/related
+    """
+    return rebuild_page_vector_index()
+
+@app.get("/chunks/{chunk_id}/related")
+def get_related_chunks_endpoint(chunk_id: str, top_k: int = 5):
+    """
+    Chunks from other pages related to a stored chunk, using its stored
+    embedding instead of re-embedding its text.
+    
+    Args:
+        chunk_id: ID of the stored chunk
+        top_k: Number of related chunks to return (default: 5)
+    """
+    return get_related_chunks(chunk_id, top_k)
+
+@app.post("/pages/{page_id}/refresh-title")
+async def refresh_page_title_endpoint(page_id: str):
+    """
+    Pick up a page rename from Notion and update the title paths of its
+    subtree's chunks without re-embedding them.
+    
+    Args:
+        page_id: The renamed Notion page ID
+    """
+    return await refresh_page_title(page_id)
+
 @app.post("/process-notion-page")
 async def process_notion_page_endpoint(request: ProcessPageRequest):
     """
@@ -73,20 +342,20 @@ async def process_notion_page_endpoint(request: ProcessPageRequest):
         request: ProcessPageRequest containing the Notion page ID
     
     Returns:
-        JSON response with processing status and extracted chunks
+        JSON response with processing status and the number of extracted chunks
     """
     try:
         # Initialize empty titles stack for the page hierarchy
         titles_stack = []
         
         # Process the page asynchronously
-        await process_page(request.page_id, titles_stack)
+        chunks_count = await process_page(request.page_id, titles_stack)
         
         return {
             "success": True,
             "message": f"Successfully processed Notion page {request.page_id}",
             "page_id": request.page_id,
-            "note": "Check the console/logs for detailed chunk information"
+            "chunks_count": chunks_count
         }
         
     except Exception as e:
@@ -120,4 +389,22 @@ async def process_and_insert_notion_page_endpoint(request: ProcessPageRequest):
             "message": f"Error processing and inserting Notion page {request.page_id}: {str(e)}",
             "page_id": request.page_id,
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+@app.post("/process-and-insert-notion-workspace")
+async def process_and_insert_notion_workspace_endpoint():
+    """
+    Ingest every page shared with the Notion integration and insert all chunks into ChromaDB.
+    
+    Returns:
+        JSON response with processing and insertion results
+    """
+    try:
+        return await process_workspace_and_insert_to_chromadb()
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error processing and inserting Notion workspace: {str(e)}",
+            "error": str(e)
+        }
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Embedding throughput benchmark for the local embedding pool.
+Embeds synthetic note-like text of varied lengths with and without length
+bucketing, for each requested worker count.
+
+Usage (from backend/):
+    python -m benchmarks.embedding_throughput --texts 2000 --workers 1 2 4
+"""
+
+import argparse
+import random
+from services.embedding import EmbeddingPool
+
+WORDS = (
+    "notion page heading paragraph embedding vector chroma search graph note "
+    "hyrax baltimore lecture summary todo project meeting research idea draft "
+    "python database query result chunk token model semantic similarity cluster"
+).split()
+
+def synthetic_texts(count: int, seed: int = 0):
+    """Chunk-like texts: a title/heading prefix plus a body with a long-tailed length."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        prefix = f"# {rng.choice(WORDS).title()}\n\n## {rng.choice(WORDS).title()}\n\n"
+        body_words = min(200, int(rng.expovariate(1 / 30)) + 3)
+        texts.append(prefix + " ".join(rng.choice(WORDS) for _ in range(body_words)))
+    return texts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=1000, help="number of synthetic texts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="worker counts to try")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.texts)
+    print(f"{'workers':>7} {'bucketed':>8} {'emb/s':>9} {'util':>6} {'batches':>7} {'seconds':>8}")
+    for workers in args.workers:
+        with EmbeddingPool(workers=workers, batch_size=args.batch_size) as pool:
+            # Warm up so model loading isn't counted
+            pool.embed(texts[:args.batch_size * workers])
+            for bucket in (False, True):
+                pool.bucket = bucket
+                _, stats = pool.embed(texts)
+                print(
+                    f"{workers:>7} {str(bucket):>8} {stats['embeddings_per_second']:>9.1f} "
+                    f"{stats['batch_utilization']:>6.1%} {stats['batches']:>7} {stats['elapsed_seconds']:>8.2f}"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Block extraction throughput over recorded Notion block-children responses
+(benchmarks/fixtures/block_children.json). The fixture page is replicated to
+the requested size and extracted with services.notion_extract.extract_blocks.
+
+Usage (from backend/):
+    python -m benchmarks.extract_throughput --blocks 100000
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+from services.notion_extract import extract_blocks, format_table
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "block_children.json")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=50000, help="approximate number of blocks to extract")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(FIXTURES_PATH) as f:
+        fixtures = json.load(f)
+    page = fixtures["page_children"]["results"]
+    table_rows = fixtures["table_children"]["results"]
+
+    copies = max(1, args.blocks // len(page))
+    results = [copy.deepcopy(block) for _ in range(copies) for block in page]
+    payload_bytes = len(json.dumps(results).encode())
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        entries, errors = extract_blocks(results)
+        best = min(best, time.perf_counter() - start)
+
+    table = next(block for block in page if block["type"] == "table")["table"]
+    start = time.perf_counter()
+    for _ in range(copies):
+        format_table(table, table_rows)
+    table_seconds = time.perf_counter() - start
+
+    print(f"blocks: {len(results)} ({payload_bytes / 2**20:.1f} MiB of JSON), entries: {len(entries)}, errors: {len(errors)}")
+    print(f"extract_blocks: {best * 1000:.1f} ms best of {args.repeat}, {len(results) / best:,.0f} blocks/s, {payload_bytes / best / 2**20:.1f} MiB/s")
+    print(f"format_table:   {copies / table_seconds:,.0f} tables/s ({len(table_rows)} rows each)")
+    if errors:
+        print(f"sample error record: {errors[0]}")
+
+if __name__ == "__main__":
+    main()
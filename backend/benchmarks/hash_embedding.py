@@ -0,0 +1,40 @@
+"""
+Deterministic feature-hashing embedder with MiniLM's output shape.
+
+The benchmarks use it with --hash-embeddings to take model inference out of
+the measurement, so regressions in crawling, chunking, inserting or searching
+are not hidden behind embedding time.
+"""
+
+import zlib
+import numpy as np
+from typing import List, Sequence
+
+EMBEDDING_DIM = 384
+
+class HashEmbedding:
+    """Callable like a Chroma embedding function: list of texts -> list of vectors."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def __call__(self, input: Sequence[str]) -> List[np.ndarray]:
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for word in text.lower().split():
+                digest = zlib.crc32(word.encode())
+                vectors[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return list(vectors / norms)
+
+def use_hash_embeddings():
+    """Routes ingest embedding (services.embedding) and query embedding (services.chroma) through HashEmbedding in-process."""
+    import services.chroma as chroma
+    import services.embedding as embedding
+
+    embedding._worker_model = HashEmbedding()
+    embedding._shared_pool = embedding.EmbeddingPool(workers=1)
+    chroma.embedding_function = embedding._worker_model
+    # Keep hashed query vectors apart from the model's in the query cache
+    chroma.EMBEDDING_MODEL_NAME = "hash-embedding"
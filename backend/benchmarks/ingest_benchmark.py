@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+End-to-end ingest benchmark. Generates a synthetic Notion workspace, serves it
+from a local mock of the Notion API and runs process_page_and_insert_to_chromadb
+against an in-process Chroma collection.
+
+Reports pages/sec, chunks/sec, Notion request counts (including injected 429s)
+and peak memory.
+
+Usage (from backend/):
+    python -m benchmarks.ingest_benchmark --fanout 4 --depth 3 --blocks 40 --latency-ms 20 --rate-limit 0.02
+    python -m benchmarks.ingest_benchmark --hash-embeddings   # exclude model inference
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from benchmarks.mock_notion import MockNotionServer, SyntheticWorkspace
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fanout", type=int, default=3, help="child pages per page")
+    parser.add_argument("--depth", type=int, default=3, help="levels of pages, including the root")
+    parser.add_argument("--blocks", type=int, default=30, help="top-level blocks per page")
+    parser.add_argument("--nesting", type=int, default=1, help="maximum depth of nested (toggle) blocks")
+    parser.add_argument("--nested-fraction", type=float, default=0.1, help="fraction of blocks that hold nested blocks")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency added to every mock response")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="probability of answering a request with 429")
+    parser.add_argument("--hash-embeddings", action="store_true", help="use a hashing embedder instead of MiniLM")
+    args = parser.parse_args()
+
+    workspace = SyntheticWorkspace(
+        fanout=args.fanout, depth=args.depth, blocks_per_page=args.blocks,
+        nesting=args.nesting, nested_fraction=args.nested_fraction
+    )
+    with MockNotionServer(workspace, latency=args.latency_ms / 1000, rate_limit_probability=args.rate_limit) as server:
+        # services.notion reads its configuration at import time
+        os.environ.update({
+            "NOTION_BASE": server.base_url,
+            "NOTION_SECRET": "benchmark",
+            "NOTION_VERSION": "2022-06-28",
+            "CHROMADB_CLIENT": "ephemeral",
+            "NOTION_RETRY_BACKOFF": "0.01",
+        })
+        from services.notion import process_page_and_insert_to_chromadb
+        # Imported lazily by the ingest path; load them (and the tokenizer) before timing
+        import services.chroma # noqa: F401
+        import services.embedding # noqa: F401
+        if args.hash_embeddings:
+            from benchmarks.hash_embedding import use_hash_embeddings
+            use_hash_embeddings()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = asyncio.run(process_page_and_insert_to_chromadb(workspace.root_id))
+        elapsed = time.perf_counter() - start
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    if not result.get("success"):
+        print(f"Ingest failed: {result.get('message')}", file=sys.stderr)
+        sys.exit(1)
+
+    pages = len(workspace.pages)
+    chunks = result["chunks_count"]
+    counts = server.request_counts
+    max_rss_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux
+
+    print(f"workspace: {pages} pages, {len(workspace.blocks)} blocks (fanout {args.fanout}, depth {args.depth}, nesting {args.nesting})")
+    print(f"elapsed:   {elapsed:.2f}s")
+    print(f"pages/s:   {pages / elapsed:.1f}")
+    print(f"chunks/s:  {chunks / elapsed:.1f} ({chunks} chunks)")
+    print(f"requests:  {sum(n for route, n in counts.items() if route != '429')} total, " +
+          ", ".join(f"{route}={n}" for route, n in sorted(counts.items())))
+    print(f"memory:    peak traced {peak_traced / 2**20:.1f} MiB, max RSS {max_rss_mib:.1f} MiB")
+    embedding = result.get("embedding")
+    if embedding:
+        print(f"embedding: {embedding['embeddings_per_second']:.1f}/s, batch utilization {embedding['batch_utilization']:.0%}")
+
+if __name__ == "__main__":
+    main()
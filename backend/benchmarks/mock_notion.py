@@ -0,0 +1,217 @@
+"""
+Synthetic Notion workspaces served from a local mock of the Notion API.
+
+The mock implements the endpoints the ingest pipeline uses:
+GET /v1/pages/{id}, GET /v1/blocks/{id}, GET /v1/blocks/{id}/children (paginated)
+and POST /v1/search. Latency and 429 rate limiting can be injected, and every
+request is counted per route.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+TIMESTAMP = "2025-01-01T00:00:00.000Z"
+WORDS = (
+    "notion note idea graph embedding vector search chunk page heading summary "
+    "lecture research project draft meeting hyrax baltimore python database model"
+).split()
+
+def _rich_text(text: str) -> List[Dict[str, Any]]:
+    return [{"type": "text", "text": {"content": text, "link": None}, "plain_text": text, "href": None}]
+
+class SyntheticWorkspace:
+    """
+    A tree of pages: each page has `fanout` child pages down to `depth` levels,
+    `blocks_per_page` top-level blocks, and a `nested_fraction` of toggle blocks
+    that hold further blocks down to `nesting` levels.
+    """
+
+    def __init__(
+        self,
+        fanout: int = 3,
+        depth: int = 3,
+        blocks_per_page: int = 30,
+        nesting: int = 1,
+        nested_fraction: float = 0.1,
+        words_per_block: int = 25,
+        seed: int = 0
+    ):
+        self.rng = random.Random(seed)
+        self.blocks_per_page = blocks_per_page
+        self.nesting = nesting
+        self.nested_fraction = nested_fraction
+        self.words_per_block = words_per_block
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self.blocks: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[str, List[Dict[str, Any]]] = {}
+        self._next_id = 0
+        self.root_id = self._add_page(None, depth, fanout)
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        raw = f"{self._next_id:032x}"
+        return f"{raw[:8]}-{raw[8:12]}-{raw[12:16]}-{raw[16:20]}-{raw[20:]}"
+
+    def _text(self) -> str:
+        count = max(1, int(self.rng.expovariate(1 / self.words_per_block)))
+        return " ".join(self.rng.choice(WORDS) for _ in range(count))
+
+    def _block(self, block_type: str, parent_id: str, payload: Dict[str, Any], has_children: bool = False) -> Dict[str, Any]:
+        block = {
+            "object": "block", "id": self._new_id(), "type": block_type, block_type: payload,
+            "parent": {"type": "page_id", "page_id": parent_id}, "has_children": has_children,
+            "created_time": TIMESTAMP, "last_edited_time": TIMESTAMP, "archived": False,
+        }
+        self.blocks[block["id"]] = block
+        return block
+
+    def _content_blocks(self, parent_id: str, count: int, nesting_left: int) -> List[Dict[str, Any]]:
+        blocks = []
+        for i in range(count):
+            if i % 10 == 0:
+                blocks.append(self._block(f"heading_{1 + (i // 10) % 3}", parent_id, {"rich_text": _rich_text(self._text())}))
+            elif nesting_left > 0 and self.rng.random() < self.nested_fraction:
+                toggle = self._block("toggle", parent_id, {"rich_text": _rich_text(self._text())}, has_children=True)
+                self.children[toggle["id"]] = self._content_blocks(toggle["id"], 3, nesting_left - 1)
+                blocks.append(toggle)
+            else:
+                block_type = self.rng.choice(["paragraph", "paragraph", "bulleted_list_item", "numbered_list_item", "quote"])
+                blocks.append(self._block(block_type, parent_id, {"rich_text": _rich_text(self._text())}))
+        return blocks
+
+    def _add_page(self, parent_id: Optional[str], depth: int, fanout: int) -> str:
+        page_id = self._new_id()
+        title = f"{self.rng.choice(WORDS).title()} {len(self.pages)}"
+        self.pages[page_id] = {
+            "object": "page", "id": page_id, "created_time": TIMESTAMP, "last_edited_time": TIMESTAMP,
+            "parent": {"type": "page_id", "page_id": parent_id} if parent_id else {"type": "workspace", "workspace": True},
+            "properties": {"title": {"id": "title", "type": "title", "title": _rich_text(title)}},
+        }
+        blocks = self._content_blocks(page_id, self.blocks_per_page, self.nesting)
+        if depth > 1:
+            for _ in range(fanout):
+                child_id = self._add_page(page_id, depth - 1, fanout)
+                child_title = self.pages[child_id]["properties"]["title"]["title"][0]["plain_text"]
+                child_block = {
+                    "object": "block", "id": child_id, "type": "child_page", "child_page": {"title": child_title},
+                    "has_children": True, "created_time": TIMESTAMP, "last_edited_time": TIMESTAMP,
+                }
+                blocks.append(child_block)
+        self.children[page_id] = blocks
+        return page_id
+
+class MockNotionServer:
+    """Serves a SyntheticWorkspace over HTTP on 127.0.0.1 from a background thread."""
+
+    def __init__(
+        self,
+        workspace: SyntheticWorkspace,
+        latency: float = 0.0,
+        rate_limit_probability: float = 0.0,
+        retry_after: float = 0.0,
+        page_size: int = 100,
+        seed: int = 0
+    ):
+        self.workspace = workspace
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.request_counts: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockNotionServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, route: str) -> bool:
+        """Counts a request; returns True if it should be rate limited."""
+        with self._lock:
+            self.request_counts[route] += 1
+            limited = self._rng.random() < self.rate_limit_probability
+            if limited:
+                self.request_counts["429"] += 1
+            return limited
+
+    def _route(self, method: str, path: str, query: Dict[str, List[str]]):
+        """Returns (route name, status, body)."""
+        parts = path.strip("/").split("/")
+        ws = self.workspace
+        if method == "GET" and parts[:2] == ["v1", "pages"] and len(parts) == 3:
+            page = ws.pages.get(parts[2])
+            return "pages", (200, page) if page else (404, {"object": "error", "code": "object_not_found"})
+        if method == "GET" and parts[:2] == ["v1", "blocks"] and len(parts) == 4 and parts[3] == "children":
+            children = ws.children.get(parts[2], [])
+            start = int(query.get("start_cursor", ["0"])[0])
+            size = min(int(query.get("page_size", [self.page_size])[0]), self.page_size)
+            end = start + size
+            return "blocks_children", (200, {
+                "object": "list", "results": children[start:end],
+                "has_more": end < len(children), "next_cursor": str(end) if end < len(children) else None,
+            })
+        if method == "GET" and parts[:2] == ["v1", "blocks"] and len(parts) == 3:
+            block = ws.blocks.get(parts[2])
+            return "blocks", (200, block) if block else (404, {"object": "error", "code": "object_not_found"})
+        if method == "POST" and parts == ["v1", "search"]:
+            return "search", (200, {"object": "list", "results": list(ws.pages.values()), "has_more": False, "next_cursor": None})
+        return "unknown", (404, {"object": "error", "code": "invalid_request_url"})
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, method: str):
+                url = urlparse(self.path)
+                if method == "POST":
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                route, (status, body) = server._route(method, url.path, parse_qs(url.query))
+                if server.latency:
+                    time.sleep(server.latency)
+                headers = {}
+                if server._count(route):
+                    status, body = 429, {"object": "error", "code": "rate_limited"}
+                    headers["Retry-After"] = str(server.retry_after)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Memory, recall and latency of quantized candidate generation + full-precision
+rescoring, compared with the float path search_documents uses today (a Chroma
+HNSW query over float32 embeddings).
+
+Vectors are synthetic: normalized 384-dim points drawn around random topic
+centroids, with queries perturbed from stored points. Ground truth is exact
+cosine search. Rescoring reads the candidates' embeddings back from the
+collection, as search_documents does, so its latency includes that fetch.
+
+Usage (from backend/):
+    python -m benchmarks.quantization_recall --vectors 50000 --queries 200
+"""
+
+import argparse
+import time
+import numpy as np
+import chromadb
+from services.quantization import QuantizedIndex
+from services.ranking import normalize_rows
+
+def synthetic_embeddings(count: int, dim: int, topics: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = normalize_rows(rng.standard_normal((topics, dim)))
+    assignments = rng.integers(0, topics, count)
+    return normalize_rows(centroids[assignments] + 0.6 * rng.standard_normal((count, dim)) / np.sqrt(dim) * 4)
+
+def recall_at_k(found, truth) -> float:
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_embeddings(args.vectors, args.dim, args.topics, rng)
+    ids = np.array([f"chunk-{i}" for i in range(args.vectors)], dtype=object)
+    queries = normalize_rows(vectors[rng.integers(0, args.vectors, args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim)))
+    k = args.top_k
+
+    def exact(query):
+        scores = vectors @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        return ids[top[np.argsort(-scores[top])]].tolist()
+
+    truth, float_ms = timed(exact, queries)
+    rows = [("float32 brute force", vectors.nbytes, 1.0, float_ms)]
+
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(name="quantization_benchmark")
+    for start in range(0, args.vectors, 5000):
+        collection.add(ids=ids[start:start + 5000].tolist(), embeddings=vectors[start:start + 5000])
+    found, chroma_ms = timed(
+        lambda q: collection.query(query_embeddings=[q], n_results=k, include=[])["ids"][0], queries
+    )
+    rows.append(("chroma hnsw (float32)", vectors.nbytes, recall_at_k(found, truth), chroma_ms))
+
+    for mode in ("int8", "binary"):
+        index = QuantizedIndex(mode)
+        index.add(ids.tolist(), vectors)
+
+        def quantized_only(query, index=index):
+            return index.candidates(query, k)
+
+        def rescored(query, index=index):
+            # The full-precision vectors live in Chroma, not in memory
+            candidates = collection.get(ids=index.candidates(query, k * args.rescore_factor), include=["embeddings"])
+            candidate_vectors = np.asarray(candidates["embeddings"], dtype=np.float32)
+            order = np.argsort(-(candidate_vectors @ query))[:k]
+            return [candidates["ids"][i] for i in order]
+
+        found, ms = timed(quantized_only, queries)
+        rows.append((f"{mode} only", index.nbytes, recall_at_k(found, truth), ms))
+        found, ms = timed(rescored, queries)
+        rows.append((f"{mode} + rescore x{args.rescore_factor}", index.nbytes, recall_at_k(found, truth), ms))
+
+    print(f"{args.vectors} vectors x {args.dim} dims, {args.queries} queries, recall@{k}")
+    print(f"{'method':<28} {'MiB':>8} {'recall':>7} {'ms/query':>9}")
+    for name, nbytes, recall, ms in rows:
+        print(f"{name:<28} {nbytes / 2**20:>8.2f} {recall:>7.3f} {ms:>9.3f}")
+
+if __name__ == "__main__":
+    main()
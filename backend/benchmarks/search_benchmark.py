@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Search latency benchmark. Loads N synthetic chunks into an in-process Chroma
+collection, then replays a query mix against the FastAPI app at a configured
+concurrency and reports p50/p95/p99 latency.
+
+Each response carries a Server-Timing header with the time spent in embed,
+vector_search, rerank, parse_metadata and serialize; the remainder of the
+request (routing, validation, middleware, logging) is reported as "other".
+
+Usage (from backend/):
+    python -m benchmarks.search_benchmark --chunks 20000 --requests 1000 --concurrency 8
+    python -m benchmarks.search_benchmark --hash-embeddings --diversity-fraction 0.3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.mock_notion import WORDS
+
+STAGES = ("embed", "vector_search", "rerank", "parse_metadata", "serialize")
+LOAD_BATCH_SIZE = 1000
+
+def synthetic_chunks(count: int, chunks_per_page: int = 50, seed: int = 0) -> List[Dict]:
+    """Chunks shaped like apply_hierarchy_and_chunk output."""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        page = i // chunks_per_page
+        chunks.append({
+            "id": f"bench-{i}",
+            "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))),
+            "source_page_id": f"page-{page}",
+            "source_block_id": f"block-{i}",
+            "page_title_path": ["Benchmark", f"Section {page % 10}", f"Page {page}"],
+            "active_headings": [f"Heading {(i % chunks_per_page) // 10}"],
+            "block_type": "paragraph",
+            "order_within_page": i % chunks_per_page,
+            "last_updated": "2025-01-01T00:00:00.000Z",
+        })
+    return chunks
+
+def query_mix(count: int, diversity_fraction: float, top_k: int, seed: int = 1) -> List[Dict]:
+    """Short keyword queries, a fraction of them asking for diversified results."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        params = {"query": " ".join(rng.sample(WORDS, rng.randint(1, 4))), "top_k": top_k}
+        if rng.random() < diversity_fraction:
+            params.update({"diversity": 0.5, "max_per_page": 2})
+        queries.append(params)
+    return queries
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Server-Timing header -> {stage: seconds}."""
+    timings = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, duration = entry.partition(";dur=")
+        timings[name] = float(duration) / 1000
+    return timings
+
+async def replay(app, queries: List[Dict], concurrency: int):
+    """Returns per-request (latency seconds, stage timings) for every successful query."""
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    failures = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        async def run(params):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get("/documents", params=params)
+                latency = time.perf_counter() - start
+            if response.status_code != 200 or not response.json().get("success"):
+                failures += 1
+                return
+            samples.append((latency, parse_server_timing(response.headers.get("server-timing", ""))))
+
+        await asyncio.gather(*(run(params) for params in queries))
+    return samples, failures
+
+def percentiles(values) -> str:
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return f"p50 {p50:8.2f}  p95 {p95:8.2f}  p99 {p99:8.2f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="synthetic chunks to load")
+    parser.add_argument("--requests", type=int, default=500, help="queries to replay")
+    parser.add_argument("--concurrency", type=int, default=8, help="queries in flight at once")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--diversity-fraction", type=float, default=0.2, help="fraction of queries using MMR reranking")
+    parser.add_argument("--warmup", type=int, default=20, help="queries sent before measuring")
+    parser.add_argument("--hash-embeddings", action="store_true", help="use a hashing embedder instead of MiniLM")
+    args = parser.parse_args()
+
+    # api.endpoints imports the Notion service, which requires its configuration
+    os.environ.setdefault("NOTION_BASE", "http://127.0.0.1:9")
+    os.environ.setdefault("NOTION_SECRET", "benchmark")
+    os.environ.setdefault("NOTION_VERSION", "2022-06-28")
+    os.environ["CHROMADB_CLIENT"] = "ephemeral"
+    # Queries are replayed, so cached query embeddings would hide the embed stage
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+
+    from api.endpoints import app
+    logging.getLogger("httpx").setLevel(logging.WARNING) # one INFO line per request otherwise
+    from services.chroma import insert_notion_chunks
+    from services.embedding import get_embedding_pool
+    if args.hash_embeddings:
+        from benchmarks.hash_embedding import use_hash_embeddings
+        use_hash_embeddings()
+
+    chunks = synthetic_chunks(args.chunks)
+    start = time.perf_counter()
+    pool = get_embedding_pool()
+    for offset in range(0, len(chunks), LOAD_BATCH_SIZE):
+        batch = chunks[offset:offset + LOAD_BATCH_SIZE]
+        embeddings, _ = pool.embed([chunk["text"] for chunk in batch])
+        result = insert_notion_chunks(batch, embeddings=embeddings)
+        if not result.get("success"):
+            print(f"Loading chunks failed: {result.get('message')}", file=sys.stderr)
+            sys.exit(1)
+    print(f"loaded:      {len(chunks)} chunks in {time.perf_counter() - start:.1f}s")
+
+    queries = query_mix(args.warmup + args.requests, args.diversity_fraction, args.top_k)
+    # The endpoint prints every result set; keep that off the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(replay(app, queries[:args.warmup], args.concurrency))
+        start = time.perf_counter()
+        samples, failures = asyncio.run(replay(app, queries[args.warmup:], args.concurrency))
+        elapsed = time.perf_counter() - start
+
+    if not samples:
+        print("Every query failed", file=sys.stderr)
+        sys.exit(1)
+
+    latencies = [latency for latency, _ in samples]
+    by_stage = defaultdict(list)
+    for latency, timings in samples:
+        for name in STAGES:
+            by_stage[name].append(timings.get(name, 0.0))
+        by_stage["other"].append(max(latency - sum(timings.values()), 0.0))
+
+    print(f"requests:    {len(samples)} ok, {failures} failed, concurrency {args.concurrency}")
+    print(f"throughput:  {len(samples) / elapsed:.1f} queries/s")
+    print(f"latency:     {percentiles(latencies)}")
+    total = sum(latencies)
+    for name in STAGES + ("other",):
+        values = by_stage[name]
+        print(f"  {name:<14} {percentiles(values)}  ({sum(values) / total:5.1%} of request time)")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 import logging # For logging tokenizer loading
 from transformers import AutoTokenizer # Assuming HuggingFace tokenizer
+from chromadb.utils import embedding_functions
 
 logger = logging.getLogger(__name__) # Get logger for this module
 
@@ -12,14 +13,22 @@ load_dotenv()
 # --- ChromaDB Client ---
 CHROMADB_HOST = os.getenv("CHROMADB_HOST", "localhost")
 CHROMADB_PORT = int(os.getenv("CHROMADB_PORT", 8000))
-chroma_client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
+# "http" talks to the Chroma server; "ephemeral" runs an in-process, in-memory
+# store (used by the benchmarks so they don't need Docker)
+CHROMADB_CLIENT = os.getenv("CHROMADB_CLIENT", "http")
 
-try:
-    chroma_client.heartbeat()
-    logger.info(f"Connected to ChromaDB at {CHROMADB_HOST}:{CHROMADB_PORT}")
-except Exception as e:
-    logger.error(f"ERROR: Could not connect to ChromaDB at {CHROMADB_HOST}:{CHROMADB_PORT}. Is Docker running? {e}", exc_info=True)
-    # Consider raising here or having a robust retry mechanism
+if CHROMADB_CLIENT == "ephemeral":
+    chroma_client = chromadb.EphemeralClient()
+    logger.info("Using in-process ephemeral ChromaDB")
+else:
+    chroma_client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
+
+    try:
+        chroma_client.heartbeat()
+        logger.info(f"Connected to ChromaDB at {CHROMADB_HOST}:{CHROMADB_PORT}")
+    except Exception as e:
+        logger.error(f"ERROR: Could not connect to ChromaDB at {CHROMADB_HOST}:{CHROMADB_PORT}. Is Docker running? {e}", exc_info=True)
+        # Consider raising here or having a robust retry mechanism
 
 # --- Embedding Model Tokenizer ---
 # Define your embedding model's name (e.g., from Sentence Transformers)
@@ -34,4 +43,10 @@ except Exception as e:
     logger.critical(f"ERROR: Could not load tokenizer for model {EMBEDDING_MODEL_NAME}: {e}", exc_info=True)
     # If the tokenizer fails to load, your embedding process is broken.
     # It's often appropriate to exit here, or at least raise a critical error.
-    # sys.exit(1) # Uncomment if you want to exit immediately on this failure
\ No newline at end of file
+    # sys.exit(1) # Uncomment if you want to exit immediately on this failure
+
+# --- Embedding Function ---
+# The same MiniLM ONNX model Chroma applies to collections created without an
+# explicit embedding function. Used when we need the query vector ourselves
+# (e.g. for re-ranking), so it stays consistent with the stored embeddings.
+embedding_function = embedding_functions.DefaultEmbeddingFunction()
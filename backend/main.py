@@ -1,10 +1,24 @@
+import os
 import uvicorn
-from api.endpoints import app
+
+# Worker processes. Each one imports the app itself, so the Chroma client,
+# embedding model and Notion HTTP client are created once per worker; ingests
+# are serialized across workers through the job registry (services/jobs.py).
+# Run a single worker in production: the /metrics and /traces registries live
+# in each process, so with several workers every scrape sees one worker's
+# numbers, and the snapshot store (services/snapshot.py) indexes its file in
+# memory and is only safe with one writing process.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+# Restart on code changes (development only; uvicorn can't reload multiple workers)
+RELOAD = os.getenv("RELOAD", "false").lower() in ("1", "true", "yes")
 
 if __name__ == "__main__":
+    # The app is passed as an import string (and not imported here) so the
+    # supervisor process doesn't load models and clients it never uses
     uvicorn.run(
         "api.endpoints:app",
         host="0.0.0.0",
         port=8001,
-        reload=True
-    ) 
\ No newline at end of file
+        workers=WEB_CONCURRENCY,
+        reload=RELOAD and WEB_CONCURRENCY == 1
+    )
@@ -1,17 +1,27 @@
 #!/usr/bin/env python3
 """
 Script to run the FastAPI app locally on port 8001
+
+Reloads on code changes by default; set WEB_CONCURRENCY to run several
+worker processes instead (without reloading). Production runs a single
+worker; see main.py for why.
 """
+import os
 import uvicorn
-from api.endpoints import app
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+RELOAD = os.getenv("RELOAD", "true").lower() in ("1", "true", "yes")
 
 if __name__ == "__main__":
     print("Starting FastAPI app on http://localhost:8001")
     print("ChromaDB should be running on http://localhost:8000")
+    if WEB_CONCURRENCY > 1:
+        print(f"Running {WEB_CONCURRENCY} workers (auto-reload is off)")
     uvicorn.run(
         "api.endpoints:app",
         host="0.0.0.0",
         port=8001,
-        reload=True,
+        workers=WEB_CONCURRENCY,
+        reload=RELOAD and WEB_CONCURRENCY == 1,
         log_level="info"
-    ) 
\ No newline at end of file
+    )
@@ -5,7 +5,11 @@ Adds 100 diverse documents with realistic content for testing search functionali
 """
 
 import random
-from services.chroma import collection
+from services.chroma import collection, clear_local_indexes
+from services.page_index import get_page_index
+
+# Documents deleted per call when clearing, so no single request holds every ID
+CLEAR_PAGE_SIZE = 1000
 
 # Diverse document content covering various topics
 documents = [
@@ -201,12 +205,24 @@ def clear_database():
     Clear all documents from the collection (use with caution!)
     """
     try:
-        # Delete all documents
-        collection.delete(ids=collection.get()['ids'])
-        print("🗑️  Database cleared successfully")
+        # Delete all documents, one page of IDs at a time
+        deleted = 0
+        while True:
+            ids = collection.get(limit=CLEAR_PAGE_SIZE, include=[])['ids']
+            if not ids:
+                break
+            collection.delete(ids=ids)
+            deleted += len(ids)
+
+        # The local indexes describe the collection's contents; empty them too
+        get_page_index().clear()
+        clear_local_indexes()
+
+        print(f"🗑️  Database cleared successfully ({deleted} documents)")
         return {
             "success": True,
-            "message": "Database cleared successfully"
+            "message": "Database cleared successfully",
+            "deleted_count": deleted
         }
     except Exception as e:
         print(f"❌ Error clearing database: {str(e)}")
@@ -1,8 +1,33 @@
-from db.clients import chroma_client
-from typing import List, Dict, Any, Optional
+from db.clients import chroma_client, embedding_function, EMBEDDING_MODEL_NAME
+from services.ranking import mmr_select
+from services.quantization import QuantizedIndex, build_quantized_index, QUANTIZED_INDEX_PATH
+from services.clustering import ClusterIndex, build_cluster_index, CLUSTER_INDEX_PATH, CLUSTER_COUNT
+from services.timing import stage
+from services.page_vectors import PageVectorIndex, build_page_vector_index, page_means, PAGE_VECTORS_PATH
+from services.metrics import CACHE_LOOKUPS, CHROMA_OPERATION_SECONDS
+from services.interprocess import SharedIndexFile
+from services.query_cache import get_query_cache
+from services.page_index import get_page_index, subtree_ids
+from typing import Callable, List, Dict, Any, Optional
+import numpy as np
 
 collection = chroma_client.get_or_create_collection(name="test_collection")
 
+# How many candidates to fetch per requested result when re-ranking for diversity
+DIVERSITY_CANDIDATE_FACTOR = 4
+# How many quantized candidates to rescore with full precision per requested result
+RESCORE_CANDIDATE_FACTOR = 10
+# Maximum number of page IDs in a single `$in` delete filter
+DELETE_PAGE_BATCH_SIZE = 500
+# Chunks per collection.update call when rewriting title paths
+METADATA_UPDATE_BATCH_SIZE = 1000
+
+# Local indexes derived from the collection's embeddings, loaded from disk on first
+# use and reloaded when another API worker saves a newer version
+_quantized_index_file = SharedIndexFile(QUANTIZED_INDEX_PATH, QuantizedIndex.load)
+_cluster_index_file = SharedIndexFile(CLUSTER_INDEX_PATH, ClusterIndex.load)
+_page_vector_file = SharedIndexFile(PAGE_VECTORS_PATH, PageVectorIndex.load)
+
 def test_upsert():
     try:
         collection.upsert(
@@ -39,61 +64,438 @@ def test_get():
             "message": e
         }
 
-def search_documents(query: str, top_k: int = 5):
+def get_quantized_index() -> Optional[QuantizedIndex]:
+    """Returns the quantized index, loading it from QUANTIZED_INDEX_PATH if one was built."""
+    return _quantized_index_file.get()
+
+def rebuild_quantized_index(mode: str = "int8") -> Dict[str, Any]:
+    """
+    Build (or rebuild) the quantized index from the collection's stored embeddings.
+    
+    Args:
+        mode: "int8" (4x smaller than float32) or "binary" (32x smaller)
+    
+    Returns:
+        dict: Response containing index size and memory usage
+    """
+    try:
+        index = build_quantized_index(collection, mode)
+        _quantized_index_file.replace(index)
+        return {
+            "success": True,
+            "message": f"Built {mode} quantized index over {len(index)} embeddings",
+            "mode": mode,
+            "indexed_count": len(index),
+            "code_bytes": index.nbytes
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error building quantized index: {str(e)}",
+            "error": str(e)
+        }
+
+def get_cluster_index() -> Optional[ClusterIndex]:
+    """Returns the cluster index, loading it from CLUSTER_INDEX_PATH if one was built."""
+    return _cluster_index_file.get()
+
+def _local_index_files() -> List[SharedIndexFile]:
+    """The local indexes that hold one entry per chunk."""
+    return [_quantized_index_file, _cluster_index_file]
+
+def local_indexes_built() -> bool:
+    return any(index_file.get() is not None for index_file in _local_index_files())
+
+def add_to_local_indexes(ids: List[str], embeddings: Any, save: bool = True):
+    """
+    Adds (or replaces) embeddings in the quantized and cluster indexes, if
+    built. With save=False the change is written by save_local_indexes().
+    """
+    if len(ids) == 0:
+        return
+    ids = list(ids)
+    # Held until saved when save=False, so keep the compact array rather than lists of floats
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    for index_file in _local_index_files():
+        index_file.apply(lambda index: index.add(ids, embeddings), save)
+
+def remove_from_local_indexes(ids: List[str], save: bool = True):
+    """Removes chunks from the quantized and cluster indexes, if built (see add_to_local_indexes)."""
+    if len(ids) == 0:
+        return
+    ids = list(ids)
+    for index_file in _local_index_files():
+        index_file.apply(lambda index: index.remove(ids), save)
+
+def save_local_indexes():
+    """Writes the changes made with save=False to the quantized and cluster indexes."""
+    for index_file in _local_index_files():
+        index_file.save()
+
+def clear_local_indexes():
+    """Empties the quantized, cluster and page vector indexes (the clusters' centroids are kept for new data)."""
+    for index_file in _local_index_files():
+        with index_file.update() as index:
+            if index is not None:
+                index.remove(list(index.ids))
+    with _page_vector_file.update() as page_vectors:
+        if page_vectors is not None:
+            page_vectors.remove(list(page_vectors.page_ids) + list(page_vectors.stale))
+
+def get_page_vector_index() -> Optional[PageVectorIndex]:
+    """Returns the page vector index, loading it from PAGE_VECTORS_PATH if one was built."""
+    return _page_vector_file.get()
+
+def invalidate_page_vectors(page_ids: Any):
+    """Marks the vectors of pages whose chunks changed as stale, if page vectors were built."""
+    page_ids = {page_id for page_id in page_ids if page_id}
+    if not page_ids or get_page_vector_index() is None:
+        return
+    with _page_vector_file.update() as index:
+        index.invalidate(page_ids)
+
+def rebuild_page_vector_index() -> Dict[str, Any]:
+    """
+    Average every page's stored chunk embeddings into a page vector, for
+    related-page lookups. Inserts and deletes mark the affected pages stale
+    afterwards; they are recomputed from the collection on the next lookup.
+    
+    Returns:
+        dict: Response containing the number of page vectors
+    """
+    try:
+        index = build_page_vector_index(collection)
+        _page_vector_file.replace(index)
+        return {
+            "success": True,
+            "message": f"Built vectors for {len(index)} pages",
+            "pages_count": len(index)
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error building page vectors: {str(e)}",
+            "error": str(e)
+        }
+
+def _compute_page_vectors(page_ids: List[str]) -> Dict[str, Any]:
+    """Mean stored embedding of each page that has chunks: {page_id: (unit vector, chunk count)}."""
+    vectors = {}
+    for start in range(0, len(page_ids), DELETE_PAGE_BATCH_SIZE):
+        batch = page_ids[start:start + DELETE_PAGE_BATCH_SIZE]
+        with CHROMA_OPERATION_SECONDS.time(operation="get"):
+            existing = collection.get(where={"source_page_id": {"$in": batch}}, include=["embeddings", "metadatas"])
+        if existing["ids"]:
+            pages, means, counts = page_means(
+                [metadata["source_page_id"] for metadata in existing["metadatas"]], existing["embeddings"]
+            )
+            vectors.update((page_id, (mean, count)) for page_id, mean, count in zip(pages, means, counts))
+    return vectors
+
+def _refresh_page_vectors(page_ids: List[str]):
+    """Recomputes the given pages' vectors from the collection and drops pages that have no chunks left."""
+    if not page_ids:
+        return
+    fresh = _compute_page_vectors(page_ids)
+    with _page_vector_file.update() as index:
+        index.remove([page_id for page_id in page_ids if page_id not in fresh])
+        if fresh:
+            index.set(list(fresh), np.stack([mean for mean, _ in fresh.values()]), np.array([count for _, count in fresh.values()]))
+
+def _page_vector(page_id: str) -> Optional[np.ndarray]:
+    """A page's mean chunk embedding, from the page vector index when it is built and fresh."""
+    index = get_page_vector_index()
+    if index is not None:
+        vector = index.get(page_id)
+        CACHE_LOOKUPS.inc(cache="page_vectors", result="miss" if vector is None else "hit")
+        if vector is None:
+            _refresh_page_vectors([page_id])
+            vector = get_page_vector_index().get(page_id)
+        return vector
+    fresh = _compute_page_vectors([page_id])
+    return fresh[page_id][0] if page_id in fresh else None
+
+def rebuild_cluster_index(cluster_count: int = CLUSTER_COUNT) -> Dict[str, Any]:
+    """
+    Cluster the collection's stored embeddings with mini-batch k-means.
+    Inserts and deletes keep the clustering up to date afterwards.
+    
+    Args:
+        cluster_count: Number of clusters (default: CLUSTER_COUNT)
+    
+    Returns:
+        dict: Response containing the number of clustered chunks and clusters
+    """
+    try:
+        if cluster_count < 1:
+            raise ValueError("cluster_count must be at least 1")
+        index = build_cluster_index(collection, cluster_count)
+        _cluster_index_file.replace(index)
+        return {
+            "success": True,
+            "message": f"Clustered {len(index)} embeddings into {index.cluster_count} clusters",
+            "clustered_count": len(index),
+            "cluster_count": index.cluster_count
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error building cluster index: {str(e)}",
+            "error": str(e)
+        }
+
+def _chunk_summaries(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Document and page context for chunk IDs, keyed by ID."""
+    if not ids:
+        return {}
+    with CHROMA_OPERATION_SECONDS.time(operation="get"):
+        chunks = collection.get(ids=ids, include=["documents", "metadatas"])
+    summaries = {}
+    for chunk_id, document, metadata in zip(chunks["ids"], chunks["documents"], chunks["metadatas"]):
+        metadata = metadata or {}
+        summaries[chunk_id] = {
+            "id": chunk_id,
+            "document": document,
+            "source_page_id": metadata.get("source_page_id", ""),
+            "page_title_path": metadata.get("page_title_path", "").split(" > ") if metadata.get("page_title_path") else [],
+        }
+    return summaries
+
+def get_cluster_summary(representatives: int = 3, neighbors: int = 3) -> Dict[str, Any]:
+    """
+    Summarize the collection as clusters for the graph view: each cluster's
+    size, its most central chunks and its nearest clusters. Detail for a
+    cluster is loaded separately with get_cluster_members.
+    
+    Args:
+        representatives: Number of central chunks returned per cluster
+        neighbors: Number of nearest clusters returned per cluster
+    
+    Returns:
+        dict: Response containing the clusters, largest first
+    """
+    try:
+        index = get_cluster_index()
+        if index is None:
+            raise ValueError("No cluster index has been built")
+        clusters = index.summary(representatives, neighbors)
+        chunks = _chunk_summaries([chunk_id for cluster in clusters for chunk_id in cluster["representative_ids"]])
+        for cluster in clusters:
+            cluster["representatives"] = [chunks[chunk_id] for chunk_id in cluster.pop("representative_ids") if chunk_id in chunks]
+        return {
+            "success": True,
+            "message": f"{len(clusters)} clusters over {len(index)} chunks",
+            "clustered_count": len(index),
+            "clusters": clusters
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error summarizing clusters: {str(e)}",
+            "error": str(e),
+            "clusters": []
+        }
+
+def get_cluster_members(cluster_id: int, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """
+    Page through the chunks of one cluster, most central first.
+    
+    Args:
+        cluster_id: Cluster ID from get_cluster_summary
+        limit: Maximum number of chunks to return
+        offset: Number of chunks to skip
+    
+    Returns:
+        dict: Response containing the cluster size and one page of its chunks
+    """
+    try:
+        index = get_cluster_index()
+        if index is None:
+            raise ValueError("No cluster index has been built")
+        if not 0 <= cluster_id < index.cluster_count:
+            raise ValueError(f"Unknown cluster {cluster_id}")
+        members = index.members(cluster_id)
+        page = members[offset:offset + limit]
+        chunks = _chunk_summaries(page)
+        return {
+            "success": True,
+            "message": f"Cluster {cluster_id}: chunks {offset}-{offset + len(page)} of {len(members)}",
+            "cluster_id": cluster_id,
+            "size": len(members),
+            "chunks": [chunks[chunk_id] for chunk_id in page if chunk_id in chunks]
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error listing cluster {cluster_id}: {str(e)}",
+            "error": str(e),
+            "chunks": []
+        }
+
+def _rescore_candidates(
+    query_embedding: Any,
+    candidate_ids: List[str],
+    n_results: int,
+    include_embeddings: bool,
+    where: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Rescores quantized candidates with their full-precision embeddings.
+    Returns a dict shaped like a single-query collection.query() result.
+    """
+    with CHROMA_OPERATION_SECONDS.time(operation="get"):
+        candidates = collection.get(ids=candidate_ids, where=where, include=["metadatas", "documents", "embeddings"])
+    if not candidates["ids"]:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "embeddings": [[]]}
+
+    embeddings = np.asarray(candidates["embeddings"], dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    # Squared L2, matching the distances Chroma reports for the default space
+    distances = ((embeddings - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:n_results]
+
+    return {
+        "ids": [[candidates["ids"][i] for i in order]],
+        "documents": [[candidates["documents"][i] for i in order]],
+        "metadatas": [[candidates["metadatas"][i] for i in order]],
+        "distances": [[float(distances[i]) for i in order]],
+        "embeddings": [embeddings[order]] if include_embeddings else None
+    }
+
+def _embed_query(query: str) -> Any:
+    """Embeds a search query, through the query cache shared by the API workers when enabled."""
+    cache = get_query_cache()
+    if cache is None:
+        return embedding_function([query])[0]
+    vector = cache.get(EMBEDDING_MODEL_NAME, query)
+    CACHE_LOOKUPS.inc(cache="query_embedding", result="miss" if vector is None else "hit")
+    if vector is None:
+        vector = embedding_function([query])[0]
+        cache.put(EMBEDDING_MODEL_NAME, query, vector)
+    return vector
+
+def _parse_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Parses stored chunk metadata back into structured format."""
+    metadata = metadata or {}
+    parsed_metadata = {
+        "source_page_id": metadata.get("source_page_id", ""),
+        "block_type": metadata.get("block_type", ""),
+        "order_within_page": metadata.get("order_within_page", 0),
+        "last_updated": metadata.get("last_updated", ""),
+        "page_title_path": metadata.get("page_title_path", "").split(" > ") if metadata.get("page_title_path") else [],
+        "active_headings": metadata.get("active_headings", "").split(" | ") if metadata.get("active_headings") else [],
+    }
+
+    # Add optional source_block_id if it exists
+    if metadata.get("source_block_id"):
+        parsed_metadata["source_block_id"] = metadata["source_block_id"]
+
+    # Database row properties, without their prop_ prefix
+    properties = {key[len("prop_"):]: value for key, value in metadata.items() if key.startswith("prop_")}
+    if properties:
+        parsed_metadata["properties"] = properties
+    return parsed_metadata
+
+def search_documents(
+    query: str,
+    top_k: int = 5,
+    diversity: float = 0.0,
+    max_per_page: Optional[int] = None,
+    quantization: Optional[str] = None,
+    within_page_id: Optional[str] = None
+):
     """
     Search for documents in ChromaDB based on a user query.
     
     Args:
         query (str): The user's search query
         top_k (int): Number of top matching documents to return (default: 5)
+        diversity (float): 0.0 returns the closest matches, higher values (up to 1.0)
+            re-rank a larger candidate pool with MMR to favour varied results
+        max_per_page (int): Optional cap on results returned from the same Notion page
+        quantization (str): Optional "int8" or "binary" to generate candidates from the
+            quantized index and rescore them with full precision
+        within_page_id (str): Optional page ID; only chunks from this page and the pages
+            below it in the page index are searched
     
     Returns:
         dict: Response containing success status, message, and search results with metadata
     """
     try:
-        # Query the collection with metadata
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k,
-            include=["metadatas", "documents", "distances"]
-        )
-        
+        if not 0.0 <= diversity <= 1.0:
+            raise ValueError("diversity must be between 0.0 and 1.0")
+
+        where = None
+        if within_page_id:
+            where = {"source_page_id": {"$in": sorted(subtree_ids(within_page_id))}}
+
+        rerank = diversity > 0 or max_per_page is not None
+        n_results = top_k * DIVERSITY_CANDIDATE_FACTOR if rerank else top_k
+        index = None
+        if quantization:
+            index = get_quantized_index()
+            if index is None or index.mode != quantization:
+                raise ValueError(f"No {quantization} quantized index has been built")
+
+        # Embed explicitly so the embedding and the vector search are timed separately
+        with stage("embed"):
+            query_embedding = _embed_query(query)
+
+        with stage("vector_search"):
+            if index is not None:
+                candidate_ids = index.candidates(query_embedding, n_results * RESCORE_CANDIDATE_FACTOR)
+                # The section filter is applied to the candidates, so a small section may return fewer results
+                results = _rescore_candidates(query_embedding, candidate_ids, n_results, include_embeddings=rerank, where=where)
+            else:
+                # With reranking, fetch a larger candidate pool and select top_k from it with MMR
+                include = ["metadatas", "documents", "distances"]
+                if rerank:
+                    include.append("embeddings")
+                with CHROMA_OPERATION_SECONDS.time(operation="query"):
+                    results = collection.query(
+                        query_embeddings=[query_embedding],
+                        n_results=n_results,
+                        where=where,
+                        include=include
+                    )
+
         # Format the results for better readability
         formatted_results = []
         if results['documents'] and results['documents'][0]:
-            for i, (doc, distance, id_val, metadata) in enumerate(zip(
-                results['documents'][0], 
-                results['distances'][0], 
-                results['ids'][0],
-                results['metadatas'][0]
-            )):
-                # Parse metadata back into structured format
-                parsed_metadata = {
-                    "source_page_id": metadata.get("source_page_id", ""),
-                    "block_type": metadata.get("block_type", ""),
-                    "order_within_page": metadata.get("order_within_page", 0),
-                    "last_updated": metadata.get("last_updated", ""),
-                    "page_title_path": metadata.get("page_title_path", "").split(" > ") if metadata.get("page_title_path") else [],
-                    "active_headings": metadata.get("active_headings", "").split(" | ") if metadata.get("active_headings") else [],
-                }
-                
-                # Add optional source_block_id if it exists
-                if metadata.get("source_block_id"):
-                    parsed_metadata["source_block_id"] = metadata["source_block_id"]
-                
-                formatted_results.append({
-                    "rank": i + 1,
-                    "document": doc,
-                    "similarity_score": 1 - distance,  # Convert distance to similarity score
-                    "id": id_val,
-                    "metadata": parsed_metadata
-                })
+            order = range(len(results['ids'][0]))
+            if rerank:
+                with stage("rerank"):
+                    order = mmr_select(
+                        query_embedding,
+                        results['embeddings'][0],
+                        top_k,
+                        diversity=diversity,
+                        page_ids=[metadata.get("source_page_id", "") for metadata in results['metadatas'][0]],
+                        max_per_page=max_per_page
+                    )
+
+            with stage("parse_metadata"):
+                for rank, i in enumerate(order):
+                    doc = results['documents'][0][i]
+                    distance = results['distances'][0][i]
+                    id_val = results['ids'][0][i]
+                    formatted_results.append({
+                        "rank": rank + 1,
+                        "document": doc,
+                        "similarity_score": 1 - distance,  # Convert distance to similarity score
+                        "id": id_val,
+                        "metadata": _parse_metadata(results['metadatas'][0][i])
+                    })
         
         return {
             "success": True,
             "message": f"Found {len(formatted_results)} matching documents",
             "query": query,
             "top_k": top_k,
+            "diversity": diversity,
+            "max_per_page": max_per_page,
+            "quantization": quantization,
+            "within_page_id": within_page_id,
             "results": formatted_results
         }
         
@@ -103,15 +505,191 @@ def search_documents(query: str, top_k: int = 5):
             "message": f"Error searching documents: {str(e)}",
             "query": query,
             "top_k": top_k,
+            "diversity": diversity,
+            "max_per_page": max_per_page,
+            "quantization": quantization,
+            "results": []
+        }
+
+def _query_neighbors(embedding: Any, top_k: int, exclude_page_id: str, exclude_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Nearest chunks to a stored embedding, excluding a page's own chunks, formatted
+    like search results.
+    """
+    # Chunks without a source page (e.g. seeded documents) can only exclude themselves
+    where = {"source_page_id": {"$ne": exclude_page_id}} if exclude_page_id else None
+    with stage("vector_search"), CHROMA_OPERATION_SECONDS.time(operation="query"):
+        results = collection.query(
+            query_embeddings=[embedding],
+            n_results=top_k + (1 if exclude_id else 0),
+            where=where,
+            include=["metadatas", "documents", "distances"]
+        )
+    neighbors = []
+    for id_val, doc, metadata, distance in zip(
+        results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+    ):
+        if id_val == exclude_id or len(neighbors) == top_k:
+            continue
+        neighbors.append({
+            "rank": len(neighbors) + 1,
+            "document": doc,
+            "similarity_score": 1 - distance,
+            "id": id_val,
+            "metadata": _parse_metadata(metadata)
+        })
+    return neighbors
+
+def get_related_chunks(chunk_id: str, top_k: int = 5) -> Dict[str, Any]:
+    """
+    Find the chunks most similar to a stored chunk, from other pages, using the
+    chunk's stored embedding instead of re-embedding its text.
+    
+    Args:
+        chunk_id: ID of the stored chunk
+        top_k: Number of related chunks to return (default: 5)
+    
+    Returns:
+        dict: Response containing the related chunks, formatted like search results
+    """
+    try:
+        with CHROMA_OPERATION_SECONDS.time(operation="get"):
+            stored = collection.get(ids=[chunk_id], include=["embeddings", "metadatas"])
+        if not stored["ids"]:
+            raise ValueError(f"Chunk {chunk_id} is not in the collection")
+        page_id = (stored["metadatas"][0] or {}).get("source_page_id", "")
+        results = _query_neighbors(stored["embeddings"][0], top_k, page_id, exclude_id=chunk_id)
+        return {
+            "success": True,
+            "message": f"Found {len(results)} chunks related to {chunk_id}",
+            "chunk_id": chunk_id,
+            "source_page_id": page_id,
+            "top_k": top_k,
+            "results": results
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error finding chunks related to {chunk_id}: {str(e)}",
+            "chunk_id": chunk_id,
+            "results": []
+        }
+
+def get_related_to_page(page_id: str, top_k: int = 5) -> Dict[str, Any]:
+    """
+    Find the chunks of other pages most similar to a whole page, querying with
+    the page's mean chunk embedding.
+    
+    Args:
+        page_id: The Notion page ID
+        top_k: Number of related chunks to return (default: 5)
+    
+    Returns:
+        dict: Response containing the related chunks, formatted like search results
+    """
+    try:
+        vector = _page_vector(page_id)
+        if vector is None:
+            raise ValueError(f"Page {page_id} has no chunks in the collection")
+        results = _query_neighbors(vector, top_k, page_id)
+        return {
+            "success": True,
+            "message": f"Found {len(results)} chunks related to page {page_id}",
+            "page_id": page_id,
+            "top_k": top_k,
+            "results": results
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error finding chunks related to page {page_id}: {str(e)}",
+            "page_id": page_id,
             "results": []
         }
 
-def insert_notion_chunks(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+def get_related_pages(page_id: str, top_k: int = 5) -> Dict[str, Any]:
+    """
+    Find the pages most similar to a page by comparing page vectors, without
+    querying Chroma (stale page vectors are recomputed first).
+    
+    Args:
+        page_id: The Notion page ID
+        top_k: Number of related pages to return (default: 5)
+    
+    Returns:
+        dict: Response containing the related pages with their cosine similarity
+    """
+    try:
+        index = get_page_vector_index()
+        if index is None:
+            raise ValueError("No page vectors have been built")
+        _refresh_page_vectors(sorted(index.stale))
+        index = get_page_vector_index()
+        vector = _page_vector(page_id)
+        if vector is None:
+            raise ValueError(f"Page {page_id} has no chunks in the collection")
+        page_index = get_page_index()
+        results = []
+        for rank, (other_id, similarity, chunk_count) in enumerate(index.nearest(vector, top_k, exclude=[page_id])):
+            page = page_index.get(other_id) or {}
+            results.append({
+                "rank": rank + 1,
+                "page_id": other_id,
+                "title": page.get("title", ""),
+                "page_title_path": page_index.title_path(other_id),
+                "similarity_score": similarity,
+                "chunk_count": chunk_count
+            })
+        return {
+            "success": True,
+            "message": f"Found {len(results)} pages related to page {page_id}",
+            "page_id": page_id,
+            "top_k": top_k,
+            "results": results
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error finding pages related to page {page_id}: {str(e)}",
+            "page_id": page_id,
+            "results": []
+        }
+
+def chunk_metadata(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens a chunk's metadata for ChromaDB (metadata values must be flat strings/numbers).
+    """
+    metadata = {
+        "source_page_id": chunk["source_page_id"],
+        "block_type": chunk["block_type"],
+        "order_within_page": chunk["order_within_page"],
+        "last_updated": chunk["last_updated"],
+        "page_title_path": " > ".join(chunk["page_title_path"]),  # Join as string
+        "active_headings": " | ".join(chunk["active_headings"]),  # Join as string
+    }
+    
+    # Add source_block_id if it exists
+    if chunk.get("source_block_id"):
+        metadata["source_block_id"] = chunk["source_block_id"]
+
+    # Lets re-ingest tell content changes from context (title/heading) changes
+    if chunk.get("content_hash"):
+        metadata["content_hash"] = chunk["content_hash"]
+
+    # Flattened database row properties (already prefixed with prop_)
+    if chunk.get("properties"):
+        metadata.update(chunk["properties"])
+    return metadata
+
+def insert_notion_chunks(chunks: List[Dict[str, Any]], embeddings: Optional[Any] = None, save_indexes: bool = True) -> Dict[str, Any]:
     """
     Insert Notion chunks into ChromaDB with metadata.
     
     Args:
         chunks: List of chunk dictionaries with text and metadata
+        embeddings: Optional precomputed embeddings, one per chunk. When omitted,
+            Chroma embeds the documents itself.
+        save_indexes: Whether to save the local indexes now rather than with save_local_indexes()
     
     Returns:
         dict: Response containing success status and insertion results
@@ -137,28 +715,24 @@ def insert_notion_chunks(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
             chunk_id = chunk["id"]
             ids.append(chunk_id)
             
-            # Prepare metadata (ChromaDB metadata must be flat strings/numbers)
-            metadata = {
-                "source_page_id": chunk["source_page_id"],
-                "block_type": chunk["block_type"],
-                "order_within_page": chunk["order_within_page"],
-                "last_updated": chunk["last_updated"],
-                "page_title_path": " > ".join(chunk["page_title_path"]),  # Join as string
-                "active_headings": " | ".join(chunk["active_headings"]),  # Join as string
-            }
-            
-            # Add source_block_id if it exists
-            if chunk.get("source_block_id"):
-                metadata["source_block_id"] = chunk["source_block_id"]
-            
-            metadatas.append(metadata)
+            metadatas.append(chunk_metadata(chunk))
         
         # Insert into ChromaDB
-        collection.upsert(
-            documents=documents,
-            ids=ids,
-            metadatas=metadatas
-        )
+        with CHROMA_OPERATION_SECONDS.time(operation="upsert"):
+            collection.upsert(
+                documents=documents,
+                ids=ids,
+                metadatas=metadatas,
+                embeddings=embeddings
+            )
+
+        # Keep the quantized, cluster and page vector indexes (if built) in sync with the collection
+        invalidate_page_vectors({chunk["source_page_id"] for chunk in chunks})
+        if embeddings is None and local_indexes_built():
+            stored = collection.get(ids=ids, include=["embeddings"])
+            add_to_local_indexes(stored["ids"], stored["embeddings"], save=save_indexes)
+        elif embeddings is not None:
+            add_to_local_indexes(ids, embeddings, save=save_indexes)
         
         return {
             "success": True,
@@ -207,21 +781,22 @@ def delete_chunks_by_page_id(page_id: str) -> Dict[str, Any]:
         dict: Response containing deletion results
     """
     try:
-        # Query to find chunks with the specific page_id
-        results = collection.query(
-            query_texts=[""],  # Empty query to get all documents
-            n_results=collection.count(),
-            where={"source_page_id": page_id}
-        )
+        # Find chunks with the specific page_id (a metadata lookup, no embedding needed)
+        with CHROMA_OPERATION_SECONDS.time(operation="get"):
+            existing = collection.get(where={"source_page_id": page_id}, include=[])
         
-        if results['ids'] and results['ids'][0]:
+        if existing['ids']:
             # Delete the found chunks
-            collection.delete(ids=results['ids'][0])
+            with CHROMA_OPERATION_SECONDS.time(operation="delete"):
+                collection.delete(ids=existing['ids'])
+
+            remove_from_local_indexes(existing['ids'])
+            invalidate_page_vectors([page_id])
             
             return {
                 "success": True,
-                "message": f"Deleted {len(results['ids'][0])} chunks for page {page_id}",
-                "deleted_count": len(results['ids'][0])
+                "message": f"Deleted {len(existing['ids'])} chunks for page {page_id}",
+                "deleted_count": len(existing['ids'])
             }
         else:
             return {
@@ -235,4 +810,335 @@ def delete_chunks_by_page_id(page_id: str) -> Dict[str, Any]:
             "success": False,
             "message": f"Error deleting chunks for page {page_id}: {str(e)}",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+def delete_chunks_by_page_ids(page_ids: List[str]) -> Dict[str, Any]:
+    """
+    Delete all chunks belonging to any of the given Notion page IDs.
+    
+    Args:
+        page_ids: The Notion page IDs to delete chunks for
+    
+    Returns:
+        dict: Response containing deletion results
+    """
+    try:
+        deleted_ids = []
+        # Keep each $in filter to a bounded size
+        for start in range(0, len(page_ids), DELETE_PAGE_BATCH_SIZE):
+            batch = page_ids[start:start + DELETE_PAGE_BATCH_SIZE]
+            with CHROMA_OPERATION_SECONDS.time(operation="get"):
+                existing = collection.get(where={"source_page_id": {"$in": batch}}, include=[])
+            if existing['ids']:
+                with CHROMA_OPERATION_SECONDS.time(operation="delete"):
+                    collection.delete(ids=existing['ids'])
+                deleted_ids.extend(existing['ids'])
+
+        remove_from_local_indexes(deleted_ids)
+        if deleted_ids:
+            invalidate_page_vectors(page_ids)
+
+        return {
+            "success": True,
+            "message": f"Deleted {len(deleted_ids)} chunks for {len(page_ids)} pages",
+            "deleted_count": len(deleted_ids)
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error deleting chunks for {len(page_ids)} pages: {str(e)}",
+            "error": str(e)
+        }
+
+def delete_page_subtree(page_id: str) -> Dict[str, Any]:
+    """
+    Delete the chunks of a page and every page below it, using the page index
+    to find the subtree, and drop the subtree from the index.
+    
+    Args:
+        page_id: The Notion page ID at the root of the subtree
+    
+    Returns:
+        dict: Response containing deletion results
+    """
+    page_ids = sorted(subtree_ids(page_id))
+    result = delete_chunks_by_page_ids(page_ids)
+    if result["success"]:
+        get_page_index().remove_subtree(page_id)
+        result["pages_count"] = len(page_ids)
+    return result
+
+def _title_prefix(titles: List[str]) -> str:
+    """The "# Title" context lines apply_hierarchy_and_chunk puts at the start of each chunk."""
+    return "\n\n".join(f"# {title}" for title in titles if title)
+
+def _stored_embeddings(ids: List[str]) -> Dict[str, Any]:
+    """Reads stored embeddings by ID, so they can be written back without re-embedding."""
+    embeddings = {}
+    for start in range(0, len(ids), METADATA_UPDATE_BATCH_SIZE):
+        with CHROMA_OPERATION_SECONDS.time(operation="get"):
+            stored = collection.get(ids=ids[start:start + METADATA_UPDATE_BATCH_SIZE], include=["embeddings"])
+        embeddings.update(zip(stored["ids"], stored["embeddings"]))
+    return embeddings
+
+def _update_without_embedding(ids: List[str], metadatas: List[Dict[str, Any]], documents: Optional[List[str]] = None):
+    """
+    Updates metadata (and optionally documents) in place. Chroma re-embeds
+    updated documents unless embeddings are passed, so changed documents are
+    written together with their stored embeddings.
+    """
+    for start in range(0, len(ids), METADATA_UPDATE_BATCH_SIZE):
+        batch_ids = ids[start:start + METADATA_UPDATE_BATCH_SIZE]
+        batch_metadatas = metadatas[start:start + METADATA_UPDATE_BATCH_SIZE]
+        if documents is None:
+            with CHROMA_OPERATION_SECONDS.time(operation="update"):
+                collection.update(ids=batch_ids, metadatas=batch_metadatas)
+        else:
+            embeddings = _stored_embeddings(batch_ids)
+            with CHROMA_OPERATION_SECONDS.time(operation="update"):
+                collection.update(
+                    ids=batch_ids,
+                    metadatas=batch_metadatas,
+                    documents=documents[start:start + METADATA_UPDATE_BATCH_SIZE],
+                    embeddings=[embeddings[chunk_id] for chunk_id in batch_ids]
+                )
+
+def update_title_paths(page_ids: List[str]) -> Dict[str, Any]:
+    """
+    Rewrite the page_title_path of every chunk from the given pages, and the
+    title lines at the start of its text, with the titles currently in the
+    page index. Embeddings are kept as they are.
+    
+    Args:
+        page_ids: The Notion page IDs whose chunks should be updated
+    
+    Returns:
+        dict: Response containing the number of updated chunks
+    """
+    try:
+        page_index = get_page_index()
+        updated = 0
+        for start in range(0, len(page_ids), DELETE_PAGE_BATCH_SIZE):
+            batch = page_ids[start:start + DELETE_PAGE_BATCH_SIZE]
+            with CHROMA_OPERATION_SECONDS.time(operation="get"):
+                existing = collection.get(where={"source_page_id": {"$in": batch}}, include=["metadatas", "documents"])
+            paths = {page_id: page_index.title_path(page_id) for page_id in batch}
+
+            ids, metadatas, documents = [], [], []
+            for chunk_id, metadata, document in zip(existing['ids'], existing['metadatas'], existing['documents']):
+                titles = paths.get(metadata.get("source_page_id"))
+                path = " > ".join(titles) if titles else ""
+                if not path or metadata.get("page_title_path") == path:
+                    continue
+                old_prefix = _title_prefix(metadata.get("page_title_path", "").split(" > "))
+                if old_prefix and document.startswith(old_prefix):
+                    document = _title_prefix(titles) + document[len(old_prefix):]
+                ids.append(chunk_id)
+                metadatas.append({**metadata, "page_title_path": path})
+                documents.append(document)
+            _update_without_embedding(ids, metadatas, documents)
+            updated += len(ids)
+
+        return {
+            "success": True,
+            "message": f"Updated title paths of {updated} chunks in {len(page_ids)} pages",
+            "updated_count": updated
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error updating title paths: {str(e)}",
+            "error": str(e)
+        }
+
+def rename_page(page_id: str, title: str) -> Dict[str, Any]:
+    """
+    Record a new title for an indexed page and propagate it into the
+    page_title_path of the chunks of the page and all of its descendants,
+    without re-embedding anything.
+    
+    Args:
+        page_id: The renamed Notion page (or database) ID
+        title: Its new title
+    
+    Returns:
+        dict: Response containing the number of updated chunks
+    """
+    page_index = get_page_index()
+    page = page_index.get(page_id)
+    if page is None:
+        return {
+            "success": False,
+            "message": f"Page {page_id} is not in the page index",
+            "updated_count": 0
+        }
+    previous = page_index.upsert_page(page_id, page["parent_id"], title, page["last_edited_time"], page["object"])
+    if previous is None:
+        return {
+            "success": True,
+            "message": f"Page {page_id} already has title '{title}'",
+            "updated_count": 0
+        }
+    return update_title_paths(page_index.descendants(page_id))
+
+# --- Re-ingest diff ---
+
+def _stored_ids_by_hash(hashes: List[str], reuse_from: Callable[[str], bool]) -> Dict[str, str]:
+    """{content_hash: stored chunk ID} for stored chunks with one of the hashes whose source page passes reuse_from."""
+    found: Dict[str, str] = {}
+    hashes = sorted(set(hashes))
+    for start in range(0, len(hashes), DELETE_PAGE_BATCH_SIZE):
+        with CHROMA_OPERATION_SECONDS.time(operation="get"):
+            existing = collection.get(
+                where={"content_hash": {"$in": hashes[start:start + DELETE_PAGE_BATCH_SIZE]}}, include=["metadatas"]
+            )
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            if metadata and reuse_from(metadata.get("source_page_id", "")):
+                found.setdefault(metadata["content_hash"], chunk_id)
+    return found
+
+def diff_chunks(
+    chunks: List[Dict[str, Any]],
+    page_ids: List[str],
+    reuse_from: Optional[Callable[[str], bool]] = None
+) -> Dict[str, Any]:
+    """
+    Compares freshly extracted chunks with the chunks stored for the same pages
+    and classifies every change by what it costs to apply.
+    
+    Args:
+        chunks: Chunks produced by the current crawl of the pages
+        page_ids: Every page the crawl covered, including pages that have since been removed
+        reuse_from: Optional filter on source page IDs. When given, content that is
+            not stored for page_ids is also looked up in the rest of the collection,
+            and a match from a page that passes the filter lends its embedding
+    
+    Returns:
+        dict: {
+            "embed": chunks whose content is not stored yet and must be embedded,
+            "reuse": (chunk, stored_id) pairs whose content is stored under another ID
+                (e.g. after a block was inserted above it) so the embedding is copied,
+            "update": (chunk, stored_metadata, text_changed) for chunks whose content is
+                unchanged but whose title path, headings or other metadata changed,
+            "unchanged": number of chunks that are identical,
+            "delete": stored IDs the crawl no longer produced,
+            "delete_page_ids": the pages those IDs belonged to
+        }
+    """
+    stored: Dict[str, Any] = {}
+    for start in range(0, len(page_ids), DELETE_PAGE_BATCH_SIZE):
+        batch = page_ids[start:start + DELETE_PAGE_BATCH_SIZE]
+        with CHROMA_OPERATION_SECONDS.time(operation="get"):
+            existing = collection.get(where={"source_page_id": {"$in": batch}}, include=["metadatas", "documents"])
+        for chunk_id, document, metadata in zip(existing['ids'], existing['documents'], existing['metadatas']):
+            stored[chunk_id] = (document, metadata or {})
+
+    stored_by_hash = {}
+    for chunk_id, (_, metadata) in stored.items():
+        if metadata.get("content_hash"):
+            stored_by_hash.setdefault(metadata["content_hash"], chunk_id)
+
+    diff = {"embed": [], "reuse": [], "update": [], "unchanged": 0, "delete": []}
+    for chunk in chunks:
+        chunk_hash = chunk.get("content_hash")
+        current = stored.get(chunk["id"])
+        if chunk_hash and current is not None and current[1].get("content_hash") == chunk_hash:
+            document, metadata = current
+            text_changed = document != chunk["text"]
+            if text_changed or metadata != chunk_metadata(chunk):
+                diff["update"].append((chunk, metadata, text_changed))
+            else:
+                diff["unchanged"] += 1
+        elif chunk_hash in stored_by_hash:
+            diff["reuse"].append((chunk, stored_by_hash[chunk_hash]))
+        else:
+            diff["embed"].append(chunk)
+
+    if reuse_from is not None and diff["embed"]:
+        # Content moved in from pages outside this diff
+        elsewhere = _stored_ids_by_hash([chunk["content_hash"] for chunk in diff["embed"] if chunk.get("content_hash")], reuse_from)
+        diff["reuse"].extend((chunk, elsewhere[chunk["content_hash"]]) for chunk in diff["embed"] if chunk.get("content_hash") in elsewhere)
+        diff["embed"] = [chunk for chunk in diff["embed"] if chunk.get("content_hash") not in elsewhere]
+
+    produced = {chunk["id"] for chunk in chunks}
+    diff["delete"] = [chunk_id for chunk_id in stored if chunk_id not in produced]
+    diff["delete_page_ids"] = sorted({stored[chunk_id][1].get("source_page_id", "") for chunk_id in diff["delete"]})
+    return diff
+
+def apply_chunk_diff(diff: Dict[str, Any], embeddings: Optional[Any] = None, save_indexes: bool = True) -> Dict[str, Any]:
+    """
+    Applies a diff from diff_chunks: upserts new content with its embeddings,
+    copies stored embeddings for moved content, updates metadata (and context
+    text) in place and deletes chunks that no longer exist.
+    
+    Args:
+        diff: Result of diff_chunks
+        embeddings: Embeddings for diff["embed"], in the same order
+        save_indexes: Whether to save the local indexes now rather than with save_local_indexes()
+    
+    Returns:
+        dict: Response containing counts for each kind of change
+    """
+    try:
+        # Read embeddings to copy before anything is overwritten or deleted
+        reused = _stored_embeddings(sorted({stored_id for _, stored_id in diff["reuse"]}))
+
+        deleted = 0
+        if diff["delete"]:
+            for start in range(0, len(diff["delete"]), METADATA_UPDATE_BATCH_SIZE):
+                with CHROMA_OPERATION_SECONDS.time(operation="delete"):
+                    collection.delete(ids=diff["delete"][start:start + METADATA_UPDATE_BATCH_SIZE])
+            remove_from_local_indexes(diff["delete"], save=save_indexes)
+            invalidate_page_vectors(diff["delete_page_ids"])
+            deleted = len(diff["delete"])
+
+        for chunks, vectors in (
+            (diff["embed"], embeddings),
+            ([chunk for chunk, _ in diff["reuse"]], [reused[stored_id] for _, stored_id in diff["reuse"]])
+        ):
+            if chunks:
+                insert_result = insert_notion_chunks(chunks, embeddings=vectors, save_indexes=save_indexes)
+                if not insert_result["success"]:
+                    return insert_result
+
+        # Metadata-only changes, plus context-only text changes written with their stored embeddings
+        for text_changed in (False, True):
+            updates = [(chunk, metadata) for chunk, metadata, changed in diff["update"] if changed == text_changed]
+            if not updates:
+                continue
+            metadatas = []
+            for chunk, stored_metadata in updates:
+                metadata = chunk_metadata(chunk)
+                # Update merges metadata; None removes keys the chunk no longer has
+                metadata.update({key: None for key in stored_metadata if key not in metadata})
+                metadatas.append(metadata)
+            _update_without_embedding(
+                [chunk["id"] for chunk, _ in updates],
+                metadatas,
+                [chunk["text"] for chunk, _ in updates] if text_changed else None
+            )
+
+        written = len(diff["embed"]) + len(diff["reuse"])
+        return {
+            "success": True,
+            "message": (
+                f"Embedded {len(diff['embed'])}, reused {len(diff['reuse'])}, updated {len(diff['update'])} "
+                f"and deleted {deleted} chunks ({diff['unchanged']} unchanged)"
+            ),
+            "inserted_count": written,
+            "embedded_count": len(diff["embed"]),
+            "reused_count": len(diff["reuse"]),
+            "updated_count": len(diff["update"]),
+            "unchanged_count": diff["unchanged"],
+            "deleted_count": deleted
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error applying chunk changes to ChromaDB: {str(e)}",
+            "inserted_count": 0,
+            "error": str(e)
+        }
@@ -0,0 +1,223 @@
+import os
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+from services.ranking import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+CLUSTER_INDEX_PATH = os.getenv("CLUSTER_INDEX_PATH", "clusters.npz")
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", 32))
+CLUSTER_EPOCHS = int(os.getenv("CLUSTER_EPOCHS", 2)) # mini-batch passes over the collection
+CLUSTER_INIT_SAMPLE = int(os.getenv("CLUSTER_INIT_SAMPLE", 10000)) # rows sampled for k-means++ seeding
+
+def _nearest(embeddings: np.ndarray, centroids: np.ndarray):
+    """Cosine-nearest centroid for each (normalized) row. Returns (labels, similarities)."""
+    similarities = embeddings @ normalize_rows(centroids).T
+    labels = similarities.argmax(axis=1)
+    return labels.astype(np.int32), similarities[np.arange(len(labels)), labels]
+
+def kmeans_plus_plus(sample: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Picks k seeds from normalized rows, each with probability proportional to its squared distance to the nearest seed so far."""
+    seeds = [sample[rng.integers(len(sample))]]
+    # For unit vectors, squared distance is 2 - 2 * cosine similarity
+    distances = np.maximum(2.0 - 2.0 * (sample @ seeds[0]), 0.0)
+    for _ in range(1, k):
+        total = distances.sum()
+        if total <= 0: # fewer distinct vectors than clusters
+            break
+        seed = sample[rng.choice(len(sample), p=distances / total)]
+        seeds.append(seed)
+        distances = np.minimum(distances, np.maximum(2.0 - 2.0 * (sample @ seed), 0.0))
+    return np.asarray(seeds, dtype=np.float32)
+
+class ClusterIndex:
+    """
+    Mini-batch (spherical) k-means clustering of the collection's embeddings,
+    used to summarize thousands of chunks as a few dozen clusters.
+
+    Keeps the centroids, each cluster's size, and every chunk's cluster label
+    and similarity to its centroid at assignment time. Chunks added later are
+    assigned to their nearest centroid, which moves towards them with a
+    per-cluster learning rate of 1/size; removed chunks only drop out of the
+    sizes, so the centroids drift until the next rebuild.
+    """
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.sizes = np.zeros(len(self.centroids), dtype=np.int64)
+        self.ids = np.empty(0, dtype=object)
+        self.labels = np.empty(0, dtype=np.int32)
+        self.similarities = np.empty(0, dtype=np.float32)
+        self._row_by_id: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def cluster_count(self) -> int:
+        return len(self.centroids)
+
+    def _rebuild_id_map(self):
+        self._row_by_id = {id_val: row for row, id_val in enumerate(self.ids)}
+
+    def add(self, ids: Sequence[str], embeddings: Any):
+        """Assigns new (or replaced) chunks to their nearest cluster and updates those centroids."""
+        if len(ids) == 0:
+            return
+        self.remove([i for i in ids if i in self._row_by_id])
+        vectors = normalize_rows(embeddings)
+        labels, similarities = _nearest(vectors, self.centroids)
+        self._update_centroids(vectors, labels)
+        self.ids = np.concatenate([self.ids, np.asarray(list(ids), dtype=object)])
+        self.labels = np.concatenate([self.labels, labels])
+        self.similarities = np.concatenate([self.similarities, similarities.astype(np.float32)])
+        self._rebuild_id_map()
+
+    def _update_centroids(self, vectors: np.ndarray, labels: np.ndarray):
+        """
+        Mini-batch k-means step: each centroid becomes the running mean of
+        everything assigned to it, i.e. moves towards its batch members with
+        rate batch_count / total_count.
+        """
+        batch_counts = np.bincount(labels, minlength=self.cluster_count)
+        batch_sums = np.zeros_like(self.centroids)
+        np.add.at(batch_sums, labels, vectors)
+        self.sizes += batch_counts
+        touched = batch_counts > 0
+        self.centroids[touched] += (
+            batch_sums[touched] - batch_counts[touched, None] * self.centroids[touched]
+        ) / self.sizes[touched, None]
+
+    def remove(self, ids: Sequence[str]):
+        rows = [self._row_by_id[i] for i in ids if i in self._row_by_id]
+        if not rows:
+            return
+        np.subtract.at(self.sizes, self.labels[rows], 1)
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[rows] = False
+        self.ids = self.ids[keep]
+        self.labels = self.labels[keep]
+        self.similarities = self.similarities[keep]
+        self._rebuild_id_map()
+
+    def members(self, cluster_id: int) -> List[str]:
+        """IDs in a cluster, most central first."""
+        rows = np.flatnonzero(self.labels == cluster_id)
+        rows = rows[np.argsort(-self.similarities[rows], kind="stable")]
+        return self.ids[rows].tolist()
+
+    def summary(self, representatives: int = 3, neighbors: int = 3) -> List[Dict[str, Any]]:
+        """
+        Non-empty clusters, largest first, each with its most central chunk IDs
+        and the clusters whose centroids are most similar to it.
+        """
+        centroids = normalize_rows(self.centroids)
+        affinity = centroids @ centroids.T
+        np.fill_diagonal(affinity, -np.inf)
+        non_empty = np.flatnonzero(self.sizes > 0)
+        affinity[:, self.sizes <= 0] = -np.inf
+
+        # One sort groups rows by cluster, most central first within each
+        order = np.lexsort((-self.similarities, self.labels))
+        starts = np.searchsorted(self.labels[order], np.arange(self.cluster_count + 1))
+
+        clusters = []
+        for cluster_id in non_empty[np.argsort(-self.sizes[non_empty], kind="stable")]:
+            rows = order[starts[cluster_id]:min(starts[cluster_id] + representatives, starts[cluster_id + 1])]
+            closest = np.argsort(-affinity[cluster_id], kind="stable")[:neighbors]
+            clusters.append({
+                "cluster_id": int(cluster_id),
+                "size": int(self.sizes[cluster_id]),
+                "representative_ids": self.ids[rows].tolist(),
+                "neighbors": [
+                    {"cluster_id": int(other), "similarity": float(affinity[cluster_id, other])}
+                    for other in closest if np.isfinite(affinity[cluster_id, other])
+                ]
+            })
+        return clusters
+
+    def save(self, path: str = CLUSTER_INDEX_PATH):
+        np.savez_compressed(
+            path,
+            centroids=self.centroids,
+            sizes=self.sizes,
+            ids=self.ids.astype(str),
+            labels=self.labels,
+            similarities=self.similarities
+        )
+
+    @classmethod
+    def load(cls, path: str = CLUSTER_INDEX_PATH) -> "ClusterIndex":
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(data["centroids"])
+            index.sizes = data["sizes"]
+            index.ids = data["ids"].astype(object)
+            index.labels = data["labels"]
+            index.similarities = data["similarities"]
+        index._rebuild_id_map()
+        return index
+
+def _embedding_pages(collection: Any, page_size: int):
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["embeddings"])
+        if not page["ids"]:
+            return
+        yield page["ids"], normalize_rows(page["embeddings"])
+        offset += len(page["ids"])
+
+def build_cluster_index(
+    collection: Any,
+    cluster_count: int = CLUSTER_COUNT,
+    epochs: int = CLUSTER_EPOCHS,
+    page_size: int = 1000,
+    seed: Optional[int] = 0
+) -> ClusterIndex:
+    """
+    Clusters the collection's embeddings with mini-batch k-means, streaming
+    them page by page so only one page of float vectors is held at a time:
+    one pass to draw a reservoir sample for k-means++ seeding, `epochs`
+    passes of mini-batch updates (one batch per page), and a final pass that
+    assigns every chunk to its nearest centroid.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Reservoir sample, so seeding isn't biased towards the first pages
+    sample, seen = None, 0
+    for _, vectors in _embedding_pages(collection, page_size):
+        if sample is None:
+            sample = np.empty((CLUSTER_INIT_SAMPLE, vectors.shape[1]), dtype=np.float32)
+        fill = max(0, min(CLUSTER_INIT_SAMPLE - seen, len(vectors)))
+        sample[seen:seen + fill] = vectors[:fill]
+        # Row i of the stream replaces a random slot with probability CLUSTER_INIT_SAMPLE / (i + 1)
+        slots = rng.integers(np.arange(seen + fill, seen + len(vectors)) + 1)
+        replace = slots < CLUSTER_INIT_SAMPLE
+        sample[slots[replace]] = vectors[fill:][replace]
+        seen += len(vectors)
+    if sample is None:
+        raise ValueError("The collection is empty")
+    sample = sample[:min(seen, CLUSTER_INIT_SAMPLE)]
+
+    index = ClusterIndex(kmeans_plus_plus(sample, min(cluster_count, len(sample)), rng))
+    for _ in range(epochs):
+        for _, vectors in _embedding_pages(collection, page_size):
+            labels, _ = _nearest(vectors, index.centroids)
+            index._update_centroids(vectors, labels)
+
+    # Final assignment against the trained centroids; sizes restart from the real membership
+    ids, labels, similarities = [], [], []
+    for page_ids, vectors in _embedding_pages(collection, page_size):
+        page_labels, page_similarities = _nearest(vectors, index.centroids)
+        ids.extend(page_ids)
+        labels.append(page_labels)
+        similarities.append(page_similarities.astype(np.float32))
+    index.ids = np.asarray(ids, dtype=object)
+    index.labels = np.concatenate(labels)
+    index.similarities = np.concatenate(similarities)
+    index.sizes = np.bincount(index.labels, minlength=index.cluster_count).astype(np.int64)
+    index._rebuild_id_map()
+    logger.info(f"Clustered {len(index)} embeddings into {int((index.sizes > 0).sum())} clusters")
+    return index
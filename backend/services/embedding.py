@@ -0,0 +1,214 @@
+import os
+import time
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+from services.metrics import EMBEDDING_BATCH_SECONDS, EMBEDDING_TEXTS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Every API worker starts its own pool, so by default they split the cores between them
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+# ONNX Runtime threads per model instance; by default the pool's workers split the API worker's cores
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", max(1, (os.cpu_count() or 1) // (WEB_CONCURRENCY * EMBEDDING_WORKERS))))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+MAX_MODEL_TOKENS = 256 # MiniLM truncates longer inputs
+
+class MiniLMEmbedding:
+    """
+    all-MiniLM-L6-v2 in ONNX Runtime, with the model files, mean pooling and
+    normalization of Chroma's default embedding function. Unlike Chroma's,
+    which pads every input to MAX_MODEL_TOKENS, a batch is only padded to its
+    longest text, and the session runs on at most `threads` threads.
+    """
+
+    def __init__(self, threads: int = EMBEDDING_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_files = ONNXMiniLM_L6_V2()
+        model_files._download_model_if_not_exists()
+        folder = os.path.join(model_files.DOWNLOAD_PATH, model_files.EXTRACTED_FOLDER_NAME)
+        self.tokenizer = Tokenizer.from_file(os.path.join(folder, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_MODEL_TOKENS)
+        self.tokenizer.no_padding()
+        options = onnxruntime.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(folder, "model.onnx"), sess_options=options, providers=onnxruntime.get_available_providers()
+        )
+
+    def embed(self, texts: Sequence[str]) -> Tuple[np.ndarray, int, int]:
+        """
+        Embeds one batch.
+
+        Returns:
+            tuple: (normalized float32 vectors, real tokens, tokens including padding)
+        """
+        encodings = self.tokenizer.encode_batch(list(texts))
+        width = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.zeros((len(encodings), width), dtype=np.int64)
+        attention_mask = np.zeros_like(input_ids)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.ids)] = 1
+        hidden = self.session.run(None, {
+            "input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": np.zeros_like(input_ids)
+        })[0]
+        mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1e-12
+        return (vectors / norms).astype(np.float32), int(attention_mask.sum()), attention_mask.size
+
+    def __call__(self, input: Sequence[str]) -> List[np.ndarray]:
+        """Callable like a Chroma embedding function."""
+        return list(self.embed(input)[0])
+
+# Model instance owned by the current process (each pool worker loads its own)
+_worker_model = None
+
+def _init_worker(threads: int = EMBEDDING_THREADS):
+    """Pool initializer: load the embedding model once per worker process."""
+    global _worker_model
+    _worker_model = MiniLMEmbedding(threads)
+
+def _embed_batch(texts: List[str]) -> Tuple[np.ndarray, float, int, int]:
+    """Embeds one batch in the current process. Returns (vectors, seconds spent, real tokens, padded tokens)."""
+    if _worker_model is None:
+        _init_worker()
+    start = time.perf_counter()
+    if isinstance(_worker_model, MiniLMEmbedding):
+        vectors, tokens, padded_tokens = _worker_model.embed(texts)
+    else:
+        # Other embedders (e.g. the benchmarks' hash embedding) don't pad
+        vectors, tokens, padded_tokens = np.asarray(_worker_model(texts), dtype=np.float32), 0, 0
+    return vectors, time.perf_counter() - start, tokens, padded_tokens
+
+def bucket_by_length(texts: Sequence[str], batch_size: int) -> List[List[int]]:
+    """
+    Groups text indices into batches of similar length so each batch pads
+    to a length close to its longest member. Texts are ordered by character
+    count, since they are only tokenized in the pool's workers.
+
+    Returns:
+        list: Batches of indices into texts
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+class EmbeddingPool:
+    """
+    Local embedding service backed by a process pool. Each worker loads the
+    MiniLM model once, capped at `threads` ONNX Runtime threads so the
+    workers don't oversubscribe the cores; texts are submitted in
+    length-bucketed batches. With a single worker, embeddings are computed in
+    the calling process.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        bucket: bool = True,
+        threads: Optional[int] = None
+    ):
+        self.workers = workers or EMBEDDING_WORKERS
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        self.bucket = bucket
+        # A single worker embeds in this process, so it may use every core the pool would have
+        self.threads = threads or (EMBEDDING_THREADS if self.workers > 1 else EMBEDDING_THREADS * EMBEDDING_WORKERS)
+        self._executor = None
+        if self.workers > 1:
+            # Spawn rather than fork: the API process already runs ONNX and event-loop threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.threads,)
+            )
+            logger.info(f"Started embedding pool with {self.workers} workers of {self.threads} threads")
+
+    def embed(self, texts: Sequence[str]) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Embeds texts, preserving input order.
+
+        Returns:
+            tuple: (float32 array of shape (len(texts), dim), throughput stats)
+        """
+        start = time.perf_counter()
+        if self.bucket:
+            batches = bucket_by_length(texts, self.batch_size)
+        else:
+            batches = [list(range(i, min(i + self.batch_size, len(texts)))) for i in range(0, len(texts), self.batch_size)]
+
+        batch_texts = [[texts[i] for i in batch] for batch in batches]
+        if self._executor is not None:
+            outputs = list(self._executor.map(_embed_batch, batch_texts))
+        else:
+            if _worker_model is None:
+                _init_worker(self.threads)
+            outputs = [_embed_batch(batch) for batch in batch_texts]
+
+        vectors = None
+        batch_seconds = []
+        tokens = padded_tokens = 0
+        for batch, (batch_vectors, seconds, batch_tokens, batch_padded_tokens) in zip(batches, outputs):
+            if vectors is None:
+                vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[batch] = batch_vectors
+            batch_seconds.append(seconds)
+            tokens += batch_tokens
+            padded_tokens += batch_padded_tokens
+            EMBEDDING_BATCH_SECONDS.observe(seconds)
+        EMBEDDING_TEXTS.inc(len(texts))
+        if vectors is None:
+            vectors = np.empty((0, 0), dtype=np.float32)
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            "embedded_count": len(texts),
+            "batches": len(batches),
+            "workers": self.workers,
+            "elapsed_seconds": elapsed,
+            "embeddings_per_second": len(texts) / elapsed if elapsed > 0 else 0.0,
+            # Fraction of the tokens the model ran on that were real rather than padding
+            "batch_utilization": tokens / padded_tokens if padded_tokens else 1.0,
+            "mean_batch_seconds": float(np.mean(batch_seconds)) if batch_seconds else 0.0,
+        }
+        return vectors, stats
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_shared_pool = None
+
+def get_embedding_pool() -> EmbeddingPool:
+    """Returns the process-wide embedding pool, starting it on first use."""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = EmbeddingPool()
+    return _shared_pool
+
+def close_embedding_pool():
+    """Stops the process-wide embedding pool, if it was started."""
+    global _shared_pool
+    if _shared_pool is not None:
+        _shared_pool.close()
+        _shared_pool = None
@@ -0,0 +1,116 @@
+import os
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive advisory lock on `path`.lock, held by at most one process (and
+    one thread) on the host at a time. Blocks until the lock is free.
+    """
+    with open(f"{path}.lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+class SharedIndexFile:
+    """
+    An in-memory index persisted to a file that every API worker loads and
+    updates (the quantized, cluster and page vector indexes).
+
+    Reads reload the file when another process has replaced it since this
+    process last loaded or saved it. Updates hold a file lock across
+    reload-modify-save, so concurrent updates from different workers are
+    applied one after the other instead of overwriting each other. Saves
+    write a temporary file and rename it over the old one, so readers never
+    see a partial file. Changes applied without saving are kept until the
+    next save and re-applied whenever another process replaces the file in
+    the meantime, so they are not lost.
+    """
+
+    def __init__(self, path: str, load: Callable[[str], Any]):
+        self.path = path
+        self._load = load
+        self._index: Optional[Any] = None
+        self._mtime: Optional[int] = None
+        self._pending: List[Callable[[Any], None]] = []
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self) -> Optional[Any]:
+        """Returns the index, loading it if the file is new or changed; None if it was never built."""
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self._index = self._load(self.path)
+            self._mtime = mtime
+            for change in self._pending:
+                change(self._index)
+        return self._index
+
+    def _save(self, index: Any):
+        root, extension = os.path.splitext(self.path)
+        # Keeps the extension, since np.savez appends .npz to paths without it
+        temporary = f"{root}.{os.getpid()}.tmp{extension}"
+        index.save(temporary)
+        os.replace(temporary, self.path)
+        self._index = index
+        self._mtime = self._file_mtime()
+        self._pending = []
+
+    def save(self):
+        """Saves changes applied with save=False, if any."""
+        if not self._pending:
+            return
+        with file_lock(self.path):
+            index = self.get()
+            if index is not None:
+                self._save(index)
+
+    def replace(self, index: Any):
+        """Stores a rebuilt index for every worker."""
+        with file_lock(self.path):
+            self._save(index)
+
+    def apply(self, change: Callable[[Any], None], save: bool = True):
+        """
+        Calls change(index) on the current index under the file lock, unless it
+        was never built. With save=False the change is only written by a later
+        save(), which saves many small changes for the cost of one.
+        """
+        if self._file_mtime() is None:
+            return
+        with file_lock(self.path):
+            index = self.get()
+            if index is None:
+                return
+            change(index)
+            if save:
+                self._save(index)
+            else:
+                self._pending.append(change)
+
+    @contextmanager
+    def update(self, save: bool = True) -> Iterator[Optional[Any]]:
+        """
+        Yields the current index (None if never built) under the file lock and
+        saves it afterwards. With save=False the caller saves later with save().
+        """
+        if self._file_mtime() is None:
+            # Never built, so there is nothing to update (or lock)
+            yield None
+            return
+        with file_lock(self.path):
+            index = self.get()
+            yield index
+            if index is not None and save:
+                self._save(index)
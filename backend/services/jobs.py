@@ -0,0 +1,234 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services.page_index import SQLITE_BUSY_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Shared by every API worker on the host: one row per ingest job, plus a lock
+# row per tree that is being ingested
+JOB_REGISTRY_PATH = os.getenv("JOB_REGISTRY_PATH", "ingest_jobs.sqlite3")
+INGEST_LOCK_WAIT = float(os.getenv("INGEST_LOCK_WAIT", 600)) # seconds an ingest waits for another ingest of its tree
+INGEST_LOCK_POLL = 0.5 # seconds between attempts to take the lock
+INGEST_LOCK_HEARTBEAT = 30.0 # seconds between heartbeats of a held lock
+INGEST_LOCK_STALE = float(os.getenv("INGEST_LOCK_STALE", 900)) # a lock without heartbeats for this long is abandoned
+JOB_HISTORY = 1000 # finished jobs kept in the registry
+
+# Lock key of a workspace ingest, which covers every tree
+WORKSPACE_LOCK = "*"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    root_id TEXT NOT NULL,
+    target TEXT NOT NULL DEFAULT '',
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    status TEXT NOT NULL, -- waiting, running, succeeded, failed, rejected or abandoned
+    message TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at);
+CREATE TABLE IF NOT EXISTS ingest_locks (
+    root_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+
+class IngestBusyError(RuntimeError):
+    """Raised when an ingest gives up waiting for another ingest of the same tree."""
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobRegistry:
+    """
+    Registry of ingest jobs and per-tree ingest locks in a SQLite file shared
+    by every API worker process on the host.
+
+    A lock is keyed by the root page of the tree being ingested; a workspace
+    ingest takes WORKSPACE_LOCK, which conflicts with every other lock. Locks
+    whose process has exited, or that stopped sending heartbeats, are reaped
+    by the next process that looks at them.
+    """
+
+    def __init__(self, path: str = JOB_REGISTRY_PATH):
+        self.path = path
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+        # Autocommit mode, so writes can use BEGIN IMMEDIATE to serialize against other processes
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, statements):
+        """Runs statements(conn) in an IMMEDIATE transaction (one writer across all processes)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _reap_stale_locks(self, conn: sqlite3.Connection):
+        """Releases locks held by exited processes on this host or without recent heartbeats."""
+        now = time.time()
+        for lock in conn.execute("SELECT * FROM ingest_locks").fetchall():
+            exited = lock["host"] == self.host and not process_alive(lock["pid"])
+            if exited or now - lock["heartbeat"] > INGEST_LOCK_STALE:
+                logger.warning(f"Releasing ingest lock on {lock['root_id']} held by abandoned job {lock['job_id']}")
+                conn.execute("DELETE FROM ingest_locks WHERE root_id = ?", (lock["root_id"],))
+                conn.execute(
+                    "UPDATE jobs SET status = 'abandoned', finished_at = ? WHERE job_id = ? AND status = 'running'",
+                    (now, lock["job_id"])
+                )
+
+    def create_job(self, kind: str, root_id: str, target: str = "") -> str:
+        job_id = uuid.uuid4().hex
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO jobs (job_id, kind, root_id, target, host, pid, status, created_at) VALUES (?, ?, ?, ?, ?, ?, 'waiting', ?)",
+            (job_id, kind, root_id, target, self.host, os.getpid(), time.time())
+        ))
+        return job_id
+
+    def try_acquire(self, job_id: str, root_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Takes the ingest lock of root_id for a job unless a conflicting ingest holds it.
+
+        Returns:
+            dict: The conflicting lock, or None if the lock was taken
+        """
+        def acquire(conn):
+            self._reap_stale_locks(conn)
+            if root_id == WORKSPACE_LOCK:
+                holder = conn.execute("SELECT * FROM ingest_locks LIMIT 1").fetchone()
+            else:
+                holder = conn.execute(
+                    "SELECT * FROM ingest_locks WHERE root_id IN (?, ?) LIMIT 1", (root_id, WORKSPACE_LOCK)
+                ).fetchone()
+            if holder is not None:
+                return dict(holder)
+            now = time.time()
+            conn.execute(
+                "INSERT INTO ingest_locks (root_id, job_id, host, pid, acquired_at, heartbeat) VALUES (?, ?, ?, ?, ?, ?)",
+                (root_id, job_id, self.host, os.getpid(), now, now)
+            )
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ?", (now, job_id))
+            return None
+        return self._write(acquire)
+
+    def heartbeat(self, job_id: str):
+        self._write(lambda conn: conn.execute(
+            "UPDATE ingest_locks SET heartbeat = ? WHERE job_id = ?", (time.time(), job_id)
+        ))
+
+    def finish(self, job_id: str, status: str, message: str = ""):
+        """Records a job's outcome and releases its lock, if it holds one."""
+        def finish(conn):
+            conn.execute("DELETE FROM ingest_locks WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, finished_at = ? WHERE job_id = ?",
+                (status, message, time.time(), job_id)
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND job_id NOT IN "
+                "(SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                (JOB_HISTORY,)
+            )
+        self._write(finish)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._write(self._reap_stale_locks)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent jobs of every worker, newest first."""
+        self._write(self._reap_stale_locks)
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+_job_registry: Optional[JobRegistry] = None
+
+def get_job_registry() -> JobRegistry:
+    """Returns this process's connection to the job registry, opening it on first use."""
+    global _job_registry
+    if _job_registry is None:
+        _job_registry = JobRegistry(JOB_REGISTRY_PATH)
+    return _job_registry
+
+@asynccontextmanager
+async def ingest_lock(kind: str, root_id: str, target: str = "") -> AsyncIterator[Dict[str, Any]]:
+    """
+    Registers an ingest job and holds the ingest lock of its tree for the
+    duration of the block, waiting up to INGEST_LOCK_WAIT for a running
+    ingest of the same tree (in any worker) to finish.
+
+    Yields a dict with the job_id; set its "status" to "failed" (and its
+    "message") to record a failed ingest that didn't raise.
+
+    Raises:
+        IngestBusyError: If the tree is still locked after INGEST_LOCK_WAIT
+    """
+    registry = get_job_registry()
+    job = {"job_id": registry.create_job(kind, root_id, target), "status": "succeeded", "message": ""}
+    deadline = time.monotonic() + INGEST_LOCK_WAIT
+    while True:
+        holder = registry.try_acquire(job["job_id"], root_id)
+        if holder is None:
+            break
+        if time.monotonic() >= deadline:
+            message = (
+                f"Gave up on {root_id} after {INGEST_LOCK_WAIT:.0f}s: "
+                f"job {holder['job_id']} is still ingesting {holder['root_id']}"
+            )
+            registry.finish(job["job_id"], "rejected", message)
+            raise IngestBusyError(message)
+        await asyncio.sleep(INGEST_LOCK_POLL)
+
+    # From a thread, so heartbeats continue while the event loop is busy with synchronous work
+    stopped = threading.Event()
+    def send_heartbeats():
+        while not stopped.wait(INGEST_LOCK_HEARTBEAT):
+            try:
+                registry.heartbeat(job["job_id"])
+            except sqlite3.Error as e:
+                logger.warning(f"Could not record heartbeat of job {job['job_id']}: {e}")
+    heartbeat_thread = threading.Thread(target=send_heartbeats, name=f"ingest-heartbeat-{job['job_id'][:8]}", daemon=True)
+    heartbeat_thread.start()
+    try:
+        yield job
+    except BaseException as e:
+        job["status"], job["message"] = "failed", str(e) or type(e).__name__
+        raise
+    finally:
+        stopped.set()
+        registry.finish(job["job_id"], job["status"], job["message"])
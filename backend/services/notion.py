@@ -1,12 +1,23 @@
 import httpx
 import asyncio
+import functools
+import hashlib
 import os
-import json
 import sys
+import time
 import logging
 from dotenv import load_dotenv
-from typing import Dict, List, Tuple, Any, Optional
-from pprint import pprint
+from collections import Counter
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Tuple, Any, Optional
+from services.notion_extract import extract_blocks, format_table, rich_text_plain
+from services.snapshot import cached_json
+from services.page_index import get_page_index
+from services.jobs import IngestBusyError, WORKSPACE_LOCK, ingest_lock
+from services.timing import span, trace
+from services.metrics import (
+    NOTION_REQUESTS, NOTION_REQUEST_SECONDS, NOTION_RETRIES, INGEST_PAGES, INGEST_BLOCKS,
+    INGEST_DATABASE_ROWS, INGEST_CHUNKS, INGEST_JOB_SECONDS, CHUNKING_SECONDS
+)
 # from transformers import AutoTokenizer
 
 # --- 1. Centralized Logging (Best Practice) ---
@@ -35,24 +46,70 @@ NOTION_HEADERS = {
     "Notion-Version": NOTION_CONFIG['version']
 }
 
-# Block types that we can easily extract text from
-STRING_BLOCK_TYPES = {
-    'bulleted_list_item', 'child_page', 'code', 'embed', 'link_preview',
-    'numbered_list_item', 'paragraph', 'quote', 'to_do', 'toggle',
-    'heading_1', 'heading_2', 'heading_3'
-}
-
 HEADING_TYPES = {'heading_1', 'heading_2', 'heading_3'}
 
+# Notion rate limits with 429 + Retry-After; retry those and transient server errors
+NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", 3))
+NOTION_RETRY_BACKOFF = float(os.getenv("NOTION_RETRY_BACKOFF", 0.5)) # seconds, doubled per attempt
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+NOTION_MAX_CONNECTIONS = int(os.getenv("NOTION_MAX_CONNECTIONS", 20)) # per API worker
+
+# One connection pool per worker process, so requests reuse Notion connections
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide HTTP client, creating it on first use. A client is
+    bound to the event loop it was created on, so scripts that call
+    asyncio.run more than once get a new client per loop.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=NOTION_MAX_CONNECTIONS, max_keepalive_connections=NOTION_MAX_CONNECTIONS)
+        )
+        _http_client_loop = loop
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 # --- ASYNC FUNCTIONS ---
 
-async def fetch_url(url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
-    """Fetches a URL asynchronously and raises an exception for bad status codes."""
+async def send_request(method: str, url: str, headers: Optional[Dict[str, str]] = None, payload: Optional[Dict[str, Any]] = None) -> httpx.Response:
+    """
+    Sends a request and raises an exception for bad status codes.
+    Rate-limited (429) and transient 5xx responses are retried up to
+    NOTION_MAX_RETRIES times, honouring Notion's Retry-After header.
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, timeout=10.0)
-            response.raise_for_status() # Raises HTTPStatusError for 4xx/5xx responses
-            return response
+        client = get_http_client()
+        for attempt in range(NOTION_MAX_RETRIES + 1):
+            with span("notion.request", method=method, url=url, attempt=attempt) as request_span:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, url, headers=headers, json=payload, timeout=10.0)
+                except httpx.RequestError:
+                    NOTION_REQUESTS.inc(method=method, status="error")
+                    raise
+                finally:
+                    NOTION_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method)
+                NOTION_REQUESTS.inc(method=method, status=str(response.status_code))
+                if request_span is not None:
+                    request_span.attributes["status"] = response.status_code
+            if response.status_code not in RETRY_STATUS_CODES or attempt == NOTION_MAX_RETRIES:
+                break
+            NOTION_RETRIES.inc(status=str(response.status_code))
+            delay = float(response.headers.get("Retry-After", NOTION_RETRY_BACKOFF * 2 ** attempt))
+            logger.warning(f"HTTP {response.status_code} for {url}, retrying in {delay:.1f}s (attempt {attempt + 1}/{NOTION_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+        response.raise_for_status() # Raises HTTPStatusError for 4xx/5xx responses
+        return response
     except httpx.RequestError as exc:
         logger.error(f"HTTPX Request Error for {url}: {exc}", exc_info=True)
         raise # Re-raise to be handled by calling function
@@ -60,66 +117,96 @@ async def fetch_url(url: str, headers: Optional[Dict[str, str]] = None) -> httpx
         logger.error(f"HTTP Error {exc.response.status_code} for {url}: {exc.response.text}", exc_info=True)
         raise # Re-raise to be handled by calling function
 
+async def fetch_url(url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """Fetches a URL asynchronously and raises an exception for bad status codes."""
+    return await send_request("GET", url, headers)
+
+async def post_url(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """POSTs a JSON payload asynchronously and raises an exception for bad status codes."""
+    return await send_request("POST", url, headers, payload)
+
+async def fetch_block_children(block_id: str) -> List[Dict[str, Any]]:
+    """Fetches every child block of a block or page, following Notion's pagination cursors."""
+    results = []
+    cursor = None
+    while True:
+        url = f"{NOTION_CONFIG['base_url']}/v1/blocks/{block_id}/children?page_size=100"
+        if cursor:
+            url += f"&start_cursor={cursor}"
+        block_json = (await fetch_url(url, NOTION_HEADERS)).json()
+        results.extend(block_json['results'])
+        if not block_json.get('has_more'):
+            return results
+        cursor = block_json['next_cursor']
+
+async def get_block_children(block_id: str, last_edited_time: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Block children through the snapshot cache. Returns (children, from_snapshot).
+    last_edited_time is the container's edit time as reported by its parent.
+    """
+    return await cached_json("children", block_id, lambda: fetch_block_children(block_id), last_edited_time)
+
+async def get_page_json(page_id: str, last_edited_time: Optional[str] = None) -> Dict[str, Any]:
+    """Page object through the snapshot cache."""
+    async def fetch():
+        return (await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/pages/{page_id}", NOTION_HEADERS)).json()
+    page_json, _ = await cached_json("page", page_id, fetch, last_edited_time)
+    return page_json
+
 def get_title(page_json: Dict) -> str:
-    """Extracts the plain text title from a Notion page JSON."""
+    """
+    Extracts the plain text title from a Notion page JSON.
+    Standalone pages name their title property `title`; database rows use the
+    database's own column name (e.g. `Name`), so look it up by type.
+    """
     try:
-        # Notion titles are lists of rich_text objects, so access [0]['plain_text']
-        return page_json['properties']['title']['title'][0]['plain_text']
-    except (KeyError, IndexError, TypeError):
-        logger.warning(f"Could not extract title from page JSON: {json.dumps(page_json, indent=2)}")
+        for prop in page_json['properties'].values():
+            if prop.get('type') == 'title':
+                # Notion titles are lists of rich_text objects
+                return rich_text_plain(prop['title'])
+        raise KeyError('title')
+    except (KeyError, IndexError, TypeError, AttributeError):
+        logger.warning(f"Could not extract title from page {page_json.get('id', '<unknown>')}")
         return ""
 
-async def get_block_contents(block_id: str) -> Tuple[List[Tuple[Optional[str], str, str]], List[str]]:
+async def get_block_contents(block_id: str, last_edited_time: Optional[str] = None) -> Tuple[List[Tuple[Optional[str], str, str]], List[str]]:
     """
     Recursively fetches block contents and subpage IDs.
     Returns (list of (text, type, updated_at) tuples, list of subpage_ids).
+    last_edited_time is the container's edit time, used by the snapshot cache.
     """
     all_blocks_data = [] # Stores (text_content, block_type, updated_at)
     current_subpage_ids = []
 
     try:
-        block_res = await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/blocks/{block_id}/children", NOTION_HEADERS)
-        block_json = block_res.json()
+        blocks, from_snapshot = await get_block_children(block_id, last_edited_time)
+        INGEST_BLOCKS.inc(len(blocks))
+        entries, errors = extract_blocks(blocks)
+        for error in errors:
+            # Compact one-line records rather than dumping the whole block
+            logger.warning(f"Could not extract text from block {error['block_id']} ({error['type']}): {error['error']}")
 
-        for block in block_json['results']:
-            block_type = block["type"]
-            block_id_current = block["id"] # Use a distinct variable name
-            
-            # Extract updated_at timestamp
-            updated_at = block.get("last_edited_time", "")
+        tables = {block['id']: block['table'] for block in blocks if block.get('type') == 'table'}
 
-            if block_type == "child_page":
-                all_blocks_data.append((block_id_current, block_type, updated_at)) # Store ID for child_page
-                current_subpage_ids.append(block_id_current)
-                continue
-            elif block_type in STRING_BLOCK_TYPES:
-                try:
-                    # Access text content for various block types
-                    text_content = ""
-                    if 'rich_text' in block[block_type] and block[block_type]['rich_text']:
-                        text_content = block[block_type]['rich_text'][0]['plain_text']
-                    elif block_type == 'code' and 'caption' in block['code']: # Special handling for code captions
-                         text_content = block['code']['rich_text'][0]['plain_text']
-                    elif block_type == 'link_preview' and 'url' in block['link_preview']:
-                        text_content = block['link_preview']['url'] # Get URL for link_preview
-                    
-                    all_blocks_data.append((text_content, block_type, updated_at))
-
-                except (KeyError, IndexError, TypeError) as e:
-                    # Log the problematic block JSON and error, then continue instead of exiting
-                    logger.error(
-                        f"Error extracting text from block type '{block_type}' (ID: {block_id_current}): {e}\n"
-                        f"Problematic block JSON: {json.dumps(block, indent=2)}",
-                        exc_info=True # Includes traceback
-                    )
-                    all_blocks_data.append(("", block_type, updated_at)) # Append empty string to maintain structure
-                    continue # Continue processing other blocks
-
-                if block.get("has_children", False): # Safely check for 'has_children'
-                    # Recursively get children blocks and extend the lists
-                    child_blocks_data, child_subpage_ids = await get_block_contents(block_id_current)
-                    all_blocks_data.extend(child_blocks_data)
-                    current_subpage_ids.extend(child_subpage_ids)
+        for block_data, child_id in entries:
+            if block_data is not None:
+                text_content, block_type, updated_at = block_data
+                if block_type == 'child_page':
+                    current_subpage_ids.append(text_content)
+                elif block_type == 'table' and child_id is not None:
+                    # Rows are child blocks; render the whole table as one markdown block
+                    rows, _ = await get_block_children(child_id, updated_at if from_snapshot else None)
+                    all_blocks_data.append((format_table(tables[child_id], rows), block_type, updated_at))
+                    continue
+                all_blocks_data.append(block_data)
+
+            if child_id is not None:
+                # Recursively get children blocks and extend the lists. Nested blocks
+                # may only come from the snapshot if their container did too.
+                child_edit_time = block_data[2] if from_snapshot and block_data is not None else None
+                child_blocks_data, child_subpage_ids = await get_block_contents(child_id, child_edit_time)
+                all_blocks_data.extend(child_blocks_data)
+                current_subpage_ids.extend(child_subpage_ids)
 
     except Exception as e:
         logger.error(f"Error processing block children for {block_id}: {e}", exc_info=True)
@@ -168,185 +255,665 @@ def get_most_recent_timestamp(timestamps: List[str]) -> str:
     
     return ""
 
-# Redefine apply_hierarchy to yield chunks with context and metadata
+def content_hash(text: str) -> str:
+    """
+    Fingerprint of a chunk's own content, excluding the page titles and headings
+    prepended for context, so renames don't count as content changes.
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def title_context(ancestor_titles: Tuple[str, ...]) -> str:
+    """The "# Title" lines put in front of every chunk of a page."""
+    return "\n\n".join(f"# {title}" for title in ancestor_titles if title)
+
+class ChunkRecord:
+    """
+    A chunk ready for embedding. The text is stored as its markdown context
+    (page titles and active headings) plus the block's own content: chunks of
+    a page share one ancestor title tuple, and chunks under the same headings
+    share one headings tuple and one context string, so a chunk only adds its
+    own content to memory.
+
+    Fields are also readable by key (chunk["text"], chunk.get("properties")),
+    like the dict chunks the ChromaDB helpers accept.
+    """
+    __slots__ = (
+        "id", "context", "content", "content_hash", "source_page_id", "source_block_id", "page_title_path",
+        "active_headings", "block_type", "order_within_page", "last_updated", "properties"
+    )
+
+    def __init__(
+        self,
+        id: str,
+        context: str,
+        content: str,
+        source_page_id: str,
+        page_title_path: Tuple[str, ...],
+        active_headings: Tuple[str, ...],
+        block_type: str,
+        order_within_page: int,
+        last_updated: str,
+        properties: Optional[Dict[str, Any]] = None,
+        source_block_id: Optional[str] = None
+    ):
+        self.id = id
+        self.context = context
+        self.content = content
+        self.content_hash = content_hash(content) # Changes only when the block itself does
+        self.source_page_id = source_page_id
+        self.source_block_id = source_block_id
+        self.page_title_path = page_title_path
+        self.active_headings = active_headings
+        self.block_type = block_type
+        self.order_within_page = order_within_page
+        self.last_updated = last_updated
+        self.properties = properties
+
+    @property
+    def text(self) -> str:
+        if self.context and self.content:
+            return f"{self.context}\n\n{self.content}"
+        return self.context or self.content
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __repr__(self) -> str:
+        return f"ChunkRecord(id={self.id!r}, block_type={self.block_type!r}, text={self.text!r})"
+
+def format_block(content: str, block_type: str) -> Optional[str]:
+    """A block's own markdown, or None for blocks that don't produce a chunk (headings, child pages)."""
+    if block_type == 'paragraph':
+        return content
+    elif block_type == 'bulleted_list_item':
+        return f"- {content}"
+    elif block_type == 'numbered_list_item':
+        return f"1. {content}"  # Note: ChromaDB doesn't maintain list order, so we use 1.
+    elif block_type == 'code':
+        return f"```\n{content}\n```"
+    elif block_type == 'quote':
+        return f"> {content}"
+    elif block_type == 'to_do':
+        return f"- {content}"  # content already carries the [ ]/[x] checkbox
+    elif block_type == 'toggle':
+        return f"<details>\n<summary>{content}</summary>\n</details>"
+    elif block_type in ('link_preview', 'embed', 'bookmark'):
+        return f"[Link]({content})"
+    elif block_type == 'callout':
+        return f"> {content}"
+    elif block_type == 'equation':
+        return f"$$\n{content}\n$$"
+    elif block_type == 'table':
+        return content
+    # Child pages and databases are chunked by their own recursive calls
+    return None
+
 def apply_hierarchy_and_chunk(
     blocks_data: List[Tuple[Optional[str], str, str]],
-    ancestor_titles: List[str], # Renamed for clarity to reflect all page ancestors
+    ancestor_titles: Tuple[str, ...], # Titles of the page and all of its ancestors
     page_id: str # Pass the current page ID for metadata
-) -> List[Dict[str, Any]]:
+) -> List[ChunkRecord]:
     """
     Applies hierarchical context to block contents and generates structured chunks.
-    Yields dictionaries, each representing a chunk ready for embedding.
+    Returns one ChunkRecord per content block, in page order.
     """
     heading_level_map = {
         'heading_1': 1,
         'heading_2': 2,
         'heading_3': 3
     }
-    
+    MAX_CHUNK_TOKENS = 256 # Rough estimate: 1 word ~ 1.3 tokens
+
+    ancestor_titles = tuple(ancestor_titles)
+    page_context = title_context(ancestor_titles)
     current_headings = [None, None, None] # Stores the text of the active headings
-    current_heading_types = [None, None, None] # Stores the types of active headings
-    
+    current_heading_times = [None, None, None] # Stores the edit times of the active headings
+    # Shared by every chunk until the next heading changes them
+    context, active_headings, headings_updated = page_context, (), ""
+
     chunks_for_page = []
-    
+
     for i, (content, block_type, updated_at) in enumerate(blocks_data):
-        # Track headings for markdown formatting
         if block_type in HEADING_TYPES:
             idx = heading_level_map[block_type] - 1  # Convert to 0-based index
             current_headings[idx] = content
-            current_heading_types[idx] = block_type
+            current_heading_times[idx] = updated_at
             for j in range(idx + 1, len(current_headings)):
                 current_headings[j] = None
-                current_heading_types[j] = None
-        
-        # Prepare the core content for the chunk with markdown formatting
-        core_content = None
-        if block_type == 'paragraph':
-            core_content = content
-        elif block_type == 'bulleted_list_item':
-            core_content = f"- {content}"
-        elif block_type == 'numbered_list_item':
-            core_content = f"1. {content}"  # Note: ChromaDB doesn't maintain list order, so we use 1.
-        elif block_type == 'code':
-            core_content = f"```\n{content}\n```"
-        elif block_type == 'quote':
-            core_content = f"> {content}"
-        elif block_type == 'to_do':
-            # TODO: Add checkbox state from Notion API if available
-            core_content = f"- [ ] {content}"
-        elif block_type == 'toggle':
-            core_content = f"<details>\n<summary>{content}</summary>\n</details>"
-        elif block_type == 'link_preview':
-            core_content = f"[Link]({content})"
-        elif block_type == 'child_page':
-            # Child pages are handled by recursive calls to process_page,
-            # so they don't produce content chunks here.
-            # However, if you wanted a chunk for the *link itself*, you'd handle it here.
-            continue # Skip creating a content chunk for the child_page block itself
-
-        if core_content is not None:
-            # Build markdown-formatted context
-            markdown_context_parts = []
-            
-            # Add page title hierarchy with markdown formatting
-            for title in ancestor_titles:
-                if title:  # Only add non-empty titles
-                    markdown_context_parts.append(f"# {title}")
-            
-            # Add active headings with markdown formatting
-            for heading_text, heading_type in zip(current_headings, current_heading_types):
-                if heading_text and heading_type:
-                    level = heading_level_map[heading_type]
-                    markdown_prefix = "#" * level
-                    markdown_context_parts.append(f"{markdown_prefix} {heading_text}")
-            
-            # Add the core content
-            markdown_context_parts.append(core_content)
-            
-            # Join with newlines for proper markdown formatting
-            full_chunk_text_unsplit = "\n\n".join(filter(None, markdown_context_parts))
-            
-            # --- Sub-chunking for long texts ---
-            # This is a conceptual step. You'll need a proper tokenizer (e.g., from HuggingFace transformers)
-            # to count tokens accurately and split intelligently.
-            MAX_CHUNK_TOKENS = 256 # Example value
-            OVERLAP_TOKENS = 50    # Example value
-
-            # Dummy splitting for illustration - replace with actual tokenization/splitting
-            # For simplicity, let's just split by words here
-            words = full_chunk_text_unsplit.split()
-            
-            if len(words) * 1.3 > MAX_CHUNK_TOKENS: # Rough estimate: 1 word ~ 1.3 tokens
-                # Implement more sophisticated splitting for very long blocks
-                # For now, if it's too long, it might be truncated or split poorly.
-                # A proper solution involves iterating, tokenizing, and checking length.
-                # Example:
-                # from transformers import AutoTokenizer
-                # tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
-                # tokens = tokenizer.encode(full_chunk_text_unsplit)
-                # if len(tokens) > MAX_CHUNK_TOKENS:
-                #    ... splitting logic ...
-                logger.warning(f"Chunk from page {page_id} (block index {i}) is very long: {len(words)} words. May need splitting.")
-                # Fallback: Just use the full text if splitting isn't fully implemented yet
-                sub_chunks = [full_chunk_text_unsplit] 
-            else:
-                sub_chunks = [full_chunk_text_unsplit] # No need to split
-
-            # Collect timestamps from all blocks that contribute to this chunk
-            # This includes the current block and any heading blocks that provide context
-            chunk_timestamps = [updated_at]  # Start with current block's timestamp
-            
-            # Add timestamps from heading blocks that provide context
-            for j, (heading_content, heading_type, heading_timestamp) in enumerate(blocks_data):
-                if heading_type in HEADING_TYPES and heading_content in current_headings:
-                    chunk_timestamps.append(heading_timestamp)
-            
-            # Get the most recent timestamp for this chunk
-            most_recent_timestamp = get_most_recent_timestamp(chunk_timestamps)
-
-            # Get active headings for metadata (without markdown formatting)
-            active_headings_text = [h for h in current_headings if h is not None]
-
-            for sub_chunk_text in sub_chunks:
-                chunks_for_page.append({
-                    "id": f"{page_id}-{i}", # Unique ID for each block (or sub-chunk)
-                    "text": sub_chunk_text,
-                    "source_page_id": page_id,
-                    "source_block_id": blocks_data[i][0] if blocks_data[i][1] == 'child_page' else None, # The Notion block ID itself
-                    "page_title_path": list(ancestor_titles), # List of page titles in hierarchy
-                    "active_headings": active_headings_text, # List of active H1/H2/H3 texts
-                    "block_type": block_type,
-                    "order_within_page": i, # Maintain original order
-                    "last_updated": most_recent_timestamp, # Most recent update timestamp for this chunk
-                    # Add other Notion metadata here (e.g., creation date, last edited)
-                })
-    
+                current_heading_times[j] = None
+            heading_lines = [
+                f"{'#' * (level + 1)} {heading}" for level, heading in enumerate(current_headings) if heading
+            ]
+            context = "\n\n".join(filter(None, [page_context] + heading_lines))
+            active_headings = tuple(heading for heading in current_headings if heading is not None)
+            headings_updated = get_most_recent_timestamp(
+                [time for heading, time in zip(current_headings, current_heading_times) if heading is not None]
+            )
+            continue
+
+        core_content = format_block(content, block_type)
+        if core_content is None:
+            continue
+
+        chunk = ChunkRecord(
+            id=f"{page_id}-{i}", # Unique ID for each block
+            context=context,
+            content=core_content,
+            source_page_id=page_id,
+            page_title_path=ancestor_titles,
+            active_headings=active_headings,
+            block_type=block_type,
+            order_within_page=i, # Maintain original order
+            # The block's own edit or that of a heading it sits under, whichever is newest
+            last_updated=get_most_recent_timestamp([updated_at, headings_updated]),
+        )
+        words = len(chunk.text.split())
+        if words * 1.3 > MAX_CHUNK_TOKENS:
+            # Not split yet: a proper splitter needs the embedding model's tokenizer
+            logger.warning(f"Chunk from page {page_id} (block index {i}) is very long: {words} words. May need splitting.")
+        chunks_for_page.append(chunk)
+
     return chunks_for_page
 
-async def process_page(page_id: str, titles_stack: List[str], all_chunks: List[Dict[str, Any]] = None):
+async def chunk_page(
+    page_json: Dict[str, Any],
+    ancestor_titles: Tuple[str, ...] = (),
+    parent_id: Optional[str] = None
+) -> Tuple[List[ChunkRecord], Dict[str, str], List[str]]:
     """
-    Recursively processes a Notion page, its blocks, and its child pages.
-    titles_stack: a list used as a stack to keep track of ancestor page titles.
-    all_chunks: optional list to collect all chunks from all pages
+    Records a page in the page index and chunks its blocks, without descending
+    into child pages or databases.
+    ancestor_titles: titles of the page's ancestors, shared by all of its chunks
+    parent_id: the page (or database) this page was reached from, recorded in the page index
+
+    Returns:
+        tuple: (chunks, {child page ID: edit time}, child database IDs)
     """
-    
-    # Ensure titles_stack is correctly managed for recursion
-    original_titles_stack_len = len(titles_stack)
-    
+    page_id = page_json['id']
+    page_title = get_title(page_json)
+    page_titles = ancestor_titles + (page_title,)
+    previous_title = get_page_index().upsert_page(page_id, parent_id, page_title, page_json.get('last_edited_time', ""))
+    if previous_title is not None:
+        logger.info(f"Page {page_id} was renamed from '{previous_title}' to '{page_title}'")
+
+    # Get all blocks (including nested ones and child page IDs)
+    blocks_data, _ = await get_block_contents(page_id, page_json.get('last_edited_time'))
+
+    INGEST_PAGES.inc()
+
+    # Process the blocks with the current hierarchy (including this page's title)
+    with span("chunking", page_id=page_id, blocks=len(blocks_data)), CHUNKING_SECONDS.time():
+        page_chunks = apply_hierarchy_and_chunk(blocks_data, page_titles, page_id)
+    logger.debug(f"Chunked page {page_id} into {len(page_chunks)} chunks")
+
+    # Only the links are kept while the subtree is crawled, not the blocks
+    subpage_edit_times = {content: updated_at for content, block_type, updated_at in blocks_data if block_type == 'child_page'}
+    database_ids = [content for content, block_type, _ in blocks_data if block_type == 'child_database']
+    return page_chunks, subpage_edit_times, database_ids
+
+async def iter_page_chunks(
+    page_id: str,
+    ancestor_titles: Tuple[str, ...] = (),
+    last_edited_time: Optional[str] = None,
+    parent_id: Optional[str] = None,
+    failed: Optional[set] = None
+) -> AsyncIterator[List[ChunkRecord]]:
+    """
+    Recursively crawls a Notion page, its child pages and the rows of its
+    databases, yielding each page's chunks as soon as that page is chunked so
+    the caller can write them before the rest of the tree is fetched.
+    ancestor_titles: titles of the page's ancestors, shared by all of their chunks
+    last_edited_time: the page's edit time as reported by its parent block, if known
+    parent_id: the page (or database) this page was reached from, recorded in the page index
+    failed: optional set that collects the IDs of pages and databases whose crawl
+        failed, and so were not (fully) crawled along with their subtrees
+    """
+    page_title = None
     try:
         # Fetch page details
-        page_res = await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/pages/{page_id}", NOTION_HEADERS)
-        page_json = page_res.json()
-        
+        page_json = await get_page_json(page_id, last_edited_time)
         page_title = get_title(page_json)
-        titles_stack.append(page_title) # Add current page's title to the stack
+        page_chunks, subpage_edit_times, database_ids = await chunk_page(page_json, ancestor_titles, parent_id)
+    except Exception as e:
+        logger.error(f"Error processing page {page_id} (title: '{page_title or 'N/A'}'): {e}", exc_info=True)
+        if failed is not None:
+            failed.add(page_id)
+        return
 
-        # Get all blocks (including nested ones and child page IDs)
-        blocks_data, subpage_ids = await get_block_contents(page_id)
-        
-        # Process the blocks with the current hierarchy (including this page's title)
-        page_chunks = apply_hierarchy_and_chunk(blocks_data, titles_stack, page_id)
-        
-        # Print processed strings for this page
-        pprint(page_chunks)
-        
-        # Collect chunks if all_chunks list is provided
+    if page_chunks:
+        yield page_chunks
+    page_titles = ancestor_titles + (page_title,)
+    del page_chunks
+
+    # Recursively process subpages
+    for subpage_id, subpage_edit_time in subpage_edit_times.items():
+        async for chunks in iter_page_chunks(subpage_id, page_titles, subpage_edit_time, parent_id=page_id, failed=failed):
+            yield chunks
+
+    # Ingest the rows of any inline or full-page databases
+    for database_id in database_ids:
+        async for chunks in iter_database_chunks(database_id, page_titles, parent_id=page_id, failed=failed):
+            yield chunks
+
+async def process_page(page_id: str, titles_stack: List[str], all_chunks: Optional[List[ChunkRecord]] = None) -> int:
+    """
+    Crawls and chunks a Notion page and its descendants (see iter_page_chunks).
+    titles_stack: titles of the page's ancestors
+    all_chunks: optional list to collect all chunks from all pages
+
+    Returns:
+        int: Number of chunks produced
+    """
+    chunks_count = 0
+    async for page_chunks in iter_page_chunks(page_id, tuple(titles_stack)):
+        chunks_count += len(page_chunks)
         if all_chunks is not None:
             all_chunks.extend(page_chunks)
+    return chunks_count
+
+# --- DATABASE INGEST ---
 
-        # Recursively process subpages
-        for subpage_id in subpage_ids:
-            await process_page(subpage_id, titles_stack, all_chunks)
+DATABASE_ROW_BATCH_SIZE = int(os.getenv("DATABASE_ROW_BATCH_SIZE", 16))
 
+def get_database_title(database_json: Dict[str, Any]) -> str:
+    """Extracts the plain text title of a Notion database (a top-level rich_text list)."""
+    return rich_text_plain(database_json.get('title'))
+
+def get_property_value(prop: Dict[str, Any]) -> Any:
+    """
+    Flattens one Notion property value into a string, number or bool
+    (the types Chroma metadata accepts). Returns None for empty values.
+    """
+    prop_type = prop.get('type')
+    value = prop.get(prop_type)
+    if value is None:
+        return None
+    if prop_type in ('title', 'rich_text'):
+        return rich_text_plain(value) or None
+    if prop_type in ('number', 'checkbox', 'url', 'email', 'phone_number', 'created_time', 'last_edited_time', 'string', 'boolean'):
+        return value
+    if prop_type in ('select', 'status'):
+        return value.get('name')
+    if prop_type == 'multi_select':
+        return ", ".join(option['name'] for option in value) or None
+    if prop_type == 'date':
+        return f"{value['start']}/{value['end']}" if value.get('end') else value.get('start')
+    if prop_type == 'people':
+        return ", ".join(person.get('name') or person['id'] for person in value) or None
+    if prop_type == 'relation':
+        return ", ".join(related['id'] for related in value) or None
+    if prop_type in ('created_by', 'last_edited_by'):
+        return value.get('name') or value.get('id')
+    if prop_type == 'files':
+        return ", ".join(f.get('name', '') for f in value) or None
+    if prop_type == 'unique_id':
+        return f"{value['prefix']}-{value['number']}" if value.get('prefix') else value.get('number')
+    if prop_type in ('formula', 'rollup'):
+        # Both wrap a typed value, e.g. {"type": "number", "number": 3}
+        if value.get('type') == 'array':
+            return ", ".join(str(get_property_value(item)) for item in value['array']) or None
+        return get_property_value(value)
+    return None
+
+def flatten_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Flattens a row's properties into `prop_<name>` metadata fields, skipping empty values."""
+    flattened = {}
+    for name, prop in (properties or {}).items():
+        value = get_property_value(prop)
+        if value is not None and value != "":
+            flattened[f"prop_{name}"] = value
+    return flattened
+
+def properties_chunk(row_json: Dict[str, Any], ancestor_titles: Tuple[str, ...], properties: Dict[str, Any]) -> ChunkRecord:
+    """
+    A chunk describing a database row's properties, so rows without a page body
+    are still searchable.
+    """
+    property_lines = [f"{name[len('prop_'):]}: {value}" for name, value in properties.items()]
+    return ChunkRecord(
+        id=f"{row_json['id']}-properties",
+        context=title_context(ancestor_titles),
+        content="\n\n".join(property_lines),
+        source_page_id=row_json['id'],
+        page_title_path=tuple(ancestor_titles),
+        active_headings=(),
+        block_type="database_row",
+        order_within_page=-1,
+        last_updated=row_json.get('last_edited_time', ""),
+        properties=properties,
+    )
+
+async def query_database(database_id: str) -> List[Dict[str, Any]]:
+    """Fetches every row of a Notion database through the paginated query endpoint."""
+    async def fetch():
+        rows = []
+        payload: Dict[str, Any] = {"page_size": 100}
+        while True:
+            res = await post_url(f"{NOTION_CONFIG['base_url']}/v1/databases/{database_id}/query", payload, NOTION_HEADERS)
+            query_json = res.json()
+            rows.extend(query_json['results'])
+            if not query_json.get('has_more'):
+                return rows
+            payload["start_cursor"] = query_json['next_cursor']
+
+    # Always refetched outside replay: the rows are what report edit times
+    rows, _ = await cached_json("database_rows", database_id, fetch)
+    return rows
+
+async def process_database_row(row_json: Dict[str, Any], ancestor_titles: Tuple[str, ...], database_id: Optional[str] = None) -> Tuple[List[ChunkRecord], List[str]]:
+    """
+    Chunks a single database row: a properties chunk plus its page body, with the
+    flattened properties attached to every chunk. Returns (chunks, subpage_ids).
+    """
+    row_id = row_json['id']
+    INGEST_DATABASE_ROWS.inc()
+    row_title = get_title(row_json)
+    row_titles = tuple(ancestor_titles) + (row_title,)
+    get_page_index().upsert_page(row_id, database_id, row_title, row_json.get('last_edited_time', ""))
+    properties = flatten_properties(row_json.get('properties'))
+
+    blocks_data, subpage_ids = await get_block_contents(row_id, row_json.get('last_edited_time'))
+    row_chunks = [properties_chunk(row_json, row_titles, properties)]
+    with CHUNKING_SECONDS.time():
+        row_chunks.extend(apply_hierarchy_and_chunk(blocks_data, row_titles, row_id))
+    for chunk in row_chunks:
+        chunk.properties = properties
+    return row_chunks, subpage_ids
+
+async def iter_database_chunks(
+    database_id: str,
+    ancestor_titles: Tuple[str, ...],
+    parent_id: Optional[str] = None,
+    failed: Optional[set] = None
+) -> AsyncIterator[List[ChunkRecord]]:
+    """
+    Ingests every row of a Notion database, yielding each row's chunks. Rows
+    are processed concurrently in batches of DATABASE_ROW_BATCH_SIZE; pages
+    nested inside rows are then crawled recursively with iter_page_chunks.
+    failed: optional set that collects the IDs of the database or rows whose crawl failed
+    """
+    try:
+        async def fetch_database():
+            return (await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/databases/{database_id}", NOTION_HEADERS)).json()
+        database_json, _ = await cached_json("database", database_id, fetch_database)
+        database_title = get_database_title(database_json)
+        database_titles = tuple(ancestor_titles) + (database_title,)
+        get_page_index().upsert_page(
+            database_id, parent_id, database_title, database_json.get('last_edited_time', ""), object_type="database"
+        )
+        rows = await query_database(database_id)
+        logger.info(f"Processing {len(rows)} rows of database {database_id}")
     except Exception as e:
-        logger.error(f"Error processing page {page_id} (title: '{titles_stack[-1] if titles_stack else 'N/A'}'): {e}", exc_info=True)
-        # Depending on severity, you might want to re-raise or just log and continue for other pages
-    finally:
-        # Crucial for managing the `titles_stack` in a recursive context
-        # Pop the current page's title off the stack when done with it and its children
-        while len(titles_stack) > original_titles_stack_len:
-            titles_stack.pop()
+        logger.error(f"Error processing database {database_id}: {e}", exc_info=True)
+        if failed is not None:
+            failed.add(database_id)
+        return
+
+    for start in range(0, len(rows), DATABASE_ROW_BATCH_SIZE):
+        batch = rows[start:start + DATABASE_ROW_BATCH_SIZE]
+        results = await asyncio.gather(
+            *(process_database_row(row, database_titles, database_id) for row in batch),
+            return_exceptions=True
+        )
+        for row, result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing row {row['id']} of database {database_id}: {result}")
+                if failed is not None:
+                    failed.add(row['id'])
+                continue
+            row_chunks, subpage_ids = result
+            row_titles = row_chunks[0].page_title_path
+            yield row_chunks
+            for subpage_id in subpage_ids:
+                async for chunks in iter_page_chunks(subpage_id, row_titles, parent_id=row['id'], failed=failed):
+                    yield chunks
+
+async def embed_chunks(chunks: List[Dict[str, Any]]) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Embeds chunks in the local worker pool (off the event loop).
+    Returns (embeddings, embedding throughput stats).
+    """
+    from services.embedding import get_embedding_pool
+
+    pool = get_embedding_pool()
+    loop = asyncio.get_running_loop()
+    with span("embed", chunks=len(chunks)):
+        embeddings, embedding_stats = await loop.run_in_executor(
+            None, pool.embed, [chunk["text"] for chunk in chunks]
+        )
+    logger.info(
+        f"Embedded {embedding_stats['embedded_count']} chunks at "
+        f"{embedding_stats['embeddings_per_second']:.1f}/s "
+        f"(batch utilization {embedding_stats['batch_utilization']:.0%})"
+    )
+    return embeddings, embedding_stats
+
+# Chunks diffed, embedded and written together; pages are never split across batches
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 512))
+# Chunks written between saves of the local indexes during an ingest; the rest are saved by finish()
+LOCAL_INDEX_SAVE_CHUNKS = int(os.getenv("LOCAL_INDEX_SAVE_CHUNKS", 16384))
+
+def combine_embedding_stats(all_stats: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Throughput stats of several embed_chunks calls as if they were one."""
+    if not all_stats:
+        return None
+    embedded = sum(stats["embedded_count"] for stats in all_stats)
+    batches = sum(stats["batches"] for stats in all_stats)
+    elapsed = sum(stats["elapsed_seconds"] for stats in all_stats)
+    return {
+        "embedded_count": embedded,
+        "batches": batches,
+        "workers": all_stats[-1]["workers"],
+        "elapsed_seconds": elapsed,
+        "embeddings_per_second": embedded / elapsed if elapsed > 0 else 0.0,
+        "batch_utilization": sum(stats["batch_utilization"] * stats["batches"] for stats in all_stats) / batches if batches else 1.0,
+        "mean_batch_seconds": sum(stats["mean_batch_seconds"] * stats["batches"] for stats in all_stats) / batches if batches else 0.0,
+    }
+
+class ChunkSyncWriter:
+    """
+    Streams freshly crawled chunks into ChromaDB page by page, so an ingest
+    holds one batch of about INGEST_BATCH_SIZE chunks instead of the whole
+    tree. Each batch is diffed against the stored chunks of its pages: only
+    chunks with new content are embedded, chunks whose title path, headings or
+    other metadata changed are updated in place, and stored chunks that were
+    not reproduced are only deleted by finish(), so content that moved to a page
+    written earlier can still lend its embedding. Pass failed_page_ids to the
+    crawl as its `failed` set: pages whose crawl failed keep their stored
+    chunks instead of being emptied. The local indexes are saved every
+    LOCAL_INDEX_SAVE_CHUNKS chunks and by finish(), not once per batch.
+    """
+    COUNT_KEYS = ("inserted_count", "embedded_count", "reused_count", "updated_count", "unchanged_count", "deleted_count")
+
+    def __init__(self, reuse_from: Optional[Callable[[str], bool]] = None, batch_size: int = INGEST_BATCH_SIZE):
+        """
+        Args:
+            reuse_from: Filter on the pages whose stored chunks may lend their
+                embeddings to content that moved; see diff_chunks
+            batch_size: Chunks written together
+        """
+        self.batch_size = batch_size
+        self.chunk_counts: Counter = Counter() # chunks produced per page
+        self.failed_page_ids: set = set() # pages whose crawl failed, filled in by the crawl
+        self.result: Dict[str, Any] = {"success": True}
+        # Pages written earlier are always in scope: their replaced content is deleted last
+        self._reuse_from = None if reuse_from is None else (
+            lambda page_id: page_id in self.chunk_counts or reuse_from(page_id)
+        )
+        self._batch: List[ChunkRecord] = []
+        self._totals = Counter()
+        self._delete: List[str] = []
+        self._delete_page_ids: set = set()
+        self._embedding_stats: List[Dict[str, Any]] = []
+        self._unsaved_chunks = 0 # chunks written since the local indexes were last saved
+
+    @property
+    def chunks_count(self) -> int:
+        return sum(self.chunk_counts.values())
+
+    @property
+    def embedding_stats(self) -> Optional[Dict[str, Any]]:
+        return combine_embedding_stats(self._embedding_stats)
+
+    async def add(self, page_chunks: List[ChunkRecord]) -> bool:
+        """
+        Queues the chunks of one page, writing a batch once it is full.
+        Returns False once a write has failed (see result); later chunks are dropped.
+        """
+        if not self.result["success"]:
+            return False
+        self._batch.extend(page_chunks)
+        self.chunk_counts.update(chunk.source_page_id for chunk in page_chunks)
+        if len(self._batch) >= self.batch_size:
+            await self._flush()
+        return self.result["success"]
+
+    async def _flush(self):
+        from services.chroma import diff_chunks
+
+        batch, self._batch = self._batch, []
+        if not batch or not self.result["success"]:
+            return
+        page_ids = list(dict.fromkeys(chunk.source_page_id for chunk in batch))
+        with span("chroma.diff", chunks=len(batch), pages=len(page_ids)):
+            diff = diff_chunks(batch, page_ids, self._reuse_from)
+        self._delete.extend(diff["delete"])
+        self._delete_page_ids.update(diff["delete_page_ids"])
+        diff["delete"], diff["delete_page_ids"] = [], []
+        await self._apply(diff)
+
+    async def _apply(self, diff: Dict[str, Any]):
+        from services.chroma import apply_chunk_diff, save_local_indexes
+
+        embeddings = None
+        if diff["embed"]:
+            embeddings, embedding_stats = await embed_chunks(diff["embed"])
+            self._embedding_stats.append(embedding_stats)
+        with span("chroma.apply", embed=len(diff["embed"]), update=len(diff["update"]), delete=len(diff["delete"])):
+            sync_result = apply_chunk_diff(diff, embeddings, save_indexes=False)
+        if not sync_result["success"]:
+            self.result = sync_result
+            return
+        for key in self.COUNT_KEYS:
+            self._totals[key] += sync_result[key]
+        # Saving rewrites each index file whole, so saving every batch would make the ingest quadratic
+        self._unsaved_chunks += len(diff["embed"]) + len(diff["reuse"]) + len(diff["delete"])
+        if self._unsaved_chunks >= LOCAL_INDEX_SAVE_CHUNKS:
+            save_local_indexes()
+            self._unsaved_chunks = 0
+
+    async def finish(self, page_ids: Iterable[str]) -> Dict[str, Any]:
+        """
+        Writes the last batch, then deletes every stored chunk of page_ids (the
+        pages the crawl covered, including pages that have since been removed)
+        that the crawl did not produce. Pages in failed_page_ids are skipped:
+        they produced no chunks because their crawl failed, not because they
+        are empty.
+
+        Returns:
+            dict: Response containing counts for each kind of change, like apply_chunk_diff
+        """
+        from services.chroma import save_local_indexes
+
+        try:
+            return await self._finish(page_ids)
+        finally:
+            # Also on failure: the batches written so far are in Chroma and belong in the indexes
+            save_local_indexes()
+            self._unsaved_chunks = 0
+
+    async def _finish(self, page_ids: Iterable[str]) -> Dict[str, Any]:
+        from services.chroma import diff_chunks
+
+        await self._flush()
+        if not self.result["success"]:
+            return self.result
+        # Pages without any chunks now had none of theirs compared yet
+        unwritten = [
+            page_id for page_id in dict.fromkeys(page_ids)
+            if page_id not in self.chunk_counts and page_id not in self.failed_page_ids
+        ]
+        diff = diff_chunks([], unwritten)
+        diff["delete"] = self._delete + diff["delete"]
+        diff["delete_page_ids"] = sorted(self._delete_page_ids.union(diff["delete_page_ids"]))
+        self._delete, self._delete_page_ids = [], set()
+        await self._apply(diff)
+        if not self.result["success"]:
+            return self.result
+
+        totals = self._totals
+        self.result = {
+            "success": True,
+            "message": (
+                f"Embedded {totals['embedded_count']}, reused {totals['reused_count']}, updated {totals['updated_count']} "
+                f"and deleted {totals['deleted_count']} chunks ({totals['unchanged_count']} unchanged)"
+            ),
+            **{key: totals[key] for key in self.COUNT_KEYS}
+        }
+        logger.info(self.result["message"])
+        return self.result
+
+def page_tree_root(page_id: str) -> str:
+    """Ingest lock key of a page: its topmost known ancestor, or the page itself if it isn't indexed."""
+    ancestors = get_page_index().ancestors(page_id)
+    return ancestors[0]["page_id"] if ancestors else page_id
+
+def split_unseen_pages(unseen: Iterable[str], failed: Iterable[str]) -> Tuple[List[str], set]:
+    """
+    Separates the indexed pages a crawl did not see into stale pages, which
+    no longer exist where they were, and pages the crawl could not reach
+    because crawling them or one of their ancestors failed.
+
+    Returns:
+        tuple: (stale page IDs, IDs of pages whose stored chunks must be kept,
+            including the failed pages themselves)
+    """
+    page_index = get_page_index()
+    failed = set(failed)
+    unreached = failed.union(*(page_index.descendants(page_id) for page_id in failed))
+    stale_ids = [page_id for page_id in unseen if page_id not in unreached]
+    kept_ids = failed | unreached.intersection(unseen)
+    if kept_ids:
+        logger.warning(f"Keeping the stored chunks of {len(kept_ids)} pages that could not be crawled")
+    return stale_ids, kept_ids
 
+def ingest_job(kind: str, lock_root: Callable[..., str]):
+    """
+    Decorates an ingest entry point returning a result dict: the job is
+    registered in the job registry and serialized (across API workers) with
+    other ingests of the same tree, whose root lock_root(*args) returns. It is
+    traced as ingest.<kind> and its duration, outcome and chunk count are
+    recorded.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                async with ingest_lock(kind, lock_root(*args, **kwargs), ",".join(str(arg) for arg in args)) as job:
+                    start = time.perf_counter()
+                    with trace(f"ingest.{kind}", args=[str(arg) for arg in args], job_id=job["job_id"]) as job_span:
+                        result = await func(*args, **kwargs)
+                        if job_span is not None:
+                            job_span.attributes.update(success=result.get("success"), chunks=result.get("chunks_count", 0))
+                    if not result.get("success"):
+                        job["status"], job["message"] = "failed", result.get("message", "")
+            except IngestBusyError as e:
+                return {"success": False, "message": str(e), "chunks_count": 0, "error": str(e)}
+            result["job_id"] = job["job_id"]
+            outcome = "success" if result.get("success") else "failure"
+            INGEST_JOB_SECONDS.observe(time.perf_counter() - start, kind=kind, outcome=outcome)
+            INGEST_CHUNKS.inc(result.get("chunks_count", 0))
+            return result
+        return wrapper
+    return decorator
+
+@ingest_job("page", lock_root=page_tree_root)
 async def process_page_and_insert_to_chromadb(page_id: str) -> Dict[str, Any]:
     """
     Process a Notion page and insert all chunks into ChromaDB.
@@ -358,16 +925,20 @@ async def process_page_and_insert_to_chromadb(page_id: str) -> Dict[str, Any]:
         dict: Response containing processing and insertion results
     """
     try:
-        from services.chroma import insert_notion_chunks, delete_chunks_by_page_id
-        
-        # Initialize collection for all chunks
-        all_chunks = []
-        titles_stack = []
+        # Start from the page's known ancestry so paths match a workspace ingest
+        page_index = get_page_index()
+        ancestor_titles = tuple(page["title"] for page in page_index.ancestors(page_id, include_self=False))
+        # Moved content may lend its embedding if it comes from the same subtree
+        writer = ChunkSyncWriter(reuse_from=set(page_index.descendants(page_id)).__contains__)
+        crawl_started = time.time()
         
-        # Process the page and collect all chunks
-        await process_page(page_id, titles_stack, all_chunks)
+        # Write each batch of pages while the rest of the tree is crawled
+        async for page_chunks in iter_page_chunks(page_id, ancestor_titles, failed=writer.failed_page_ids):
+            if not await writer.add(page_chunks):
+                break
+        chunks_count = writer.chunks_count
         
-        if not all_chunks:
+        if not chunks_count:
             return {
                 "success": False,
                 "message": f"No chunks extracted from page {page_id}",
@@ -375,30 +946,38 @@ async def process_page_and_insert_to_chromadb(page_id: str) -> Dict[str, Any]:
                 "chunks_count": 0
             }
         
-        # Delete existing chunks for this page (to avoid duplicates)
-        # TODO: only update chunk if it contains a page that was updated
-        delete_result = delete_chunks_by_page_id(page_id)
-        if not delete_result["success"]:
-            logger.warning(f"Failed to delete existing chunks for page {page_id}: {delete_result['message']}")
-        
-        # Insert new chunks into ChromaDB
-        insert_result = insert_notion_chunks(all_chunks)
+        # Delete stored chunks of the whole subtree that the crawl didn't produce, including
+        # pages indexed by an earlier ingest that are no longer below this page, but not of
+        # pages the crawl failed to reach
+        page_ids = page_index.descendants(page_id)
+        stale_ids, kept_ids = split_unseen_pages(page_index.unseen_since(crawl_started, page_id), writer.failed_page_ids)
+        insert_result = await writer.finish([pid for pid in page_ids if pid not in kept_ids])
         
         if insert_result["success"]:
+            page_index.remove_pages(stale_ids)
+            page_index.set_chunk_counts(
+                writer.chunk_counts, [pid for pid in page_ids if pid not in kept_ids and pid not in stale_ids]
+            )
             return {
                 "success": True,
-                "message": f"Successfully processed and inserted {len(all_chunks)} chunks for page {page_id}",
+                "message": f"Successfully processed {chunks_count} chunks for page {page_id}: {insert_result['message']}",
                 "page_id": page_id,
-                "chunks_count": len(all_chunks),
+                "chunks_count": chunks_count,
+                "failed_pages": sorted(writer.failed_page_ids),
                 "inserted_count": insert_result["inserted_count"],
-                "deleted_previous": delete_result.get("deleted_count", 0)
+                "embedded_count": insert_result["embedded_count"],
+                "reused_count": insert_result["reused_count"],
+                "updated_count": insert_result["updated_count"],
+                "unchanged_count": insert_result["unchanged_count"],
+                "deleted_previous": insert_result["deleted_count"],
+                "embedding": writer.embedding_stats
             }
         else:
             return {
                 "success": False,
                 "message": f"Failed to insert chunks into ChromaDB: {insert_result['message']}",
                 "page_id": page_id,
-                "chunks_count": len(all_chunks),
+                "chunks_count": chunks_count,
                 "error": insert_result.get("error", "Unknown error")
             }
             
@@ -412,8 +991,475 @@ async def process_page_and_insert_to_chromadb(page_id: str) -> Dict[str, Any]:
             "error": str(e)
         }
 
+async def refresh_page_title(page_id: str) -> Dict[str, Any]:
+    """
+    Re-reads a page's title from Notion and, if it changed, rewrites the title
+    paths of the chunks of the page and its descendants without re-embedding.
+    
+    Args:
+        page_id: The Notion page ID to refresh
+    
+    Returns:
+        dict: Response containing the number of updated chunks
+    """
+    try:
+        from services.chroma import rename_page
+
+        # Always from the API: a recorded snapshot would hold the old title
+        page_json = (await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/pages/{page_id}", NOTION_HEADERS)).json()
+        result = rename_page(page_id, get_title(page_json))
+        result["page_id"] = page_id
+        return result
+    except Exception as e:
+        logger.error(f"Error refreshing title of page {page_id}: {e}", exc_info=True)
+        return {
+            "success": False,
+            "message": f"Error refreshing title of page {page_id}: {str(e)}",
+            "page_id": page_id,
+            "error": str(e)
+        }
+
+@ingest_job("page_sync", lock_root=lambda page_id, deleted=False: page_tree_root(page_id))
+async def sync_page_to_chromadb(page_id: str, deleted: bool = False) -> Dict[str, Any]:
+    """
+    Re-ingests a single changed page without recrawling its subpages: only
+    chunks whose content changed are embedded, and a rename or move is
+    propagated into the title paths of its descendants without re-embedding
+    them. Child pages and databases that aren't indexed yet are crawled in
+    full. A deleted or trashed page is removed together with its subtree.
+    
+    Args:
+        page_id: The changed Notion page ID
+        deleted: Whether the page is known to be deleted, which skips fetching it
+    
+    Returns:
+        dict: Response containing processing and insertion results
+    """
+    from services.chroma import delete_page_subtree, update_title_paths
+
+    try:
+        page_json = None
+        if not deleted:
+            try:
+                # Always from the API: a recorded snapshot would hold the old page
+                page_json = (await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/pages/{page_id}", NOTION_HEADERS)).json()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+        if page_json is None or page_json.get('archived') or page_json.get('in_trash'):
+            result = delete_page_subtree(page_id)
+            result.update(page_id=page_id, action="deleted")
+            return result
+
+        page_index = get_page_index()
+        previous_path = page_index.title_path(page_id) if page_index.get(page_id) else None
+        # Pages nested in blocks (toggles, columns, ...) belong to the page containing the block
+        graph = build_page_graph([page_json])
+        await resolve_block_parents(graph)
+        parent_id, parent_type = graph[page_id]["parent_id"], graph[page_id]["parent_type"]
+        ancestor_titles = tuple(page_index.title_path(parent_id)) if parent_id else ()
+
+        if parent_type in ('database_id', 'data_source_id'):
+            page_chunks, subpage_ids = await process_database_row(page_json, ancestor_titles, parent_id)
+            subpage_edit_times, database_ids = dict.fromkeys(subpage_ids), []
+        else:
+            page_chunks, subpage_edit_times, database_ids = await chunk_page(page_json, ancestor_titles, parent_id)
+        page_titles = ancestor_titles + (get_title(page_json),)
+
+        async def new_subtrees():
+            # Created since the last ingest, so everything below them is new content
+            for subpage_id, subpage_edit_time in subpage_edit_times.items():
+                if page_index.get(subpage_id) is None:
+                    async for chunks in iter_page_chunks(
+                        subpage_id, page_titles, subpage_edit_time, parent_id=page_id, failed=writer.failed_page_ids
+                    ):
+                        yield chunks
+            for database_id in database_ids:
+                if page_index.get(database_id) is None:
+                    async for chunks in iter_database_chunks(database_id, page_titles, parent_id=page_id, failed=writer.failed_page_ids):
+                        yield chunks
+
+        # Moved content may lend its embedding if it comes from the same tree
+        root_id = page_tree_root(page_id)
+        writer = ChunkSyncWriter(reuse_from=lambda source_page_id: page_tree_root(source_page_id) == root_id)
+        await writer.add(page_chunks)
+        async for chunks in new_subtrees():
+            if not await writer.add(chunks):
+                break
+        insert_result = await writer.finish([page_id] + list(writer.chunk_counts))
+
+        if insert_result["success"]:
+            page_index.set_chunk_counts(writer.chunk_counts, [page_id])
+            title_paths_updated = 0
+            if previous_path is not None and page_index.title_path(page_id) != previous_path:
+                # Renamed or moved: descendants keep their embeddings, only their title paths change
+                paths_result = update_title_paths(page_index.descendants(page_id, include_self=False))
+                title_paths_updated = paths_result.get("updated_count", 0)
+            return {
+                "success": True,
+                "message": f"Synced {writer.chunks_count} chunks for page {page_id}: {insert_result['message']}",
+                "page_id": page_id,
+                "action": "updated",
+                "chunks_count": writer.chunks_count,
+                "inserted_count": insert_result["inserted_count"],
+                "embedded_count": insert_result["embedded_count"],
+                "reused_count": insert_result["reused_count"],
+                "updated_count": insert_result["updated_count"],
+                "unchanged_count": insert_result["unchanged_count"],
+                "deleted_previous": insert_result["deleted_count"],
+                "title_paths_updated": title_paths_updated,
+                "failed_pages": sorted(writer.failed_page_ids),
+                "embedding": writer.embedding_stats
+            }
+        else:
+            return {
+                "success": False,
+                "message": f"Failed to sync page {page_id} to ChromaDB: {insert_result['message']}",
+                "page_id": page_id,
+                "chunks_count": writer.chunks_count,
+                "error": insert_result.get("error", "Unknown error")
+            }
+
+    except Exception as e:
+        logger.error(f"Error syncing page {page_id} to ChromaDB: {e}", exc_info=True)
+        return {
+            "success": False,
+            "message": f"Error syncing page {page_id}: {str(e)}",
+            "page_id": page_id,
+            "chunks_count": 0,
+            "error": str(e)
+        }
+
+# --- WORKSPACE INGEST ---
+
+WORKSPACE_CONCURRENCY = int(os.getenv("WORKSPACE_CONCURRENCY", 8))
+
+# Parent types that point at another object in the workspace
+PARENT_ID_KEYS = ('page_id', 'database_id', 'data_source_id', 'block_id')
+
+async def search_workspace() -> List[Dict[str, Any]]:
+    """
+    Enumerates every page and database shared with the integration through
+    Notion's paginated /v1/search endpoint.
+    """
+    async def fetch():
+        results = []
+        payload: Dict[str, Any] = {"page_size": 100}
+        while True:
+            res = await post_url(f"{NOTION_CONFIG['base_url']}/v1/search", payload, NOTION_HEADERS)
+            search_json = res.json()
+            results.extend(search_json['results'])
+            if not search_json.get('has_more'):
+                return results
+            payload["start_cursor"] = search_json['next_cursor']
+
+    # Always refetched outside replay: search results are what report edit times
+    results, _ = await cached_json("search", "workspace", fetch)
+    return results
+
+def get_parent_id(notion_object: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (parent_id, parent_type) from a Notion object's `parent` field, or (None, None) for workspace roots."""
+    parent = notion_object.get('parent') or {}
+    parent_type = parent.get('type')
+    if parent_type in PARENT_ID_KEYS:
+        return parent.get(parent_type), parent_type
+    return None, None
+
+def build_page_graph(objects: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Builds {object_id: {object, title, parent_id, parent_type, last_edited_time}}
+    from search results, so ancestry can be resolved without fetching pages.
+    """
+    graph = {}
+    for notion_object in objects:
+        parent_id, parent_type = get_parent_id(notion_object)
+        is_page = notion_object.get('object') == 'page'
+        graph[notion_object['id']] = {
+            "object": notion_object.get('object'),
+            "title": get_title(notion_object) if is_page else get_database_title(notion_object),
+            "parent_id": parent_id,
+            "parent_type": parent_type,
+            "last_edited_time": notion_object.get('last_edited_time', ""),
+        }
+        if is_page and parent_type in ('database_id', 'data_source_id'):
+            # Database rows: keep the row properties for chunk metadata
+            graph[notion_object['id']]["properties"] = flatten_properties(notion_object.get('properties'))
+    return graph
+
+async def resolve_block_parents(graph: Dict[str, Dict[str, Any]]):
+    """
+    Pages nested inside blocks (toggles, columns, ...) report a block as their parent.
+    Walks such blocks up to their containing page or database, one /v1/blocks lookup
+    per distinct block, and rewrites the graph's parent links in place.
+    """
+    block_owner: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    async def owner_of(block_id: str) -> Tuple[Optional[str], Optional[str]]:
+        seen = []
+        current = block_id
+        while current not in block_owner:
+            seen.append(current)
+            async def fetch_block(block_id=current):
+                return (await fetch_url(f"{NOTION_CONFIG['base_url']}/v1/blocks/{block_id}", NOTION_HEADERS)).json()
+            block_json, _ = await cached_json("block", current, fetch_block)
+            parent_id, parent_type = get_parent_id(block_json)
+            if parent_type != 'block_id':
+                block_owner[current] = (parent_id, parent_type)
+                break
+            current = parent_id
+        for block in seen:
+            block_owner[block] = block_owner[current]
+        return block_owner[block_id]
+
+    for node in graph.values():
+        if node["parent_type"] == 'block_id':
+            try:
+                node["parent_id"], node["parent_type"] = await owner_of(node["parent_id"])
+            except Exception as e:
+                logger.warning(f"Could not resolve block parent {node['parent_id']}: {e}")
+                node["parent_id"], node["parent_type"] = None, None
+
+def get_ancestor_titles(object_id: str, graph: Dict[str, Dict[str, Any]], cache: Dict[str, Tuple[str, ...]]) -> Tuple[str, ...]:
+    """
+    Title path from the workspace root down to (and including) object_id,
+    memoized in cache. Pages whose title is not known yet (None) contribute an
+    empty title, and paths through them are not memoized.
+    """
+    if object_id in cache:
+        return cache[object_id]
+    path = []
+    current = object_id
+    seen = set()
+    # Walk up until we reach a root, an object outside the graph, or an already-resolved ancestor
+    while current in graph and current not in cache and current not in seen:
+        seen.add(current)
+        path.append(current)
+        current = graph[current]["parent_id"]
+    prefix = cache.get(current, ())
+    resolved = True
+    for node_id in reversed(path):
+        title = graph[node_id]["title"]
+        resolved = resolved and title is not None
+        prefix = prefix + (title or "",)
+        if resolved:
+            cache[node_id] = prefix
+    return prefix
+
+async def iter_workspace_chunks(graph: Dict[str, Dict[str, Any]], failed: Optional[set] = None) -> AsyncIterator[List[ChunkRecord]]:
+    """
+    Crawls every page of a workspace page graph (see build_page_graph), yielding
+    each page's chunks. Ancestry titles come from the graph, and each page's
+    blocks are fetched exactly once by a bounded pool of concurrent workers.
+    Child pages found while crawling that search did not return are added to
+    the graph and queued too. IDs of pages whose crawl failed are added to
+    `failed`, if given.
+    """
+    title_cache: Dict[str, Tuple[str, ...]] = {}
+
+    claimed = set()
+    queue: asyncio.Queue = asyncio.Queue()
+    # Bounded, so workers wait for the consumer instead of piling up chunks
+    results: asyncio.Queue = asyncio.Queue(maxsize=WORKSPACE_CONCURRENCY)
+
+    def enqueue(page_id: str):
+        if page_id not in claimed:
+            claimed.add(page_id)
+            queue.put_nowait(page_id)
+
+    for object_id, node in graph.items():
+        if node["object"] == 'page':
+            enqueue(object_id)
+
+    # Pages discovered through a child_page block rather than search are fetched
+    # once, by their own worker or by the first descendant that needs their title
+    page_fetches: Dict[str, asyncio.Task] = {}
+
+    async def resolve_title(page_id: str):
+        if page_id not in page_fetches:
+            page_fetches[page_id] = asyncio.create_task(get_page_json(page_id))
+        page_json = await page_fetches[page_id]
+        graph[page_id]["title"] = get_title(page_json)
+        graph[page_id]["last_edited_time"] = page_json.get('last_edited_time', "")
+
+    async def resolve_ancestor_titles(page_id: str):
+        current, seen = graph[page_id]["parent_id"], set()
+        while current in graph and current not in seen:
+            seen.add(current)
+            if graph[current]["title"] is None:
+                try:
+                    await resolve_title(current)
+                except Exception as e:
+                    # Left out of the title path; the ancestor's own crawl records the failure
+                    logger.debug(f"Could not resolve the title of page {current}: {e}")
+            current = graph[current]["parent_id"]
+
+    # Pages whose parent page search did not return are chunked last: by then their
+    # parent has usually been discovered, so its title is in their title path
+    orphans: List[str] = []
+    defer_orphans = True
+
+    async def worker():
+        while True:
+            page_id = await queue.get()
+            try:
+                node = graph[page_id]
+                if defer_orphans and node["parent_type"] == 'page_id' and node["parent_id"] not in graph:
+                    orphans.append(page_id)
+                    continue
+                if node["title"] is None:
+                    await resolve_title(page_id)
+
+                blocks_data, subpage_ids = await get_block_contents(page_id, graph[page_id]["last_edited_time"])
+                for subpage_id in subpage_ids:
+                    if subpage_id not in graph:
+                        # Not returned by search: its parent is the page we just crawled
+                        graph[subpage_id] = {
+                            "object": 'page', "title": None, "parent_id": page_id,
+                            "parent_type": 'page_id', "last_edited_time": ""
+                        }
+                    enqueue(subpage_id)
+                await resolve_ancestor_titles(page_id)
+                ancestor_titles = get_ancestor_titles(page_id, graph, title_cache)
+                page_chunks = apply_hierarchy_and_chunk(blocks_data, ancestor_titles, page_id)
+                del blocks_data
+                properties = graph[page_id].get("properties")
+                if properties is not None:
+                    row_json = {"id": page_id, "last_edited_time": graph[page_id]["last_edited_time"]}
+                    page_chunks.insert(0, properties_chunk(row_json, ancestor_titles, properties))
+                    for chunk in page_chunks:
+                        chunk.properties = properties
+                if page_chunks:
+                    await results.put(page_chunks)
+            except Exception as e:
+                logger.error(f"Error processing workspace page {page_id}: {e}", exc_info=True)
+                if failed is not None:
+                    failed.add(page_id)
+            finally:
+                queue.task_done()
+
+    async def close_when_crawled():
+        nonlocal defer_orphans
+        await queue.join()
+        defer_orphans = False
+        for page_id in orphans:
+            queue.put_nowait(page_id)
+        await queue.join()
+        await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(WORKSPACE_CONCURRENCY)]
+    closer = asyncio.create_task(close_when_crawled())
+    try:
+        while True:
+            page_chunks = await results.get()
+            if page_chunks is None:
+                break
+            yield page_chunks
+    finally:
+        for task in workers + [closer] + list(page_fetches.values()):
+            task.cancel()
+
+    logger.info(f"Crawled {len(claimed)} workspace pages")
+
+async def process_workspace() -> Tuple[List[ChunkRecord], Dict[str, Dict[str, Any]]]:
+    """
+    Ingests every page accessible to the integration (see iter_workspace_chunks).
+    Pages are enumerated with /v1/search.
+
+    Returns:
+        tuple: (all chunks, page graph)
+    """
+    graph = build_page_graph(await search_workspace())
+    await resolve_block_parents(graph)
+    all_chunks: List[ChunkRecord] = []
+    async for page_chunks in iter_workspace_chunks(graph):
+        all_chunks.extend(page_chunks)
+    return all_chunks, graph
+
+@ingest_job("workspace", lock_root=lambda: WORKSPACE_LOCK)
+async def process_workspace_and_insert_to_chromadb() -> Dict[str, Any]:
+    """
+    Ingest every accessible Notion page and replace their chunks in ChromaDB.
+    
+    Returns:
+        dict: Response containing processing and insertion results
+    """
+    try:
+        crawl_started = time.time()
+        graph = build_page_graph(await search_workspace())
+        await resolve_block_parents(graph)
+        # Moved content may lend its embedding wherever it was stored before
+        writer = ChunkSyncWriter(reuse_from=lambda source_page_id: True)
+
+        # Write each batch of pages while the rest of the workspace is crawled
+        async for page_chunks in iter_workspace_chunks(graph, writer.failed_page_ids):
+            if not await writer.add(page_chunks):
+                break
+        chunks_count = writer.chunks_count
+        page_ids = [object_id for object_id, node in graph.items() if node["object"] == 'page']
+
+        if not chunks_count:
+            return {
+                "success": False,
+                "message": "No chunks extracted from the workspace",
+                "pages_count": len(page_ids),
+                "chunks_count": 0
+            }
+
+        # Pages indexed by earlier ingests that the workspace no longer contains, except
+        # those below pages the crawl failed on
+        page_index = get_page_index()
+        page_index.upsert_graph(graph)
+        stale_ids, kept_ids = split_unseen_pages(page_index.unseen_since(crawl_started), writer.failed_page_ids)
+
+        insert_result = await writer.finish([pid for pid in page_ids + stale_ids if pid not in kept_ids])
+
+        if insert_result["success"]:
+            page_index.remove_pages(stale_ids)
+            page_index.set_chunk_counts(writer.chunk_counts, [pid for pid in graph if pid not in kept_ids])
+            return {
+                "success": True,
+                "message": f"Successfully processed {chunks_count} chunks from {len(page_ids)} pages: {insert_result['message']}",
+                "pages_count": len(page_ids),
+                "chunks_count": chunks_count,
+                "failed_pages": sorted(writer.failed_page_ids),
+                "inserted_count": insert_result["inserted_count"],
+                "embedded_count": insert_result["embedded_count"],
+                "reused_count": insert_result["reused_count"],
+                "updated_count": insert_result["updated_count"],
+                "unchanged_count": insert_result["unchanged_count"],
+                "deleted_previous": insert_result["deleted_count"],
+                "embedding": writer.embedding_stats
+            }
+        else:
+            return {
+                "success": False,
+                "message": f"Failed to insert chunks into ChromaDB: {insert_result['message']}",
+                "pages_count": len(page_ids),
+                "chunks_count": chunks_count,
+                "error": insert_result.get("error", "Unknown error")
+            }
+
+    except Exception as e:
+        logger.error(f"Error processing workspace and inserting to ChromaDB: {e}", exc_info=True)
+        return {
+            "success": False,
+            "message": f"Error processing workspace: {str(e)}",
+            "chunks_count": 0,
+            "error": str(e)
+        }
+
 
 if __name__ == "__main__":
+    if "--workspace" in sys.argv:
+        # Ingest every page shared with the integration instead of a single tree
+        logger.info("Starting Notion workspace processing")
+        try:
+            chunks, page_graph = asyncio.run(process_workspace())
+            logger.info(f"Processing complete: {len(page_graph)} objects, {len(chunks)} chunks.")
+        except Exception as e:
+            logger.critical(f"Unhandled fatal error during processing: {e}", exc_info=True)
+        sys.exit(0)
+
     # Example usage: Replace with your actual Notion page ID
     initial_page_id = "21d9b1e8c8538094b211d71355b35569"
     
@@ -0,0 +1,109 @@
+"""
+Table-driven text extraction for Notion block objects.
+Kept free of configuration and network access so it can be benchmarked and
+reused on recorded API responses.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+def rich_text_plain(rich_text: Optional[List[Dict[str, Any]]]) -> str:
+    """Concatenates the plain text of every span in a rich_text list."""
+    return "".join(span.get('plain_text', '') for span in rich_text or [])
+
+def _rich_text(payload: Dict[str, Any]) -> str:
+    return rich_text_plain(payload.get('rich_text'))
+
+def _to_do(payload: Dict[str, Any]) -> str:
+    checkbox = "[x]" if payload.get('checked') else "[ ]"
+    return f"{checkbox} {rich_text_plain(payload.get('rich_text'))}"
+
+def _callout(payload: Dict[str, Any]) -> str:
+    icon = payload.get('icon') or {}
+    text = rich_text_plain(payload.get('rich_text'))
+    return f"{icon['emoji']} {text}" if icon.get('type') == 'emoji' else text
+
+def _equation(payload: Dict[str, Any]) -> str:
+    return payload['expression']
+
+def _url(payload: Dict[str, Any]) -> str:
+    return payload['url']
+
+def _table_row(payload: Dict[str, Any]) -> str:
+    return "| " + " | ".join(rich_text_plain(cell) for cell in payload['cells']) + " |"
+
+def _table(payload: Dict[str, Any]) -> str:
+    # The rows are child blocks; the caller renders them with format_table
+    return ""
+
+# Block type -> function extracting its text from block[block_type]
+BLOCK_EXTRACTORS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    'paragraph': _rich_text,
+    'heading_1': _rich_text,
+    'heading_2': _rich_text,
+    'heading_3': _rich_text,
+    'bulleted_list_item': _rich_text,
+    'numbered_list_item': _rich_text,
+    'quote': _rich_text,
+    'toggle': _rich_text,
+    'code': _rich_text,
+    'to_do': _to_do,
+    'callout': _callout,
+    'equation': _equation,
+    'embed': _url,
+    'bookmark': _url,
+    'link_preview': _url,
+    'table': _table,
+    'table_row': _table_row,
+}
+
+# Layout blocks with no text of their own whose children still hold content
+CONTAINER_BLOCK_TYPES = {'column_list', 'column', 'synced_block'}
+
+def extract_blocks(results: List[Dict[str, Any]]) -> Tuple[List[Tuple[Optional[Tuple[str, str, str]], Optional[str]]], List[Dict[str, str]]]:
+    """
+    Single pass over the `results` of a block-children response.
+
+    Returns:
+        tuple: (entries, errors) where each entry is ((text, block_type, updated_at), child_id).
+            child_id is the block ID to descend into for nested content, or None.
+            Container blocks (columns, synced blocks) have no block data, only a child_id.
+            child_page and child_database entries carry their ID as the text.
+            errors are compact {block_id, type, error} records for blocks that failed to parse.
+    """
+    entries = []
+    errors = []
+    for block in results:
+        block_type = block.get('type')
+        block_id = block.get('id')
+        updated_at = block.get('last_edited_time', "")
+
+        if block_type in ('child_page', 'child_database'):
+            entries.append(((block_id, block_type, updated_at), None))
+            continue
+
+        if block_type in CONTAINER_BLOCK_TYPES:
+            if block.get('has_children'):
+                entries.append((None, block_id))
+            continue
+
+        extractor = BLOCK_EXTRACTORS.get(block_type)
+        if extractor is None:
+            continue
+
+        try:
+            text = extractor(block[block_type])
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            errors.append({"block_id": block_id, "type": block_type, "error": repr(e)})
+            text = ""
+
+        child_id = block_id if block.get('has_children') else None
+        entries.append(((text, block_type, updated_at), child_id))
+    return entries, errors
+
+def format_table(table_payload: Dict[str, Any], row_blocks: List[Dict[str, Any]]) -> str:
+    """Renders a table block and its table_row children as a markdown table."""
+    rows = [_table_row(row['table_row']) for row in row_blocks if row.get('type') == 'table_row']
+    if rows and table_payload.get('has_column_header'):
+        width = table_payload.get('table_width') or rows[0].count("|") - 1
+        rows.insert(1, "|" + " --- |" * width)
+    return "\n".join(rows)
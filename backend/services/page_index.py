@@ -0,0 +1,280 @@
+import os
+import sqlite3
+import logging
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+PAGE_INDEX_PATH = os.getenv("PAGE_INDEX_PATH", "page_index.sqlite3")
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 30)) # seconds to wait for another process's write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id TEXT PRIMARY KEY,
+    object TEXT NOT NULL DEFAULT 'page',
+    parent_id TEXT,
+    title TEXT NOT NULL DEFAULT '',
+    depth INTEGER NOT NULL DEFAULT 0,
+    last_edited_time TEXT NOT NULL DEFAULT '',
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL DEFAULT 0 -- when an ingest last crawled the page
+);
+CREATE INDEX IF NOT EXISTS pages_parent ON pages (parent_id);
+-- One row per (ancestor, descendant) pair, including each page paired with itself
+CREATE TABLE IF NOT EXISTS page_closure (
+    ancestor_id TEXT NOT NULL,
+    descendant_id TEXT NOT NULL,
+    distance INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS page_closure_descendant ON page_closure (descendant_id, distance);
+"""
+
+# Every (ancestor of the parent) x (member of the subtree) pair that links a subtree under its parent
+_LINK_SUBTREE = """
+INSERT OR IGNORE INTO page_closure (ancestor_id, descendant_id, distance)
+SELECT above.ancestor_id, below.descendant_id, above.distance + below.distance + 1
+FROM page_closure above JOIN page_closure below
+WHERE above.descendant_id = ? AND below.ancestor_id = ?
+"""
+
+class PageIndex:
+    """
+    Local index of the Notion page tree (pages, databases and database rows).
+
+    Besides each page's parent, title, depth, edit time and chunk count it keeps
+    a closure table with one row per ancestor/descendant pair, so subtree and
+    ancestry lookups are a single indexed query instead of a walk. Pages may be
+    added in any order: a parent added after its children adopts them.
+    """
+
+    def __init__(self, path: str = PAGE_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # Shared across FastAPI's worker threads; access is serialized by the lock.
+        # Other API worker processes open the same file: WAL lets their reads run
+        # alongside a write, and the timeout waits out their write transactions.
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    # --- Reads ---
+
+    def get(self, page_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+        return dict(row) if row else None
+
+    def descendants(self, page_id: str, include_self: bool = True) -> List[str]:
+        """IDs in the subtree rooted at page_id, nearest first. Empty if the page is unknown."""
+        min_distance = 0 if include_self else 1
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT descendant_id FROM page_closure WHERE ancestor_id = ? AND distance >= ? ORDER BY distance",
+                (page_id, min_distance)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def ancestors(self, page_id: str, include_self: bool = True) -> List[Dict[str, Any]]:
+        """Pages from the topmost known ancestor down to page_id."""
+        min_distance = 0 if include_self else 1
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT pages.* FROM page_closure JOIN pages ON pages.page_id = page_closure.ancestor_id
+                WHERE page_closure.descendant_id = ? AND page_closure.distance >= ?
+                ORDER BY page_closure.distance DESC
+                """,
+                (page_id, min_distance)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def unseen_since(self, since: float, page_id: Optional[str] = None) -> List[str]:
+        """
+        Pages that no ingest has crawled since `since` (a time.time() value),
+        limited to the subtree of page_id if given.
+        """
+        with self._lock:
+            if page_id is None:
+                rows = self._conn.execute("SELECT page_id FROM pages WHERE last_seen < ?", (since,)).fetchall()
+            else:
+                rows = self._conn.execute(
+                    """
+                    SELECT pages.page_id FROM page_closure JOIN pages ON pages.page_id = page_closure.descendant_id
+                    WHERE page_closure.ancestor_id = ? AND pages.last_seen < ?
+                    """,
+                    (page_id, since)
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def title_path(self, page_id: str) -> List[str]:
+        """Titles from the topmost known ancestor down to page_id, as stored in page_title_path."""
+        return [page["title"] for page in self.ancestors(page_id)]
+
+    # --- Writes ---
+
+    def upsert_page(
+        self,
+        page_id: str,
+        parent_id: Optional[str],
+        title: str,
+        last_edited_time: str = "",
+        object_type: str = "page"
+    ) -> Optional[str]:
+        """
+        Adds or updates a page, moving its subtree if the parent changed. A
+        parent_id of None keeps the known parent (e.g. for the root of a
+        single-page ingest).
+
+        Returns:
+            str: The previous title if the page was renamed, otherwise None
+        """
+        with self._lock, self._conn:
+            existing = self._conn.execute(
+                "SELECT parent_id, title FROM pages WHERE page_id = ?", (page_id,)
+            ).fetchone()
+            if existing is None:
+                self._conn.execute(
+                    "INSERT INTO pages (page_id, object, parent_id, title, last_edited_time, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                    (page_id, object_type, parent_id, title or "", last_edited_time or "", time.time())
+                )
+                self._conn.execute(
+                    "INSERT INTO page_closure (ancestor_id, descendant_id, distance) VALUES (?, ?, 0)", (page_id, page_id)
+                )
+                if parent_id:
+                    self._conn.execute(_LINK_SUBTREE, (parent_id, page_id))
+                # Adopt children that were indexed before this page
+                orphans = self._conn.execute(
+                    "SELECT page_id FROM pages WHERE parent_id = ? AND page_id != ?", (page_id, page_id)
+                ).fetchall()
+                for orphan in orphans:
+                    self._conn.execute(_LINK_SUBTREE, (page_id, orphan[0]))
+                self._refresh_depths(page_id)
+                return None
+
+            self._conn.execute(
+                "UPDATE pages SET object = ?, title = ?, last_edited_time = ?, last_seen = ? WHERE page_id = ?",
+                (object_type, title or "", last_edited_time or "", time.time(), page_id)
+            )
+            if parent_id is not None and existing["parent_id"] != parent_id:
+                self._move(page_id, parent_id)
+            renamed = existing["title"] != (title or "")
+            return existing["title"] if renamed else None
+
+    def _move(self, page_id: str, parent_id: Optional[str]):
+        """Re-parents a subtree. Caller holds the lock and a transaction."""
+        # Unlink the subtree from every ancestor outside it, then link it under the new parent
+        self._conn.execute(
+            """
+            DELETE FROM page_closure
+            WHERE descendant_id IN (SELECT descendant_id FROM page_closure WHERE ancestor_id = ?1)
+              AND ancestor_id NOT IN (SELECT descendant_id FROM page_closure WHERE ancestor_id = ?1)
+            """,
+            (page_id,)
+        )
+        self._conn.execute("UPDATE pages SET parent_id = ? WHERE page_id = ?", (parent_id, page_id))
+        if parent_id:
+            # Guard against cycles from inconsistent parent data
+            cycle = self._conn.execute(
+                "SELECT 1 FROM page_closure WHERE ancestor_id = ? AND descendant_id = ?", (page_id, parent_id)
+            ).fetchone()
+            if cycle:
+                logger.warning(f"Not moving page {page_id} under its own descendant {parent_id}")
+            else:
+                self._conn.execute(_LINK_SUBTREE, (parent_id, page_id))
+        self._refresh_depths(page_id)
+
+    def _refresh_depths(self, page_id: str):
+        """Recomputes depth for the subtree rooted at page_id. Caller holds the lock."""
+        self._conn.execute(
+            """
+            UPDATE pages SET depth = (
+                SELECT MAX(distance) FROM page_closure WHERE descendant_id = pages.page_id
+            )
+            WHERE page_id IN (SELECT descendant_id FROM page_closure WHERE ancestor_id = ?)
+            """,
+            (page_id,)
+        )
+
+    def upsert_graph(self, graph: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Adds or updates every node of a workspace page graph (see build_page_graph).
+
+        Returns:
+            dict: {page_id: previous title} for renamed pages
+        """
+        renamed = {}
+        for object_id, node in graph.items():
+            previous = self.upsert_page(
+                object_id, node.get("parent_id"), node.get("title") or "",
+                node.get("last_edited_time") or "", node.get("object") or "page"
+            )
+            if previous is not None:
+                renamed[object_id] = previous
+        return renamed
+
+    def set_chunk_counts(self, counts: Dict[str, int], page_ids: Iterable[str] = ()):
+        """Stores chunk counts; pages in page_ids that are missing from counts are set to 0."""
+        rows = {page_id: 0 for page_id in page_ids}
+        rows.update(counts)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE pages SET chunk_count = ? WHERE page_id = ?",
+                [(count, page_id) for page_id, count in rows.items()]
+            )
+
+    def remove_pages(self, page_ids: Iterable[str]) -> int:
+        """Removes pages (not their subtrees) and every closure row that mentions them."""
+        ids = [(page_id,) for page_id in set(page_ids)]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM page_closure WHERE descendant_id = ?", ids)
+            self._conn.executemany("DELETE FROM page_closure WHERE ancestor_id = ?", ids)
+            self._conn.executemany("DELETE FROM pages WHERE page_id = ?", ids)
+        return len(ids)
+
+    def remove_subtree(self, page_id: str) -> List[str]:
+        """Removes a page and all of its descendants. Returns the removed IDs."""
+        subtree = self.descendants(page_id)
+        self.remove_pages(subtree)
+        return subtree
+
+    def clear(self):
+        """Removes every page."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM page_closure")
+            self._conn.execute("DELETE FROM pages")
+
+    def backup_to(self, path: str):
+        """Writes a consistent copy of the index to a new SQLite file."""
+        with self._lock, sqlite3.connect(path) as target:
+            self._conn.backup(target)
+
+    def restore_from(self, path: str):
+        """Replaces the contents of the index with a copy made by backup_to."""
+        with self._lock, sqlite3.connect(path) as source:
+            source.backup(self._conn)
+
+_page_index: Optional[PageIndex] = None
+
+def get_page_index() -> PageIndex:
+    """Returns the process-wide page index, opening it on first use."""
+    global _page_index
+    if _page_index is None:
+        _page_index = PageIndex(PAGE_INDEX_PATH)
+    return _page_index
+
+def subtree_ids(page_id: str) -> Set[str]:
+    """The page and its indexed descendants; just the page itself if it is not indexed."""
+    return set(get_page_index().descendants(page_id)) or {page_id}
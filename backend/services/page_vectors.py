@@ -0,0 +1,145 @@
+import os
+import logging
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.ranking import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+PAGE_VECTORS_PATH = os.getenv("PAGE_VECTORS_PATH", "page_vectors.npz")
+
+def page_means(page_ids: List[str], embeddings: Any) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Groups chunk embeddings by page. Returns (pages, unit-length mean vectors, chunk counts)."""
+    pages = sorted(set(page_ids))
+    row_by_page = {page_id: row for row, page_id in enumerate(pages)}
+    labels = np.fromiter((row_by_page[page_id] for page_id in page_ids), dtype=np.int64, count=len(page_ids))
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    sums = np.zeros((len(pages), embeddings.shape[1]), dtype=np.float32)
+    np.add.at(sums, labels, embeddings)
+    return pages, normalize_rows(sums), np.bincount(labels, minlength=len(pages))
+
+class PageVectorIndex:
+    """
+    One vector per Notion page: the normalized mean of its chunks' stored
+    embeddings, so "pages like this page" is a single matrix-vector product.
+
+    Pages whose chunks change are marked stale rather than recomputed on the
+    spot; the caller refreshes stale pages from the collection before reading.
+    """
+
+    def __init__(self, dimension: int):
+        self.page_ids = np.empty(0, dtype=object)
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.stale: set = set()
+        self._row_by_page: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.page_ids)
+
+    def _rebuild_page_map(self):
+        self._row_by_page = {page_id: row for row, page_id in enumerate(self.page_ids)}
+
+    def get(self, page_id: str) -> Optional[np.ndarray]:
+        """The page's vector, or None if it is unknown or stale."""
+        row = self._row_by_page.get(page_id)
+        if row is None or page_id in self.stale:
+            return None
+        return self.vectors[row]
+
+    def invalidate(self, page_ids: Iterable[str]):
+        self.stale.update(page_ids)
+
+    def set(self, page_ids: List[str], vectors: np.ndarray, counts: np.ndarray):
+        """Stores fresh vectors for pages; pages without chunks should be passed to remove instead."""
+        self.remove([page_id for page_id in page_ids if page_id in self._row_by_page])
+        self.page_ids = np.concatenate([self.page_ids, np.asarray(page_ids, dtype=object)])
+        self.vectors = np.concatenate([self.vectors, np.asarray(vectors, dtype=np.float32)])
+        self.counts = np.concatenate([self.counts, np.asarray(counts, dtype=np.int64)])
+        self.stale.difference_update(page_ids)
+        self._rebuild_page_map()
+
+    def remove(self, page_ids: Iterable[str]):
+        page_ids = list(page_ids)
+        self.stale.difference_update(page_ids)
+        rows = [self._row_by_page[page_id] for page_id in page_ids if page_id in self._row_by_page]
+        if not rows:
+            return
+        keep = np.ones(len(self.page_ids), dtype=bool)
+        keep[rows] = False
+        self.page_ids = self.page_ids[keep]
+        self.vectors = self.vectors[keep]
+        self.counts = self.counts[keep]
+        self._rebuild_page_map()
+
+    def nearest(self, vector: np.ndarray, n: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float, int]]:
+        """(page_id, cosine similarity, chunk count) for the n pages closest to vector."""
+        if not len(self):
+            return []
+        scores = self.vectors @ normalize_rows(np.asarray(vector).reshape(1, -1))[0]
+        for page_id in exclude:
+            row = self._row_by_page.get(page_id)
+            if row is not None:
+                scores[row] = -np.inf
+        n = min(n, len(self))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.page_ids[row], float(scores[row]), int(self.counts[row])) for row in top if np.isfinite(scores[row])]
+
+    def save(self, path: str = PAGE_VECTORS_PATH):
+        np.savez_compressed(
+            path,
+            page_ids=self.page_ids.astype(str),
+            vectors=self.vectors,
+            counts=self.counts,
+            stale=np.asarray(sorted(self.stale), dtype=str)
+        )
+
+    @classmethod
+    def load(cls, path: str = PAGE_VECTORS_PATH) -> "PageVectorIndex":
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(data["vectors"].shape[1])
+            index.page_ids = data["page_ids"].astype(object)
+            index.vectors = data["vectors"]
+            index.counts = data["counts"]
+            index.stale = set(data["stale"].tolist())
+        index._rebuild_page_map()
+        return index
+
+def build_page_vector_index(collection: Any, page_size: int = 1000) -> PageVectorIndex:
+    """Averages every page's stored chunk embeddings, streaming the collection page by page."""
+    row_by_page: Dict[str, int] = {}
+    sums, counts = None, None
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["embeddings", "metadatas"])
+        if not page["ids"]:
+            break
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        labels = np.fromiter(
+            (row_by_page.setdefault((metadata or {}).get("source_page_id", ""), len(row_by_page)) for metadata in page["metadatas"]),
+            dtype=np.int64, count=len(page["ids"])
+        )
+        if sums is None:
+            sums = np.zeros((max(len(row_by_page), 64), embeddings.shape[1]), dtype=np.float32)
+            counts = np.zeros(len(sums), dtype=np.int64)
+        if len(row_by_page) > len(sums):
+            # Grow geometrically so the copies stay linear overall
+            capacity = max(len(row_by_page), 2 * len(sums))
+            sums = np.concatenate([sums, np.zeros((capacity - len(sums), sums.shape[1]), dtype=np.float32)])
+            counts = np.concatenate([counts, np.zeros(capacity - len(counts), dtype=np.int64)])
+        np.add.at(sums, labels, embeddings)
+        counts += np.bincount(labels, minlength=len(counts))
+        offset += len(page["ids"])
+
+    if sums is None:
+        raise ValueError("The collection is empty")
+    # Chunks without a source page (e.g. seeded test documents) don't form a page
+    row_by_page.pop("", None)
+    pages = list(row_by_page)
+    rows = np.fromiter(row_by_page.values(), dtype=np.int64, count=len(pages))
+    index = PageVectorIndex(sums.shape[1])
+    index.set(pages, normalize_rows(sums[rows]), counts[rows])
+    logger.info(f"Built page vectors for {len(index)} pages from {offset} chunks")
+    return index
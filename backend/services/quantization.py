@@ -0,0 +1,193 @@
+import os
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+from services.ranking import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_INDEX_PATH = os.getenv("QUANTIZED_INDEX_PATH", "quantized_index.npz")
+QUANTIZATION_MODES = ("int8", "binary")
+SCORE_BLOCK_ROWS = 512 # int8 codes converted to float32 at a time when scoring, sized to stay in the CPU cache
+MIN_CAPACITY = 1024 # rows allocated for the codes of a new index; capacity doubles as it fills
+
+# Number of set bits for every byte value, for Hamming distances on packed codes
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+def quantize_int8(vectors: np.ndarray, scale: Optional[np.ndarray] = None):
+    """
+    Symmetric per-dimension int8 quantization.
+    Returns (codes, scale) where vectors ~= codes * scale.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if scale is None:
+        scale = np.abs(vectors).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Sign quantization packed to bits: 384 dims -> 48 bytes per vector."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Hamming distance from one packed query code to every packed row."""
+    xor = np.bitwise_xor(codes, query_code)
+    if hasattr(np, "bitwise_count"): # NumPy >= 2.0 has a native popcount
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.uint16)
+    return _POPCOUNT[xor].sum(axis=1)
+
+class QuantizedIndex:
+    """
+    Compact in-memory copy of the collection's embeddings, used to generate
+    search candidates cheaply. Holds the quantized codes plus an id map; the
+    full-precision vectors stay in Chroma and are only read for rescoring.
+
+    Codes live in arrays with spare capacity, so adding a batch costs the
+    size of the batch rather than of the index; removed rows are filled with
+    the last rows, so row order is not insertion order.
+    """
+
+    def __init__(self, mode: str = "int8"):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode '{mode}', expected one of {QUANTIZATION_MODES}")
+        self.mode = mode
+        self.scale = None # int8 only
+        self._ids = np.empty(0, dtype=object)
+        self._codes = None
+        self._size = 0
+        self._row_by_id: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    @property
+    def codes(self) -> Optional[np.ndarray]:
+        return None if self._codes is None else self._codes[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the quantized codes (excluding the id map)."""
+        return 0 if self._codes is None else int(self.codes.nbytes)
+
+    def _set_rows(self, ids: np.ndarray, codes: Optional[np.ndarray]):
+        """Replaces the contents with the given rows (no spare capacity)."""
+        self._ids, self._codes, self._size = ids, codes, len(ids)
+        self._row_by_id = {id_val: row for row, id_val in enumerate(ids)}
+
+    def _reserve(self, rows: int, template: np.ndarray):
+        """Makes room for `rows` more rows of codes shaped like template's rows."""
+        needed = self._size + rows
+        if self._codes is not None and needed <= len(self._codes):
+            return
+        capacity = max(needed, MIN_CAPACITY, 2 * (0 if self._codes is None else len(self._codes)))
+        codes = np.empty((capacity,) + template.shape[1:], dtype=template.dtype)
+        ids = np.empty(capacity, dtype=object)
+        if self._codes is not None:
+            codes[:self._size] = self.codes
+            ids[:self._size] = self.ids
+        self._codes, self._ids = codes, ids
+
+    def _encode(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = normalize_rows(embeddings)
+        if self.mode == "binary":
+            return quantize_binary(embeddings)
+        codes, scale = quantize_int8(embeddings, self.scale)
+        self.scale = scale
+        return codes
+
+    def add(self, ids: Sequence[str], embeddings: Any):
+        """Adds or replaces vectors for the given ids."""
+        if len(ids) == 0:
+            return
+        # The int8 scale is fixed by the first batch added; later batches are
+        # clipped to it, which is fine for normalized MiniLM embeddings.
+        codes = self._encode(np.asarray(embeddings, dtype=np.float32))
+        self._reserve(len(ids), codes)
+        # Known ids are overwritten in place, new ones appended
+        rows = np.empty(len(ids), dtype=np.intp)
+        for position, id_val in enumerate(ids):
+            row = self._row_by_id.get(id_val)
+            if row is None:
+                row = self._row_by_id[id_val] = self._size
+                self._ids[row] = id_val
+                self._size += 1
+            rows[position] = row
+        self._codes[rows] = codes
+
+    def remove(self, ids: Sequence[str]):
+        rows = {self._row_by_id.pop(i) for i in ids if i in self._row_by_id}
+        # Highest first, so the last row moved into a hole is never itself a hole
+        for row in sorted(rows, reverse=True):
+            last = self._size - 1
+            if row != last:
+                self._codes[row] = self._codes[last]
+                self._ids[row] = self._ids[last]
+                self._row_by_id[self._ids[row]] = row
+            self._ids[last] = None
+            self._size -= 1
+
+    def candidates(self, query_embedding: Sequence[float], n: int) -> List[str]:
+        """Returns the ids of the n best candidates by quantized similarity."""
+        if not len(self):
+            return []
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))
+        n = min(n, len(self))
+        if self.mode == "binary":
+            scores = -hamming_distances(self.codes, quantize_binary(query)[0]).astype(np.float32)
+        else:
+            # codes * scale approximates the stored vector, so fold the scale into the query
+            weights = query[0] * self.scale
+            codes = self.codes
+            scores = np.empty(len(self), dtype=np.float32)
+            # NumPy has no fast integer matmul: convert a cache-sized block at a time into
+            # one reused float32 buffer instead of converting the whole matrix per query
+            buffer = np.empty((min(SCORE_BLOCK_ROWS, len(self)), codes.shape[1]), dtype=np.float32)
+            for start in range(0, len(self), SCORE_BLOCK_ROWS):
+                block = codes[start:start + SCORE_BLOCK_ROWS]
+                np.copyto(buffer[:len(block)], block, casting="unsafe")
+                np.dot(buffer[:len(block)], weights, out=scores[start:start + len(block)])
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.ids[top].tolist()
+
+    def save(self, path: str = QUANTIZED_INDEX_PATH):
+        np.savez_compressed(
+            path,
+            mode=np.array(self.mode),
+            ids=self.ids.astype(str),
+            codes=self.codes if self.codes is not None else np.empty((0, 0), dtype=np.int8),
+            scale=self.scale if self.scale is not None else np.empty(0, dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path: str = QUANTIZED_INDEX_PATH) -> "QuantizedIndex":
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(str(data["mode"]))
+            ids = data["ids"].astype(object)
+            index._set_rows(ids, data["codes"] if len(ids) else None)
+            index.scale = data["scale"] if data["scale"].size else None
+        return index
+
+def build_quantized_index(collection: Any, mode: str = "int8", page_size: int = 1000) -> QuantizedIndex:
+    """Builds a QuantizedIndex by streaming the collection's embeddings page by page."""
+    index = QuantizedIndex(mode)
+    ids, codes = [], []
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["embeddings"])
+        if not page["ids"]:
+            break
+        # Encode page by page so only one page of float vectors is held at a time
+        ids.extend(page["ids"])
+        codes.append(index._encode(np.asarray(page["embeddings"], dtype=np.float32)))
+        offset += len(page["ids"])
+    if ids:
+        index._set_rows(np.asarray(ids, dtype=object), np.concatenate(codes))
+    logger.info(f"Built {mode} quantized index over {len(index)} embeddings ({index.nbytes} bytes)")
+    return index
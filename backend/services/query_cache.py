@@ -0,0 +1,84 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from typing import Optional
+
+from services.page_index import SQLITE_BUSY_TIMEOUT
+
+# --- Configuration ---
+# Query embeddings shared by every API worker on the host, so a repeated query
+# skips the model no matter which worker serves it
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "query_cache.sqlite3")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 10000)) # entries; 0 disables the cache
+QUERY_CACHE_TOUCH_INTERVAL = 300.0 # seconds; hits refresh last_used at most this often, to keep reads read-only
+QUERY_CACHE_EVICT_EVERY = 100 # inserts between evictions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_embeddings (
+    key BLOB PRIMARY KEY,
+    vector BLOB NOT NULL, -- float32
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used);
+"""
+
+class QueryEmbeddingCache:
+    """
+    Approximately least-recently-used cache of query embeddings in a SQLite
+    file, keyed by model name and query text.
+    """
+
+    def __init__(self, path: str = QUERY_CACHE_PATH, max_entries: int = QUERY_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = self.key(model, text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, last_used FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > QUERY_CACHE_TOUCH_INTERVAL:
+                with self._conn:
+                    self._conn.execute("UPDATE query_embeddings SET last_used = ? WHERE key = ?", (now, key))
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, model: str, text: str, vector) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (self.key(model, text), blob, time.time())
+            )
+            self._inserts += 1
+            if self._inserts % QUERY_CACHE_EVICT_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM query_embeddings WHERE key IN "
+                    "(SELECT key FROM query_embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+_query_cache: Optional[QueryEmbeddingCache] = None
+
+def get_query_cache() -> Optional[QueryEmbeddingCache]:
+    """Returns this process's connection to the query cache, or None if QUERY_CACHE_SIZE is 0."""
+    global _query_cache
+    if _query_cache is None and QUERY_CACHE_SIZE > 0:
+        _query_cache = QueryEmbeddingCache(QUERY_CACHE_PATH, QUERY_CACHE_SIZE)
+    return _query_cache
@@ -0,0 +1,74 @@
+import numpy as np
+from typing import List, Optional, Sequence
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row of a 2D array so dot products become cosine similarities.
+    Zero rows are left as zeros instead of producing NaNs.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def mmr_select(
+    query_embedding: Sequence[float],
+    candidate_embeddings: Sequence[Sequence[float]],
+    top_k: int,
+    diversity: float = 0.5,
+    page_ids: Optional[Sequence[str]] = None,
+    max_per_page: Optional[int] = None
+) -> List[int]:
+    """
+    Re-rank retrieval candidates with maximal marginal relevance (MMR) and an
+    optional cap on how many results may come from the same Notion page.
+
+    Args:
+        query_embedding: Embedding of the search query
+        candidate_embeddings: Embeddings of the retrieved candidates, in retrieval order
+        top_k: Number of candidates to select
+        diversity: 0.0 ranks purely by relevance, 1.0 purely by novelty
+        page_ids: Optional source page ID for each candidate (required for max_per_page)
+        max_per_page: Optional maximum number of selected candidates per page
+
+    Returns:
+        list: Indices into candidate_embeddings, in selection order
+    """
+    candidates = normalize_rows(candidate_embeddings)
+    n_candidates = candidates.shape[0]
+    if n_candidates == 0 or top_k <= 0:
+        return []
+
+    query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    relevance = candidates @ query
+    # Pairwise candidate similarities, computed once for the whole pool
+    pairwise = candidates @ candidates.T
+
+    trade_off = 1.0 - diversity
+    available = np.ones(n_candidates, dtype=bool)
+    # Highest similarity of each candidate to anything already selected
+    max_similarity = np.full(n_candidates, -np.inf, dtype=np.float32)
+
+    page_counts = {}
+    selected = []
+
+    while len(selected) < top_k and available.any():
+        if selected:
+            scores = trade_off * relevance - diversity * max_similarity
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+
+        best = int(np.argmax(scores))
+        available[best] = False
+
+        if max_per_page is not None and page_ids is not None:
+            page_id = page_ids[best]
+            if page_counts.get(page_id, 0) >= max_per_page:
+                continue
+            page_counts[page_id] = page_counts.get(page_id, 0) + 1
+
+        selected.append(best)
+        np.maximum(max_similarity, pairwise[best], out=max_similarity)
+
+    return selected
@@ -0,0 +1,163 @@
+import os
+import gzip
+import json
+import zlib
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+from services.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# off:         always hit the Notion API
+# record:      hit the API and append every response to the snapshot
+# replay:      serve everything from the snapshot, never touch the network
+# conditional: serve a container from the snapshot when its parent reports the
+#              same last_edited_time as the recorded copy, otherwise refetch
+SNAPSHOT_MODES = ("off", "record", "replay", "conditional")
+SNAPSHOT_MODE = os.getenv("NOTION_SNAPSHOT_MODE", "off")
+SNAPSHOT_PATH = os.getenv("NOTION_SNAPSHOT_PATH", "notion_snapshot.jsonl.gz")
+INDEX_READ_SIZE = 64 * 1024
+
+class SnapshotMissError(KeyError):
+    """Raised in replay mode when a response was never recorded."""
+
+class SnapshotStore:
+    """
+    Append-only store of raw Notion API responses.
+
+    Each record is one JSON line compressed as its own gzip member and appended
+    to the file, so writes never rewrite earlier data and the file is still a
+    valid .jsonl.gz. An in-memory index maps (kind, id) to the byte offset of the
+    latest record, so reads decompress a single member.
+
+    The index is only built from the file on load, so records appended by
+    another process are not seen and concurrent appends can interleave: use
+    one writing process (the API runs a single worker for this reason).
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._index: Dict[Tuple[str, str], Tuple[int, int, str]] = {} # key -> (offset, length, last_edited_time)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            self._load_index()
+
+    def _load_index(self):
+        with open(self.path, "rb") as f:
+            data = memoryview(f.read())
+        offset = 0
+        while offset < len(data):
+            # Decompress one gzip member, feeding it in slices so we never copy the file tail
+            decompressor = zlib.decompressobj(wbits=31)
+            parts = []
+            position = offset
+            while not decompressor.eof and position < len(data):
+                piece = data[position:position + INDEX_READ_SIZE]
+                parts.append(decompressor.decompress(piece))
+                position += len(piece)
+            if not decompressor.eof:
+                logger.warning(f"Ignoring truncated record at byte {offset} of {self.path}")
+                break
+            length = position - offset - len(decompressor.unused_data)
+            record = json.loads(b"".join(parts))
+            self._index[(record["kind"], record["id"])] = (offset, length, record.get("last_edited_time") or "")
+            offset += length
+        logger.info(f"Loaded snapshot index with {len(self._index)} records from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, kind: str, object_id: str) -> Optional[Tuple[str, Any]]:
+        """Returns (last_edited_time, data) of the latest record, or None."""
+        entry = self._index.get((kind, object_id))
+        if entry is None:
+            return None
+        offset, length, last_edited_time = entry
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = json.loads(gzip.decompress(f.read(length)))
+        return last_edited_time, record["data"]
+
+    def last_edited_time(self, kind: str, object_id: str) -> Optional[str]:
+        entry = self._index.get((kind, object_id))
+        return entry[2] if entry else None
+
+    def put(self, kind: str, object_id: str, data: Any, last_edited_time: Optional[str] = None):
+        """Appends a record; it supersedes earlier records for the same (kind, id)."""
+        line = json.dumps(
+            {"kind": kind, "id": object_id, "last_edited_time": last_edited_time or "", "data": data},
+            separators=(",", ":")
+        ).encode() + b"\n"
+        member = gzip.compress(line)
+        with self._lock:
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(member)
+            self._index[(kind, object_id)] = (offset, len(member), last_edited_time or "")
+
+_store: Optional[SnapshotStore] = None
+
+def configure_snapshot(mode: str, path: Optional[str] = None):
+    """Switches the snapshot mode (and optionally file) for this process."""
+    global SNAPSHOT_MODE, SNAPSHOT_PATH, _store
+    if mode not in SNAPSHOT_MODES:
+        raise ValueError(f"Unknown snapshot mode '{mode}', expected one of {SNAPSHOT_MODES}")
+    SNAPSHOT_MODE = mode
+    if path is not None and path != SNAPSHOT_PATH:
+        SNAPSHOT_PATH = path
+        _store = None
+
+def get_snapshot_store() -> Optional[SnapshotStore]:
+    """Returns the active store, or None when snapshots are off."""
+    global _store
+    if SNAPSHOT_MODE == "off":
+        return None
+    if _store is None:
+        _store = SnapshotStore(SNAPSHOT_PATH)
+    return _store
+
+async def cached_json(kind: str, object_id: str, fetch, last_edited_time: Optional[str] = None) -> Tuple[Any, bool]:
+    """
+    Returns (data, from_snapshot) for one Notion response, going through the
+    snapshot according to the current mode.
+
+    Args:
+        kind: Response kind, e.g. "page" or "children"
+        object_id: ID of the object the response describes
+        fetch: Coroutine function returning the response JSON from the API
+        last_edited_time: Edit time reported by the parent; in conditional mode the
+            recorded copy is reused only if it was recorded at this edit time
+    """
+    store = get_snapshot_store()
+    if store is None:
+        return await fetch(), False
+
+    if SNAPSHOT_MODE == "replay":
+        cached = store.get(kind, object_id)
+        if cached is None:
+            store.misses += 1
+            CACHE_LOOKUPS.inc(cache="snapshot", result="miss")
+            raise SnapshotMissError(f"No recorded {kind} response for {object_id}")
+        store.hits += 1
+        CACHE_LOOKUPS.inc(cache="snapshot", result="hit")
+        return cached[1], True
+
+    if SNAPSHOT_MODE == "conditional" and last_edited_time:
+        if store.last_edited_time(kind, object_id) == last_edited_time:
+            store.hits += 1
+            CACHE_LOOKUPS.inc(cache="snapshot", result="hit")
+            return store.get(kind, object_id)[1], True
+        store.misses += 1
+        CACHE_LOOKUPS.inc(cache="snapshot", result="miss")
+
+    data = await fetch()
+    store.put(kind, object_id, data, last_edited_time or _own_edit_time(data))
+    return data, False
+
+def _own_edit_time(data: Any) -> Optional[str]:
+    """Edit time carried by a response itself (pages and blocks have one, lists don't)."""
+    return data.get("last_edited_time") if isinstance(data, dict) else None
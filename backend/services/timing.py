@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Span tracing groups the stages of one ingest job or API request into a tree;
+# finished traces are kept in memory for /traces
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 100))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 5000)) # per trace; an ingest makes one span per Notion call
+
+# Per-request stage durations in seconds; None when nobody is recording
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_recent_traces: Deque[Dict[str, Any]] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+class Span:
+    """One timed operation in a trace. Children may be added from other tasks and threads."""
+    __slots__ = ("name", "attributes", "start", "duration", "children", "root")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], root: Optional["Span"] = None):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.children: List["Span"] = []
+        self.root = root or self
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+# Spans recorded per root, to cap the size of long ingest traces
+_span_counts: Dict[int, int] = {}
+
+@contextmanager
+def _open_span(name: str, attributes: Dict[str, Any], start_trace: bool) -> Iterator[Optional[Span]]:
+    parent = _current_span.get()
+    if not TRACING_ENABLED or (parent is None and not start_trace):
+        yield None
+        return
+    if parent is not None:
+        count = _span_counts.get(id(parent.root), 0)
+        if count >= TRACE_MAX_SPANS:
+            yield None
+            return
+        _span_counts[id(parent.root)] = count + 1
+    current = Span(name, attributes, parent.root if parent else None)
+    if parent is not None:
+        parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current_span.reset(token)
+        if parent is None:
+            spans = _span_counts.pop(id(current), 0) + 1
+            _recent_traces.append(current.to_dict())
+            logger.debug(f"Trace {name} finished in {current.duration * 1000:.1f}ms with {spans} spans")
+
+def trace(name: str, **attributes):
+    """
+    Starts a trace for an ingest job or API request, or a child span when one is
+    already active. Finished traces are kept for recent_traces. A no-op unless
+    TRACING_ENABLED.
+    """
+    return _open_span(name, attributes, start_trace=True)
+
+def span(name: str, **attributes):
+    """Records `name` as a child of the current span; a no-op outside a trace."""
+    return _open_span(name, attributes, start_trace=False)
+
+def recent_traces(limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent finished traces, newest first."""
+    return list(reversed(_recent_traces))[:limit]
+
+@contextmanager
+def record_stages() -> Iterator[Dict[str, float]]:
+    """Collects the durations of every `stage` entered in this context (and tasks/threads it spawns)."""
+    timings: Dict[str, float] = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator[None]:
+    """Times a block of work as `name` for record_stages and as a span of the current trace."""
+    timings = _stage_timings.get()
+    with span(name, **attributes):
+        if timings is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Formats stage durations as an HTTP Server-Timing header value (milliseconds)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items())
@@ -0,0 +1,181 @@
+import os
+import gzip
+import json
+import time
+import logging
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.chroma import collection, add_to_local_indexes, save_local_indexes, invalidate_page_vectors
+from services.page_index import PAGE_INDEX_PATH, get_page_index
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+TRANSFER_PAGE_SIZE = int(os.getenv("TRANSFER_PAGE_SIZE", 5000)) # rows per collection.get page and per shard
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+RECORDS_FILE = "records.jsonl.gz"
+PAGE_INDEX_FILE = "page_index.sqlite3"
+
+def _shard_name(number: int) -> str:
+    return f"embeddings-{number:05d}.npy"
+
+def _collection_pages(page_size: int) -> Iterator[Dict[str, Any]]:
+    """Streams the whole collection as collection.get pages."""
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+def export_collection(directory: str, page_size: int = TRANSFER_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Streams the collection to a directory: one float32 .npy shard of embeddings
+    per page, ids/documents/metadata as JSON lines in a single gzip stream (in
+    the same row order), a manifest, and a copy of the page index.
+
+    Writes to the collection during an export may be missed or duplicated,
+    since pages are read by offset.
+
+    Args:
+        directory: Output directory (created if needed; must not hold an export already)
+        page_size: Rows per collection.get call and per embeddings shard
+
+    Returns:
+        dict: Response containing the number of exported rows
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            raise FileExistsError(f"{directory} already contains an export")
+
+        start = time.perf_counter()
+        shards = []
+        dimension = None
+        with gzip.open(os.path.join(directory, RECORDS_FILE), "wt", encoding="utf-8") as records:
+            for page in _collection_pages(page_size):
+                embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+                dimension = embeddings.shape[1]
+                shard = _shard_name(len(shards))
+                np.save(os.path.join(directory, shard), embeddings)
+                shards.append({"file": shard, "rows": len(page["ids"])})
+                for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    records.write(json.dumps({"id": chunk_id, "document": document, "metadata": metadata or {}}) + "\n")
+                logger.info(f"Exported {sum(shard['rows'] for shard in shards)} rows")
+
+        # Consistent copy of the page tree, so subtree operations work after an import
+        if os.path.exists(PAGE_INDEX_PATH):
+            get_page_index().backup_to(os.path.join(directory, PAGE_INDEX_FILE))
+
+        count = sum(shard["rows"] for shard in shards)
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "collection": collection.name,
+            "count": count,
+            "dimension": dimension,
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "shards": shards,
+            "page_index": os.path.exists(os.path.join(directory, PAGE_INDEX_FILE)),
+        }
+        # Written last: a directory without a manifest is an incomplete export
+        with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        elapsed = time.perf_counter() - start
+        return {
+            "success": True,
+            "message": f"Exported {count} chunks to {directory} in {elapsed:.1f}s",
+            "exported_count": count,
+            "directory": directory
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error exporting collection: {str(e)}",
+            "exported_count": 0,
+            "error": str(e)
+        }
+
+def _read_records(records, count: int) -> List[Dict[str, Any]]:
+    rows = []
+    for _ in range(count):
+        line = records.readline()
+        if not line:
+            raise ValueError("records file is shorter than the manifest")
+        rows.append(json.loads(line))
+    return rows
+
+def import_collection(directory: str, batch_size: Optional[int] = None, restore_page_index: bool = True) -> Dict[str, Any]:
+    """
+    Streams an export made by export_collection into the collection with
+    upserts, one shard at a time. Stored embeddings are used as they are, so
+    nothing is re-embedded.
+
+    Args:
+        directory: Directory holding the export
+        batch_size: Rows per upsert (default: TRANSFER_PAGE_SIZE, capped at Chroma's maximum batch size)
+        restore_page_index: Replace the local page index with the exported one, if present
+
+    Returns:
+        dict: Response containing the number of imported rows
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported export format version {manifest.get('format_version')}")
+
+        from db.clients import chroma_client
+        batch_size = min(batch_size or TRANSFER_PAGE_SIZE, chroma_client.get_max_batch_size())
+
+        start = time.perf_counter()
+        imported = 0
+        imported_pages = set()
+        with gzip.open(os.path.join(directory, RECORDS_FILE), "rt", encoding="utf-8") as records:
+            for shard in manifest["shards"]:
+                embeddings = np.load(os.path.join(directory, shard["file"]), mmap_mode="r")
+                for offset in range(0, shard["rows"], batch_size):
+                    rows = _read_records(records, min(batch_size, shard["rows"] - offset))
+                    vectors = np.ascontiguousarray(embeddings[offset:offset + len(rows)])
+                    ids = [row["id"] for row in rows]
+                    collection.upsert(
+                        ids=ids,
+                        embeddings=vectors,
+                        documents=[row["document"] for row in rows],
+                        # Chroma rejects empty metadata dicts
+                        metadatas=[row["metadata"] or None for row in rows]
+                    )
+                    add_to_local_indexes(ids, vectors, save=False)
+                    imported_pages.update(row["metadata"].get("source_page_id", "") for row in rows)
+                    imported += len(rows)
+                logger.info(f"Imported {imported}/{manifest['count']} rows")
+
+        save_local_indexes()
+        invalidate_page_vectors(imported_pages)
+
+        page_index_restored = False
+        exported_index = os.path.join(directory, PAGE_INDEX_FILE)
+        if restore_page_index and manifest.get("page_index") and os.path.exists(exported_index):
+            get_page_index().restore_from(exported_index)
+            page_index_restored = True
+
+        elapsed = time.perf_counter() - start
+        return {
+            "success": True,
+            "message": f"Imported {imported} chunks from {directory} in {elapsed:.1f}s",
+            "imported_count": imported,
+            "page_index_restored": page_index_restored
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error importing collection: {str(e)}",
+            "imported_count": 0,
+            "error": str(e)
+        }
@@ -0,0 +1,279 @@
+import os
+import hmac
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.jobs import INGEST_LOCK_STALE, INGEST_LOCK_WAIT, JOB_REGISTRY_PATH, process_alive
+from services.page_index import SQLITE_BUSY_TIMEOUT
+from services.metrics import PAGE_SYNC_DELAY_SECONDS, WEBHOOK_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# The verification_token Notion sent when the webhook subscription was created;
+# events are signed with it, and rejected while it is unset
+NOTION_WEBHOOK_SECRET = os.getenv("NOTION_WEBHOOK_SECRET", "")
+WEBHOOK_DEBOUNCE = float(os.getenv("WEBHOOK_DEBOUNCE", 20)) # seconds without new events before a page is synced
+WEBHOOK_MAX_DELAY = float(os.getenv("WEBHOOK_MAX_DELAY", 120)) # seconds a page that keeps changing waits at most
+WEBHOOK_SYNC_CONCURRENCY = int(os.getenv("WEBHOOK_SYNC_CONCURRENCY", 2)) # page syncs per API worker at a time
+WEBHOOK_MAX_ATTEMPTS = 3 # syncs of a page before it is dropped from the queue
+WEBHOOK_POLL_INTERVAL = 1.0 # seconds between looks at the queue
+# A claim whose worker stopped without finishing the sync is released after this long
+WEBHOOK_CLAIM_STALE = INGEST_LOCK_WAIT + INGEST_LOCK_STALE
+
+# Page events and the sync they need; Notion also sends comment, database and
+# data source events, which don't change page content
+PAGE_EVENT_ACTIONS = {
+    "page.created": "update",
+    "page.content_updated": "update",
+    "page.properties_updated": "update",
+    "page.moved": "update",
+    "page.undeleted": "update",
+    "page.deleted": "delete",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_syncs (
+    page_id TEXT PRIMARY KEY,
+    action TEXT NOT NULL, -- update or delete, from the latest event
+    first_event REAL NOT NULL,
+    last_event REAL NOT NULL,
+    events INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    host TEXT, -- the worker syncing the page, while claimed
+    pid INTEGER,
+    claimed_at REAL,
+    dirty INTEGER NOT NULL DEFAULT 0 -- events arrived after the claim
+);
+CREATE INDEX IF NOT EXISTS page_syncs_last_event ON page_syncs (last_event);
+"""
+
+def sign(body: bytes, secret: str) -> str:
+    """The X-Notion-Signature header value for a request body."""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+def verify_signature(body: bytes, signature: str, secret: str = NOTION_WEBHOOK_SECRET) -> bool:
+    return bool(secret) and hmac.compare_digest(sign(body, secret), signature or "")
+
+def page_event(event: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """(page_id, action) for an event that changes a page, otherwise None."""
+    action = PAGE_EVENT_ACTIONS.get(event.get("type", ""))
+    entity = event.get("entity") or {}
+    if action is None or entity.get("type") != "page" or not entity.get("id"):
+        return None
+    return entity["id"], action
+
+class PageSyncQueue:
+    """
+    Pages waiting to be re-ingested after webhook events, in a SQLite file
+    shared by every API worker on the host (the job registry's).
+
+    Events for a page are coalesced into one row: it becomes due once no
+    event has arrived for WEBHOOK_DEBOUNCE seconds, or WEBHOOK_MAX_DELAY
+    seconds after its first event if edits keep coming. A worker claims due
+    rows before syncing them, so each page is synced by one worker at a
+    time; events that arrive during a sync mark the row dirty and it is
+    synced again afterwards.
+    """
+
+    def __init__(self, path: str = JOB_REGISTRY_PATH):
+        self.path = path
+        self.host = socket.gethostname()
+        self._lock = threading.Lock()
+        # Autocommit mode, so writes can use BEGIN IMMEDIATE to serialize against other processes
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, statements):
+        """Runs statements(conn) in an IMMEDIATE transaction (one writer across all processes)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def record(self, page_id: str, action: str):
+        """Queues a page, or pushes back the sync of an already queued page."""
+        now = time.time()
+        self._write(lambda conn: conn.execute(
+            """
+            INSERT INTO page_syncs (page_id, action, first_event, last_event, events) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (page_id) DO UPDATE SET
+                action = excluded.action, last_event = excluded.last_event, events = events + 1,
+                dirty = claimed_at IS NOT NULL
+            """,
+            (page_id, action, now, now)
+        ))
+
+    def claim_due(self, limit: int) -> List[Dict[str, Any]]:
+        """Claims up to limit due pages for this worker, oldest first."""
+        def claim(conn):
+            now = time.time()
+            for row in conn.execute("SELECT page_id, host, pid, claimed_at FROM page_syncs WHERE claimed_at IS NOT NULL").fetchall():
+                exited = row["host"] == self.host and not process_alive(row["pid"])
+                if exited or now - row["claimed_at"] > WEBHOOK_CLAIM_STALE:
+                    logger.warning(f"Releasing abandoned sync of page {row['page_id']}")
+                    conn.execute("UPDATE page_syncs SET host = NULL, pid = NULL, claimed_at = NULL WHERE page_id = ?", (row["page_id"],))
+            rows = conn.execute(
+                """
+                SELECT * FROM page_syncs
+                WHERE claimed_at IS NULL AND (last_event <= ? OR first_event <= ?)
+                ORDER BY first_event LIMIT ?
+                """,
+                (now - WEBHOOK_DEBOUNCE, now - WEBHOOK_MAX_DELAY, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE page_syncs SET host = ?, pid = ?, claimed_at = ?, dirty = 0, attempts = attempts + 1 WHERE page_id = ?",
+                [(self.host, os.getpid(), now, row["page_id"]) for row in rows]
+            )
+            return [dict(row) for row in rows]
+        return self._write(claim)
+
+    def complete(self, page_id: str, success: bool):
+        """
+        Releases a claimed page: it leaves the queue after a successful sync,
+        unless events arrived during the sync. Failed syncs are retried after
+        another debounce period, up to WEBHOOK_MAX_ATTEMPTS times.
+        """
+        def complete(conn):
+            row = conn.execute("SELECT dirty, attempts FROM page_syncs WHERE page_id = ?", (page_id,)).fetchone()
+            if row is None:
+                return
+            if row["dirty"]:
+                # Due again once the new events settle; earlier failures no longer count
+                conn.execute(
+                    "UPDATE page_syncs SET host = NULL, pid = NULL, claimed_at = NULL, dirty = 0, attempts = 0, first_event = last_event WHERE page_id = ?",
+                    (page_id,)
+                )
+            elif success or row["attempts"] >= WEBHOOK_MAX_ATTEMPTS:
+                if not success:
+                    logger.error(f"Giving up on syncing page {page_id} after {row['attempts']} attempts")
+                conn.execute("DELETE FROM page_syncs WHERE page_id = ?", (page_id,))
+            else:
+                now = time.time()
+                conn.execute(
+                    "UPDATE page_syncs SET host = NULL, pid = NULL, claimed_at = NULL, first_event = ?, last_event = ? WHERE page_id = ?",
+                    (now, now, page_id)
+                )
+        self._write(complete)
+
+    def pending(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Queued pages, oldest first, including those being synced."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM page_syncs ORDER BY first_event LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+_page_sync_queue: Optional[PageSyncQueue] = None
+
+def get_page_sync_queue() -> PageSyncQueue:
+    """Returns this process's connection to the page sync queue, opening it on first use."""
+    global _page_sync_queue
+    if _page_sync_queue is None:
+        _page_sync_queue = PageSyncQueue(JOB_REGISTRY_PATH)
+    return _page_sync_queue
+
+def handle_webhook(body: bytes, signature: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Checks and queues one Notion webhook delivery.
+
+    Args:
+        body: The raw request body, as signed by Notion
+        signature: The X-Notion-Signature header
+
+    Returns:
+        tuple: (response body, HTTP status code)
+    """
+    try:
+        event = json.loads(body)
+    except ValueError:
+        WEBHOOK_EVENTS.inc(type="unknown", outcome="rejected")
+        return {"success": False, "message": "Request body is not JSON"}, 400
+    if not isinstance(event, dict):
+        WEBHOOK_EVENTS.inc(type="unknown", outcome="rejected")
+        return {"success": False, "message": "Request body is not a JSON object"}, 400
+
+    if "verification_token" in event:
+        # Sent once when the subscription is created, before events can be signed
+        logger.warning(
+            f"Received a Notion webhook verification request. Confirm the subscription with this token "
+            f"and set it as NOTION_WEBHOOK_SECRET: {event['verification_token']}"
+        )
+        WEBHOOK_EVENTS.inc(type="verification", outcome="received")
+        return {"success": True, "message": "Verification token received"}, 200
+
+    event_type = event.get("type") or "unknown"
+    if not NOTION_WEBHOOK_SECRET:
+        WEBHOOK_EVENTS.inc(type=event_type, outcome="rejected")
+        return {"success": False, "message": "NOTION_WEBHOOK_SECRET is not configured"}, 503
+    if not verify_signature(body, signature):
+        WEBHOOK_EVENTS.inc(type=event_type, outcome="rejected")
+        return {"success": False, "message": "Invalid signature"}, 401
+
+    page = page_event(event)
+    if page is None:
+        WEBHOOK_EVENTS.inc(type=event_type, outcome="ignored")
+        return {"success": True, "message": f"Ignored {event_type} event", "queued": False}, 200
+    page_id, action = page
+    get_page_sync_queue().record(page_id, action)
+    WEBHOOK_EVENTS.inc(type=event_type, outcome="queued")
+    return {"success": True, "message": f"Queued {action} of page {page_id}", "queued": True, "page_id": page_id}, 200
+
+async def run_page_syncs(sync: Callable[..., Awaitable[Dict[str, Any]]], queue: Optional[PageSyncQueue] = None):
+    """
+    Syncs queued pages as they become due, WEBHOOK_SYNC_CONCURRENCY at a
+    time, until cancelled. Runs in every API worker; the queue hands each
+    page to one of them.
+
+    Args:
+        sync: Coroutine function called as sync(page_id, deleted=...) that
+            returns a result dict with "success"
+        queue: The queue to work on (default: the shared page sync queue)
+    """
+    queue = queue or get_page_sync_queue()
+    running: set = set()
+
+    async def sync_page(row: Dict[str, Any]):
+        page_id = row["page_id"]
+        try:
+            result = await sync(page_id, deleted=row["action"] == "delete")
+            success = bool(result.get("success"))
+            if not success:
+                logger.warning(f"Sync of page {page_id} failed: {result.get('message')}")
+        except Exception as e:
+            logger.error(f"Error syncing page {page_id}: {e}", exc_info=True)
+            success = False
+        queue.complete(page_id, success)
+        if success:
+            PAGE_SYNC_DELAY_SECONDS.observe(time.time() - row["first_event"])
+            logger.info(f"Synced page {page_id} after {row['events']} events")
+
+    try:
+        while True:
+            free = WEBHOOK_SYNC_CONCURRENCY - len(running)
+            if free > 0:
+                try:
+                    claimed = queue.claim_due(free)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not read the page sync queue: {e}")
+                    claimed = []
+                for row in claimed:
+                    task = asyncio.create_task(sync_page(row))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+            await asyncio.sleep(WEBHOOK_POLL_INTERVAL)
+    finally:
+        for task in running:
+            task.cancel()
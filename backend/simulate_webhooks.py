@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Sends signed Notion-style webhook events to a running API, to try near
+real-time sync without a public URL or a Notion webhook subscription. Each
+page gets a burst of events, like the ones Notion sends while someone types,
+which the API should coalesce into a single re-ingest per page.
+
+Usage (from backend/, with the API started with the same NOTION_WEBHOOK_SECRET):
+    python simulate_webhooks.py 21d9b1e8c8538094b211d71355b35569 --burst 10 --interval 0.5
+    python simulate_webhooks.py <page_id> --type page.deleted --burst 1
+    python simulate_webhooks.py --verify secret_local_test   # the subscription's verification request
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+from services.webhooks import PAGE_EVENT_ACTIONS, sign
+
+def page_event(page_id: str, event_type: str) -> dict:
+    """An event shaped like Notion's webhook deliveries."""
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        "workspace_id": "simulated-workspace",
+        "subscription_id": "simulated-subscription",
+        "integration_id": "simulated-integration",
+        "type": event_type,
+        "authors": [{"id": "simulated-user", "type": "person"}],
+        "attempt_number": 1,
+        "entity": {"id": page_id, "type": "page"},
+        "data": {},
+    }
+
+def post(client: httpx.Client, url: str, payload: dict, secret: str) -> httpx.Response:
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Notion-Signature"] = sign(body, secret)
+    return client.post(url, content=body, headers=headers)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("page_ids", nargs="*", help="Notion page IDs to send events for")
+    parser.add_argument("--url", default="http://localhost:8001/webhooks/notion", help="webhook endpoint")
+    parser.add_argument("--secret", default=os.getenv("NOTION_WEBHOOK_SECRET", ""), help="signing secret (default: NOTION_WEBHOOK_SECRET)")
+    parser.add_argument("--type", default="page.content_updated", help=f"event type, e.g. {', '.join(PAGE_EVENT_ACTIONS)}")
+    parser.add_argument("--burst", type=int, default=5, help="events per page")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between the events of a burst")
+    parser.add_argument("--verify", metavar="TOKEN", help="send a verification request with this token instead")
+    args = parser.parse_args()
+
+    with httpx.Client(timeout=10.0) as client:
+        if args.verify:
+            response = post(client, args.url, {"verification_token": args.verify}, "")
+            print(f"verification: HTTP {response.status_code} {response.text}")
+            sys.exit(0 if response.is_success else 1)
+
+        if not args.page_ids:
+            parser.error("give at least one page ID, or --verify")
+        failures = 0
+        for i in range(args.burst):
+            for page_id in args.page_ids:
+                response = post(client, args.url, page_event(page_id, args.type), args.secret)
+                failures += not response.is_success
+                print(f"{args.type} {page_id} [{i + 1}/{args.burst}]: HTTP {response.status_code} {response.json().get('message')}")
+            if i + 1 < args.burst:
+                time.sleep(args.interval)
+
+    print(f"Sent {args.burst * len(args.page_ids)} events for {len(args.page_ids)} pages; GET /page-syncs shows the queue")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
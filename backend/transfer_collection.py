@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Bulk export/import of the ChromaDB collection, for moving or restoring an
+environment without re-crawling Notion or re-embedding anything.
+
+Usage (from backend/):
+    python transfer_collection.py export backups/2025-06-01
+    python transfer_collection.py import backups/2025-06-01 --clear
+    python transfer_collection.py clear
+"""
+
+import argparse
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="stream the collection to a directory")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--page-size", type=int, help="rows per page and per embeddings shard")
+
+    import_parser = commands.add_parser("import", help="stream an export into the collection")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--batch-size", type=int, help="rows per upsert")
+    import_parser.add_argument("--clear", action="store_true", help="clear the collection first")
+    import_parser.add_argument("--keep-page-index", action="store_true", help="don't replace the local page index")
+
+    commands.add_parser("clear", help="delete every document from the collection")
+    args = parser.parse_args()
+
+    # Imported here so --help works without a running ChromaDB
+    from seed_database import clear_database
+    from services.transfer import TRANSFER_PAGE_SIZE, export_collection, import_collection
+
+    if args.command == "export":
+        result = export_collection(args.directory, args.page_size or TRANSFER_PAGE_SIZE)
+    elif args.command == "import":
+        if args.clear:
+            result = clear_database()
+            if not result["success"]:
+                print(result["message"], file=sys.stderr)
+                sys.exit(1)
+        result = import_collection(args.directory, args.batch_size, restore_page_index=not args.keep_page_index)
+    else:
+        result = clear_database()
+
+    print(result["message"])
+    if not result["success"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()